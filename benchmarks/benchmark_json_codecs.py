@@ -0,0 +1,102 @@
+##############################################################################
+#
+# Copyright (c) 2016, 2degrees Limited.
+# All Rights Reserved.
+#
+# This file is part of twapi-connection
+# <https://github.com/2degrees/twapi-connection>, which is subject to the
+# provisions of the BSD at
+# <http://dev.2degreesnetwork.com/p/2degrees-license.html>. A copy of the
+# license should accompany this distribution. THIS SOFTWARE IS PROVIDED "AS IS"
+# AND ANY AND ALL EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT
+# NOT LIMITED TO, THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST
+# INFRINGEMENT, AND FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""
+Compare the JSON codecs available on representative payloads of the API.
+
+Run with ``python benchmarks/benchmark_json_codecs.py``.
+
+"""
+
+from timeit import Timer
+from uuid import uuid4
+
+from twapi_connection.json_codecs import OrjsonCodec
+from twapi_connection.json_codecs import StandardJSONCodec
+from twapi_connection.json_codecs import orjson
+
+
+_REPETITION_COUNT = 5
+
+
+def main():
+    json_codecs = [StandardJSONCodec()]
+    if orjson is None:
+        print('orjson is not installed; only the standard codec is measured')
+    else:
+        json_codecs.append(OrjsonCodec())
+
+    payloads_by_name = {
+        'Bulk update of 1000 users': make_users(1000),
+        'Page of 100 group members': _make_paginated_group_members(100),
+        'Single user': _make_user(0),
+        }
+    for payload_name, payload in sorted(payloads_by_name.items()):
+        print(payload_name)
+        serialization = json_codecs[0].serialize(payload)
+        print('  {} bytes'.format(len(serialization)))
+        for json_codec in json_codecs:
+            serialization_time = _time(json_codec.serialize, payload)
+            deserialization_time = \
+                _time(json_codec.deserialize, serialization)
+            print(
+                '  {:<20} serialize: {:>9.1f} us  deserialize: {:>9.1f} us'
+                .format(
+                    json_codec.__class__.__name__,
+                    serialization_time * 10 ** 6,
+                    deserialization_time * 10 ** 6,
+                    ),
+                )
+
+
+def _time(function, argument):
+    timer = Timer(lambda: function(argument))
+    loop_count, _ = timer.autorange()
+    best_time = min(timer.repeat(_REPETITION_COUNT, loop_count))
+    return best_time / loop_count
+
+
+def make_users(user_count):
+    return [_make_user(user_index) for user_index in range(user_count)]
+
+
+def _make_paginated_group_members(member_count):
+    page = {
+        'count': member_count * 10,
+        'next': 'https://www.2degreesnetwork.com/api/groups/1/members/?page=2',
+        'results': make_users(member_count),
+        }
+    return page
+
+
+def _make_user(user_index):
+    user = {
+        'id': user_index,
+        'uuid': str(uuid4()),
+        'email_address': 'user{}@example.com'.format(user_index),
+        'first_name': 'Fïrst {}'.format(user_index),
+        'last_name': 'Last',
+        'organization_name': '2degrees',
+        'job_title': 'Sustainability Manager',
+        'is_active': True,
+        'score': user_index * 1.5,
+        'group_ids': list(range(user_index % 10)),
+        'address': {'city': 'Oxford', 'country_code': 'GB', 'postcode': None},
+        }
+    return user
+
+
+if __name__ == '__main__':
+    main()
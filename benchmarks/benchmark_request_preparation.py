@@ -0,0 +1,109 @@
+##############################################################################
+#
+# Copyright (c) 2016, 2degrees Limited.
+# All Rights Reserved.
+#
+# This file is part of twapi-connection
+# <https://github.com/2degrees/twapi-connection>, which is subject to the
+# provisions of the BSD at
+# <http://dev.2degreesnetwork.com/p/2degrees-license.html>. A copy of the
+# license should accompany this distribution. THIS SOFTWARE IS PROVIDED "AS IS"
+# AND ANY AND ALL EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT
+# NOT LIMITED TO, THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST
+# INFRINGEMENT, AND FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""
+Compare the per-call overhead of :meth:`requests.Session.request` with that
+of :class:`~twapi_connection.preparing.PreparedRequestFactory`.
+
+Requests are handled by an adapter which does no I/O, so only the work done
+by :mod:`requests` on each call is measured.
+
+Run with ``python benchmarks/benchmark_request_preparation.py``.
+
+"""
+
+from timeit import Timer
+
+from requests.adapters import BaseAdapter
+from requests.auth import HTTPBasicAuth
+from requests.models import Response
+from requests.sessions import Session
+
+from twapi_connection.preparing import PreparedRequestFactory
+
+
+_REPETITION_COUNT = 5
+
+_URL = 'https://www.2degreesnetwork.com/api/users/'
+
+_QUERY_STRING_ARGS = {'page': '2'}
+
+_AUTH = HTTPBasicAuth('username', 'password')
+
+
+def main():
+    for trust_env in (True, False):
+        print('trust_env={}'.format(trust_env))
+        session = _make_session(trust_env)
+        prepared_request_factory = PreparedRequestFactory(session, _AUTH)
+
+        def send_request():
+            session.request(
+                'GET',
+                _URL,
+                params=_QUERY_STRING_ARGS,
+                auth=_AUTH,
+                )
+
+        def send_prepared_request():
+            prepared_request, send_kwargs = \
+                prepared_request_factory.make_prepared_request(
+                    'GET',
+                    _URL,
+                    _QUERY_STRING_ARGS,
+                    )
+            session.send(prepared_request, **send_kwargs)
+
+        senders_by_name = (
+            ('Session.request', send_request),
+            ('PreparedRequestFactory', send_prepared_request),
+            )
+        for sender_name, sender in senders_by_name:
+            print('  {:<24} {:>7.1f} us'.format(
+                sender_name,
+                _time(sender) * 10 ** 6,
+                ))
+
+
+def _time(function):
+    timer = Timer(function)
+    loop_count, _ = timer.autorange()
+    best_time = min(timer.repeat(_REPETITION_COUNT, loop_count))
+    return best_time / loop_count
+
+
+def _make_session(trust_env):
+    session = Session()
+    session.trust_env = trust_env
+    session.mount('https://', _NullAdapter())
+    return session
+
+
+class _NullAdapter(BaseAdapter):
+
+    def send(self, request, **kwargs):
+        response = Response()
+        response.status_code = 200
+        response.request = request
+        response.url = request.url
+        response._content = b'{}'
+        return response
+
+    def close(self):
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+##############################################################################
+#
+# Copyright (c) 2016, 2degrees Limited.
+# All Rights Reserved.
+#
+# This file is part of twapi-connection
+# <https://github.com/2degrees/twapi-connection>, which is subject to the
+# provisions of the BSD at
+# <http://dev.2degreesnetwork.com/p/2degrees-license.html>. A copy of the
+# license should accompany this distribution. THIS SOFTWARE IS PROVIDED "AS IS"
+# AND ANY AND ALL EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT
+# NOT LIMITED TO, THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST
+# INFRINGEMENT, AND FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""
+Compare the decoding of JSON responses by :mod:`requests` with that of
+:class:`~twapi_connection.json_codecs.JSONResponse`.
+
+Run with ``python benchmarks/benchmark_response_decoding.py``.
+
+"""
+
+from timeit import Timer
+
+from requests.models import Response
+from requests.utils import get_encoding_from_headers
+
+from benchmark_json_codecs import make_users
+from twapi_connection.json_codecs import JSONResponse
+from twapi_connection.json_codecs import StandardJSONCodec
+from twapi_connection.json_codecs import get_default_json_codec
+
+
+_REPETITION_COUNT = 5
+
+_CONTENT_TYPES = (
+    'application/json',
+    'application/json; charset=utf-8',
+    )
+
+
+def main():
+    for user_count in (1, 100, 1000):
+        content = StandardJSONCodec().serialize(make_users(user_count))
+        print('{} users ({} bytes)'.format(user_count, len(content)))
+
+        for content_type in _CONTENT_TYPES:
+            print('  Content-Type: {}'.format(content_type))
+            response = _make_response(content, content_type)
+            decoders_by_name = (
+                ('requests', response.json),
+                (
+                    'JSONResponse (standard library)',
+                    _make_json_response(response, StandardJSONCodec()).json,
+                    ),
+                (
+                    'JSONResponse (default codec)',
+                    _make_json_response(response, get_default_json_codec())
+                    .json,
+                    ),
+                )
+            for decoder_name, decoder in decoders_by_name:
+                print('    {:<34} {:>9.1f} us'.format(
+                    decoder_name,
+                    _time(decoder) * 10 ** 6,
+                    ))
+
+
+def _time(function):
+    timer = Timer(function)
+    loop_count, _ = timer.autorange()
+    best_time = min(timer.repeat(_REPETITION_COUNT, loop_count))
+    return best_time / loop_count
+
+
+def _make_response(content, content_type):
+    response = Response()
+    response.status_code = 200
+    response.headers['Content-Type'] = content_type
+    response.encoding = get_encoding_from_headers(response.headers)
+    response._content = content
+    return response
+
+
+def _make_json_response(response, json_codec):
+    return JSONResponse.init_from_response(response, json_codec)
+
+
+if __name__ == '__main__':
+    main()
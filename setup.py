@@ -50,5 +50,10 @@ setup(
         'requests >= 2.7',
         'pyrecord >= 1.0a1',
         ],
+    extras_require={
+        'async': ['aiohttp >= 3.0'],
+        'brotli': ['brotli >= 1.0'],
+        'orjson': ['orjson >= 3.0'],
+        },
     test_suite='nose.collector',
     )
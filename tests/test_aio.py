@@ -0,0 +1,455 @@
+##############################################################################
+#
+# Copyright (c) 2016, 2degrees Limited.
+# All Rights Reserved.
+#
+# This file is part of twapi-connection
+# <https://github.com/2degrees/twapi-connection>, which is subject to the
+# provisions of the BSD at
+# <http://dev.2degreesnetwork.com/p/2degrees-license.html>. A copy of the
+# license should accompany this distribution. THIS SOFTWARE IS PROVIDED "AS IS"
+# AND ANY AND ALL EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT
+# NOT LIMITED TO, THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST
+# INFRINGEMENT, AND FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+
+from asyncio import Event
+from asyncio import ensure_future
+from asyncio import gather
+from asyncio import new_event_loop
+from asyncio import sleep as async_sleep
+from asyncio import wait_for
+from json import dumps as json_serialize
+from json import loads as json_deserialize
+from time import monotonic
+
+from aiohttp.web import Application
+from aiohttp.web import AppRunner
+from aiohttp.web import Response as WebResponse
+from aiohttp.web import TCPSite
+from nose.tools import assert_false
+from nose.tools import assert_in
+from nose.tools import assert_is_instance
+from nose.tools import assert_raises
+from nose.tools import eq_
+from nose.tools import ok_
+
+from tests.test_auth import _StubOAuthServer
+from tests.test_auth import _make_authentication_handler
+from tests.test_connection import _get_basic_auth
+from tests.utils import get_uuid4_str
+from twapi_connection.aio import AsyncConnection
+from twapi_connection.aio import AsyncResponse
+from twapi_connection.auth import BearerTokenAuth
+from twapi_connection.exc import AccessDeniedError
+from twapi_connection.exc import AuthenticationError
+from twapi_connection.exc import ClientError
+from twapi_connection.exc import NotFoundError
+from twapi_connection.exc import ServerError
+from twapi_connection.exc import UnsupportedResponseError
+from twapi_connection.rate_limiting import TokenBucketRateLimiter
+
+_STUB_URL_PATH = '/foo'
+
+_STUB_EMAIL_ADDRESS = 'foo@bar.com'
+
+_STUB_PASSWORD = get_uuid4_str()
+
+
+class TestAsyncConnection(object):
+
+    def test_get_request(self):
+        self._check_request_sender('GET', 'send_get_request', False)
+
+    def test_head_request(self):
+        self._check_request_sender('HEAD', 'send_head_request', False)
+
+    def test_post_request(self):
+        self._check_request_sender('POST', 'send_post_request', True)
+
+    def test_post_request_with_no_body(self):
+        self._check_request_sender('POST', 'send_post_request', False)
+
+    def test_put_request(self):
+        self._check_request_sender('PUT', 'send_put_request', True)
+
+    def test_delete_request(self):
+        self._check_request_sender('DELETE', 'send_delete_request', False)
+
+    @staticmethod
+    def _check_request_sender(
+        http_method_name,
+        request_sender_name,
+        include_request_body,
+        ):
+        body_deserialization = {'foo': 'bar'} if include_request_body else None
+
+        async def send_request(connection):
+            request_sender = getattr(connection, request_sender_name)
+            request_sender_kwargs = {}
+            if include_request_body:
+                request_sender_kwargs['body_deserialization'] = \
+                    body_deserialization
+            await request_sender(_STUB_URL_PATH, **request_sender_kwargs)
+
+        stub_server = _StubAPIServer()
+        _run_against_stub_server(stub_server, send_request)
+
+        eq_(1, len(stub_server.requests))
+
+        request = stub_server.requests[0]
+        eq_(http_method_name, request.method)
+        eq_(_STUB_URL_PATH, request.path)
+
+        if include_request_body:
+            eq_('application/json', request.headers['content-type'])
+            eq_(body_deserialization, request.json())
+        else:
+            assert_false(request.body)
+
+    def test_query_string_args(self):
+        async def send_request(connection):
+            await connection.send_get_request(
+                _STUB_URL_PATH,
+                {'foo': 'bar', 'baz': None, 'qux': [1, 2]},
+                )
+
+        stub_server = _StubAPIServer()
+        _run_against_stub_server(stub_server, send_request)
+
+        request = stub_server.requests[0]
+        eq_([('foo', 'bar'), ('qux', '1'), ('qux', '2')], request.query)
+
+    def test_absolute_api_url(self):
+        stub_server = _StubAPIServer()
+
+        async def send_request(connection):
+            await connection.send_get_request(
+                stub_server.api_url + _STUB_URL_PATH,
+                )
+
+        _run_against_stub_server(stub_server, send_request)
+
+        eq_(_STUB_URL_PATH, stub_server.requests[0].path)
+
+    def test_user_agent(self):
+        stub_server = _StubAPIServer()
+        _run_against_stub_server(stub_server, _send_get_request)
+
+        request = stub_server.requests[0]
+        assert_in('User-Agent', request.headers)
+
+        user_agent_header_value = request.headers['User-Agent']
+        ok_(user_agent_header_value.startswith('2degrees Python Client/'))
+
+    def test_json_response(self):
+        expected_body_deserialization = {'foo': 'bar'}
+        stub_server = _StubAPIServer(
+            body_deserialization=expected_body_deserialization,
+            )
+
+        response = _run_against_stub_server(stub_server, _send_get_request)
+
+        assert_is_instance(response, AsyncResponse)
+        eq_(200, response.status_code)
+        eq_(expected_body_deserialization, response.json())
+        eq_(expected_body_deserialization, response.body_deserialization)
+
+    def test_response_with_no_content(self):
+        stub_server = _StubAPIServer(status_code=204, body_deserialization=None)
+
+        response = _run_against_stub_server(stub_server, _send_get_request)
+
+        eq_(b'', response.content)
+
+    def test_unexpected_response_status_code(self):
+        stub_server = _StubAPIServer(status_code=304, body_deserialization=None)
+
+        with assert_raises(UnsupportedResponseError) as context_manager:
+            _run_against_stub_server(stub_server, _send_get_request)
+
+        exception = context_manager.exception
+        eq_('Unsupported response status 304', str(exception))
+
+    def test_unexpected_response_content_type(self):
+        stub_server = _StubAPIServer(content_type='text/plain')
+
+        with assert_raises(UnsupportedResponseError) as context_manager:
+            _run_against_stub_server(stub_server, _send_get_request)
+
+        exception = context_manager.exception
+        eq_('Unsupported response content type text/plain', str(exception))
+
+    def test_concurrent_requests(self):
+        request_count = 500
+
+        async def send_requests(connection):
+            responses = await gather(*[
+                connection.send_get_request(_STUB_URL_PATH, {'index': index})
+                for index in range(request_count)
+                ])
+            return [response.json()['query'] for response in responses]
+
+        # The server only responds once every request is in flight
+        stub_server = _StubAPIServer(concurrent_request_count=request_count)
+        response_queries = _run_against_stub_server(stub_server, send_requests)
+
+        expected_response_queries = \
+            [[['index', str(index)]] for index in range(request_count)]
+        eq_(expected_response_queries, response_queries)
+
+    def test_rate_limiter(self):
+        stub_server = _StubAPIServer()
+
+        async def send_requests(connection):
+            start_time = monotonic()
+            await gather(*[_send_get_request(connection) for _ in range(4)])
+            return monotonic() - start_time
+
+        elapsed_time = _run_against_stub_server(
+            stub_server,
+            send_requests,
+            rate_limiter=TokenBucketRateLimiter(20),
+            )
+
+        eq_(4, len(stub_server.requests))
+        ok_(0.15 <= elapsed_time)
+
+    def test_context_manager(self):
+        async def use_connection(api_url):
+            async with AsyncConnection(None, api_url=api_url) as connection:
+                await connection.send_get_request(_STUB_URL_PATH)
+            return connection
+
+        stub_server = _StubAPIServer()
+        connection = _run_with_stub_server(stub_server, use_connection)
+
+        eq_(None, connection._client_session)
+
+
+class TestErrorResponses(object):
+
+    def test_server_error_response(self):
+        stub_server = _StubAPIServer(status_code=500)
+
+        with assert_raises(ServerError) as context_manager:
+            _run_against_stub_server(stub_server, _send_get_request)
+
+        exception = context_manager.exception
+        eq_(500, exception.http_status_code)
+        eq_('500 Internal Server Error', str(exception))
+
+    def test_client_error_response(self):
+        self._assert_error_status_raises(400, ClientError)
+
+    def test_authentication_error_response(self):
+        self._assert_error_status_raises(401, AuthenticationError)
+
+    def test_forbidden_response(self):
+        self._assert_error_status_raises(403, AccessDeniedError)
+
+    def test_resource_not_found_response(self):
+        self._assert_error_status_raises(404, NotFoundError)
+
+    @staticmethod
+    def _assert_error_status_raises(status_code, exception_class):
+        stub_server = _StubAPIServer(status_code=status_code)
+        with assert_raises(exception_class):
+            _run_against_stub_server(stub_server, _send_get_request)
+
+
+class TestAuthentication(object):
+
+    def test_basic_authentication(self):
+        stub_server = _StubAPIServer()
+        _run_against_stub_server(
+            stub_server,
+            _send_get_request,
+            auth=(_STUB_EMAIL_ADDRESS, _STUB_PASSWORD),
+            )
+
+        request = stub_server.requests[0]
+        eq_(
+            _get_basic_auth(_STUB_EMAIL_ADDRESS, _STUB_PASSWORD),
+            request.headers['Authorization'],
+            )
+
+    def test_bearer_token_authentication(self):
+        token = get_uuid4_str()
+        stub_server = _StubAPIServer()
+        _run_against_stub_server(
+            stub_server,
+            _send_get_request,
+            auth=BearerTokenAuth(token),
+            )
+
+        request = stub_server.requests[0]
+        eq_('Bearer ' + token, request.headers['Authorization'])
+
+    def test_no_authentication(self):
+        stub_server = _StubAPIServer()
+        _run_against_stub_server(stub_server, _send_get_request, auth=None)
+
+        request = stub_server.requests[0]
+        assert_false('Authorization' in request.headers)
+
+    def test_client_credentials_authentication(self):
+        stub_server = _StubOAuthServer()
+
+        async def send_get_request(connection):
+            stub_server.hold_token_responses()
+            start_time = monotonic()
+            response_future = \
+                ensure_future(connection.send_get_request(_STUB_URL_PATH))
+            # The event loop keeps running while the token is fetched
+            while not stub_server.token_requests:
+                await async_sleep(0.01)
+            elapsed_time = monotonic() - start_time
+            stub_server.release_token_responses()
+            await response_future
+            return elapsed_time
+
+        async def run_with_connection():
+            authentication_handler = _make_authentication_handler(stub_server)
+            connection = AsyncConnection(
+                authentication_handler,
+                api_url=stub_server.api_url,
+                )
+            async with connection:
+                return await send_get_request(connection)
+
+        with stub_server:
+            event_loop = new_event_loop()
+            try:
+                elapsed_time = \
+                    event_loop.run_until_complete(run_with_connection())
+            finally:
+                event_loop.close()
+
+        ok_(elapsed_time < 1)
+        request = stub_server.api_requests[0]
+        eq_('Bearer token-1', request.headers['Authorization'])
+
+
+class _StubAPIServer(object):
+
+    def __init__(
+        self,
+        status_code=200,
+        body_deserialization='',
+        content_type='application/json',
+        concurrent_request_count=1,
+        ):
+        super(_StubAPIServer, self).__init__()
+
+        self._status_code = status_code
+        self._body_deserialization = body_deserialization
+        self._content_type = content_type
+        self._concurrent_request_count = concurrent_request_count
+
+        self.requests = []
+        self.api_url = None
+
+        self._runner = None
+        self._concurrent_requests_received = None
+
+    async def start(self):
+        self._concurrent_requests_received = Event()
+
+        application = Application()
+        application.router.add_route('*', '/{path:.*}', self._handle_request)
+        self._runner = AppRunner(application)
+        await self._runner.setup()
+        site = TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.api_url = 'http://127.0.0.1:{}'.format(port)
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+    async def _handle_request(self, web_request):
+        request_body = await web_request.text()
+        self.requests.append(
+            _StubRequest(
+                web_request.method,
+                web_request.path,
+                list(web_request.query.items()),
+                web_request.headers,
+                request_body,
+                ),
+            )
+
+        if self._concurrent_request_count <= len(self.requests):
+            self._concurrent_requests_received.set()
+        await wait_for(self._concurrent_requests_received.wait(), 10)
+
+        if self._body_deserialization == '':
+            body_deserialization = {'query': list(web_request.query.items())}
+        else:
+            body_deserialization = self._body_deserialization
+
+        if body_deserialization is None:
+            body = None
+        else:
+            body = json_serialize(body_deserialization)
+        web_response = WebResponse(
+            status=self._status_code,
+            body=body,
+            content_type=self._content_type if body is not None else None,
+            )
+        return web_response
+
+
+class _StubRequest(object):
+
+    def __init__(self, method, path, query, headers, body):
+        super(_StubRequest, self).__init__()
+
+        self.method = method
+        self.path = path
+        self.query = query
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        return json_deserialize(self.body)
+
+
+async def _send_get_request(connection):
+    return await connection.send_get_request(_STUB_URL_PATH)
+
+
+def _run_against_stub_server(
+    stub_server,
+    coroutine_function,
+    auth=(_STUB_EMAIL_ADDRESS, _STUB_PASSWORD),
+    **connection_kwargs
+    ):
+    async def run_with_connection(api_url):
+        connection = AsyncConnection(
+            auth,
+            api_url=api_url,
+            connection_limit=0,
+            **connection_kwargs
+            )
+        async with connection:
+            return await coroutine_function(connection)
+
+    return _run_with_stub_server(stub_server, run_with_connection)
+
+
+def _run_with_stub_server(stub_server, coroutine_function):
+    async def run():
+        await stub_server.start()
+        try:
+            return await coroutine_function(stub_server.api_url)
+        finally:
+            await stub_server.stop()
+
+    event_loop = new_event_loop()
+    try:
+        return event_loop.run_until_complete(run())
+    finally:
+        event_loop.close()
@@ -14,10 +14,49 @@
 #
 ##############################################################################
 
+from base64 import b64encode
+from contextlib import contextmanager
+from multiprocessing import get_context as get_multiprocessing_context
+from os import path
+from os import stat as get_file_status
+from shutil import rmtree
+from stat import S_IMODE
+from tempfile import mkdtemp
+from threading import Event
+from threading import Lock
+from threading import Thread
+from time import sleep
+from urllib.parse import parse_qsl
+
+from nose.tools import assert_false
 from nose.tools import assert_in, eq_
+from nose.tools import assert_is_none
+from nose.tools import assert_raises
+from nose.tools import ok_
+from requests.exceptions import Timeout as RequestsTimeout
 
 from tests.test_connection import MockRequest
+from tests.utils import StubAPIServer
+from tests.utils import StubResponse
+from tests.utils import make_json_response
+from twapi_connection import Connection
 from twapi_connection.auth import BearerTokenAuth
+from twapi_connection.auth import AccessToken
+from twapi_connection.auth import ClientCredentialsAuth
+from twapi_connection.auth import FileTokenCache
+from twapi_connection.auth import MemoryTokenCache
+from twapi_connection.exc import AuthenticationError
+from twapi_connection.exc import UnsupportedResponseError
+
+_STUB_CLIENT_ID = 'client-id'
+
+_STUB_CLIENT_SECRET = 'client-secret'
+
+_STUB_TOKEN_URL_PATH = '/token'
+
+_STUB_API_URL_PATH = '/foo'
+
+_SLOW_TOKEN_RESPONSE_TIMEOUT = 5
 
 
 def test_bearer_token_auth():
@@ -27,3 +66,484 @@ def test_bearer_token_auth():
     request_with_authentication = authentication_handler(request)
     assert_in('Authorization', request_with_authentication.headers)
     eq_('Bearer ' + token, request_with_authentication.headers['Authorization'])
+
+
+class TestClientCredentialsAuth(object):
+
+    def test_token_request(self):
+        stub_server = _StubOAuthServer()
+
+        with stub_server:
+            authentication_handler = \
+                _make_authentication_handler(stub_server, scope='read')
+            authentication_handler.get_access_token_value()
+
+        token_request = stub_server.token_requests[0]
+        eq_(
+            {'grant_type': 'client_credentials', 'scope': 'read'},
+            dict(parse_qsl(token_request.body.decode('utf-8'))),
+            )
+        expected_credentials = '{}:{}'.format(
+            _STUB_CLIENT_ID,
+            _STUB_CLIENT_SECRET,
+            )
+        eq_(
+            'Basic ' + b64encode(expected_credentials.encode()).decode(),
+            token_request.headers['Authorization'],
+            )
+
+    def test_api_request(self):
+        stub_server = _StubOAuthServer()
+
+        with stub_server:
+            connection = _make_connection(stub_server)
+            connection.send_get_request(_STUB_API_URL_PATH)
+
+        api_request = stub_server.api_requests[0]
+        eq_('Bearer token-1', api_request.headers['Authorization'])
+
+    def test_token_cached(self):
+        stub_server = _StubOAuthServer()
+
+        with stub_server:
+            connection = _make_connection(stub_server)
+            for _ in range(2):
+                connection.send_get_request(_STUB_API_URL_PATH)
+
+        eq_(1, len(stub_server.token_requests))
+        eq_(2, len(stub_server.api_requests))
+
+    def test_token_without_expiry(self):
+        stub_server = _StubOAuthServer(expires_in=None)
+
+        with stub_server:
+            authentication_handler = _make_authentication_handler(stub_server)
+            for _ in range(2):
+                access_token_value = \
+                    authentication_handler.get_access_token_value()
+
+        eq_('token-1', access_token_value)
+
+    def test_expired_token(self):
+        stub_server = _StubOAuthServer(expires_in=0)
+
+        with stub_server:
+            authentication_handler = _make_authentication_handler(stub_server)
+            authentication_handler.get_access_token_value()
+            access_token_value = \
+                authentication_handler.get_access_token_value()
+
+        eq_('token-2', access_token_value)
+
+    def test_proactive_refresh(self):
+        stub_server = _StubOAuthServer(expires_in=100)
+
+        with stub_server:
+            authentication_handler = _make_authentication_handler(
+                stub_server,
+                refresh_margin=100,
+                )
+            authentication_handler.get_access_token_value()
+            access_token_value = \
+                authentication_handler.get_access_token_value()
+
+        eq_('token-2', access_token_value)
+
+    def test_valid_token_used_during_refresh(self):
+        stub_server = _StubOAuthServer(expires_in=100)
+
+        with stub_server:
+            authentication_handler = _make_authentication_handler(
+                stub_server,
+                refresh_margin=100,
+                )
+            authentication_handler.get_access_token_value()
+
+            stub_server.hold_token_responses()
+            refresh_thread = \
+                Thread(target=authentication_handler.get_access_token_value)
+            refresh_thread.start()
+            stub_server.wait_for_token_request_count(2)
+
+            access_token_value = \
+                authentication_handler.get_access_token_value()
+
+            stub_server.release_token_responses()
+            refresh_thread.join()
+
+        eq_('token-1', access_token_value)
+
+    def test_concurrent_refreshes(self):
+        stub_server = _StubOAuthServer()
+        access_token_values = []
+
+        with stub_server:
+            authentication_handler = _make_authentication_handler(stub_server)
+
+            def get_access_token_value():
+                access_token_value = \
+                    authentication_handler.get_access_token_value()
+                access_token_values.append(access_token_value)
+
+            stub_server.hold_token_responses()
+            threads = [
+                Thread(target=get_access_token_value) for _ in range(50)
+                ]
+            for thread in threads:
+                thread.start()
+            stub_server.wait_for_token_request_count(1)
+            stub_server.release_token_responses()
+            for thread in threads:
+                thread.join()
+
+        eq_(1, len(stub_server.token_requests))
+        eq_(['token-1'] * 50, access_token_values)
+
+    def test_refresh_in_progress_in_parent_process(self):
+        stub_server = _StubOAuthServer()
+        token_cache = MemoryTokenCache()
+
+        with stub_server:
+            authentication_handler = _make_authentication_handler(
+                stub_server,
+                token_cache=token_cache,
+                )
+            # As if another thread were refreshing the token when forking
+            token_cache.acquire_refresh_lock()
+            try:
+                multiprocessing_context = get_multiprocessing_context('fork')
+                process = multiprocessing_context.Process(
+                    target=authentication_handler.get_access_token_value,
+                    )
+                process.start()
+                process.join(_SLOW_TOKEN_RESPONSE_TIMEOUT)
+                if process.is_alive():
+                    process.terminate()
+                    process.join()
+            finally:
+                token_cache.release_refresh_lock()
+
+        eq_(0, process.exitcode)
+        eq_(1, len(stub_server.token_requests))
+
+    def test_connection_timeout(self):
+        stub_server = _StubOAuthServer()
+
+        with stub_server:
+            stub_server.hold_token_responses()
+            connection = Connection(
+                _make_authentication_handler(stub_server),
+                timeout=0.1,
+                api_url=stub_server.api_url,
+                )
+            try:
+                with assert_raises(RequestsTimeout):
+                    connection.send_get_request(_STUB_API_URL_PATH)
+            finally:
+                stub_server.release_token_responses()
+
+        eq_(0, len(stub_server.api_requests))
+
+    def test_unauthorized_request_retried(self):
+        stub_server = _StubOAuthServer(revoked_access_token_values={'token-1'})
+
+        with stub_server:
+            connection = _make_connection(stub_server)
+            response = connection.send_post_request(
+                _STUB_API_URL_PATH,
+                {'foo': 'bar'},
+                )
+
+        eq_(200, response.status_code)
+        eq_(2, len(stub_server.token_requests))
+        eq_(2, len(stub_server.api_requests))
+        retried_api_request = stub_server.api_requests[1]
+        eq_('Bearer token-2', retried_api_request.headers['Authorization'])
+        eq_({'foo': 'bar'}, retried_api_request.json())
+
+    def test_unauthorized_request_retried_once(self):
+        stub_server = _StubOAuthServer(
+            revoked_access_token_values={'token-1', 'token-2'},
+            )
+
+        with stub_server:
+            connection = _make_connection(stub_server)
+            with assert_raises(AuthenticationError):
+                connection.send_get_request(_STUB_API_URL_PATH)
+
+        eq_(2, len(stub_server.api_requests))
+
+    def test_rejected_client_credentials(self):
+        stub_server = _StubOAuthServer(token_response_status_code=401)
+
+        with stub_server:
+            authentication_handler = _make_authentication_handler(stub_server)
+            with assert_raises(AuthenticationError):
+                authentication_handler.get_access_token_value()
+
+    def test_invalid_token_response(self):
+        stub_server = _StubOAuthServer(token_response_status_code=204)
+
+        with stub_server:
+            authentication_handler = _make_authentication_handler(stub_server)
+            with assert_raises(UnsupportedResponseError):
+                authentication_handler.get_access_token_value()
+
+
+class TestFileTokenCache(object):
+
+    def test_missing_token(self):
+        with _make_temporary_token_file_path() as token_file_path:
+            token_cache = FileTokenCache(token_file_path)
+
+            assert_is_none(token_cache.get_access_token())
+
+    def test_token_shared_between_instances(self):
+        access_token = AccessToken('token', 1234.5)
+
+        with _make_temporary_token_file_path() as token_file_path:
+            FileTokenCache(token_file_path).set_access_token(access_token)
+            cached_access_token = \
+                FileTokenCache(token_file_path).get_access_token()
+
+        eq_(access_token, cached_access_token)
+
+    def test_token_replaced(self):
+        with _make_temporary_token_file_path() as token_file_path:
+            token_cache = FileTokenCache(token_file_path)
+            token_cache.set_access_token(AccessToken('token-1', None))
+            token_cache.get_access_token()
+
+            FileTokenCache(token_file_path).set_access_token(
+                AccessToken('token-2', None),
+                )
+
+            eq_('token-2', token_cache.get_access_token().value)
+
+    def test_token_deleted(self):
+        with _make_temporary_token_file_path() as token_file_path:
+            token_cache = FileTokenCache(token_file_path)
+            token_cache.set_access_token(AccessToken('token', None))
+            token_cache.delete_access_token()
+            token_cache.delete_access_token()
+
+            assert_is_none(token_cache.get_access_token())
+
+    def test_corrupt_token(self):
+        with _make_temporary_token_file_path() as token_file_path:
+            with open(token_file_path, 'w') as token_file:
+                token_file.write('{"value": ')
+
+            assert_is_none(FileTokenCache(token_file_path).get_access_token())
+
+    def test_file_only_readable_by_owner(self):
+        with _make_temporary_token_file_path() as token_file_path:
+            token_cache = FileTokenCache(token_file_path)
+            token_cache.set_access_token(AccessToken('token', None))
+            token_cache.acquire_refresh_lock()
+            token_cache.release_refresh_lock()
+
+            eq_(0o600, S_IMODE(get_file_status(token_file_path).st_mode))
+            eq_(
+                0o600,
+                S_IMODE(get_file_status(token_file_path + '.lock').st_mode),
+                )
+
+    def test_refresh_lock_shared_between_instances(self):
+        with _make_temporary_token_file_path() as token_file_path:
+            token_cache = FileTokenCache(token_file_path)
+            other_token_cache = FileTokenCache(token_file_path)
+
+            token_cache.acquire_refresh_lock()
+            assert_false(other_token_cache.acquire_refresh_lock(False))
+            token_cache.release_refresh_lock()
+
+            ok_(other_token_cache.acquire_refresh_lock(False))
+            other_token_cache.release_refresh_lock()
+
+    def test_refresh_lock_shared_between_threads(self):
+        lock_acquisitions = []
+
+        with _make_temporary_token_file_path() as token_file_path:
+            token_cache = FileTokenCache(token_file_path)
+
+            def acquire_refresh_lock():
+                is_lock_acquired = token_cache.acquire_refresh_lock(False)
+                lock_acquisitions.append(is_lock_acquired)
+
+            token_cache.acquire_refresh_lock()
+            thread = Thread(target=acquire_refresh_lock)
+            thread.start()
+            thread.join()
+            token_cache.release_refresh_lock()
+
+        eq_([False], lock_acquisitions)
+
+    def test_authentication_handlers_sharing_token(self):
+        stub_server = _StubOAuthServer()
+
+        with stub_server, \
+                _make_temporary_token_file_path() as token_file_path:
+            access_token_values = []
+            for _ in range(2):
+                authentication_handler = _make_authentication_handler(
+                    stub_server,
+                    token_cache=FileTokenCache(token_file_path),
+                    )
+                access_token_value = \
+                    authentication_handler.get_access_token_value()
+                access_token_values.append(access_token_value)
+
+        eq_(1, len(stub_server.token_requests))
+        eq_(['token-1', 'token-1'], access_token_values)
+
+    def test_unauthorized_token_invalidated(self):
+        stub_server = _StubOAuthServer(revoked_access_token_values={'token-1'})
+
+        with stub_server, \
+                _make_temporary_token_file_path() as token_file_path:
+            for _ in range(2):
+                authentication_handler = _make_authentication_handler(
+                    stub_server,
+                    token_cache=FileTokenCache(token_file_path),
+                    )
+                connection = Connection(
+                    authentication_handler,
+                    api_url=stub_server.api_url,
+                    )
+                connection.send_get_request(_STUB_API_URL_PATH)
+
+        eq_(2, len(stub_server.token_requests))
+        eq_(3, len(stub_server.api_requests))
+
+    def test_concurrent_processes(self):
+        stub_server = _StubOAuthServer()
+        process_count = 8
+
+        with stub_server, \
+                _make_temporary_token_file_path() as token_file_path:
+            stub_server.hold_token_responses()
+            multiprocessing_context = get_multiprocessing_context('fork')
+            processes = [
+                multiprocessing_context.Process(
+                    target=_get_shared_access_token_value,
+                    args=(stub_server, token_file_path),
+                    )
+                for _ in range(process_count)
+                ]
+            for process in processes:
+                process.start()
+            stub_server.wait_for_token_request_count(1)
+            stub_server.release_token_responses()
+            for process in processes:
+                process.join()
+
+            cached_access_token = \
+                FileTokenCache(token_file_path).get_access_token()
+
+        eq_([0] * process_count, [p.exitcode for p in processes])
+        eq_(1, len(stub_server.token_requests))
+        eq_('token-1', cached_access_token.value)
+
+
+def _get_shared_access_token_value(stub_server, token_file_path):
+    authentication_handler = _make_authentication_handler(
+        stub_server,
+        token_cache=FileTokenCache(token_file_path),
+        )
+    authentication_handler.get_access_token_value()
+
+
+@contextmanager
+def _make_temporary_token_file_path():
+    temporary_directory_path = mkdtemp()
+    try:
+        yield path.join(temporary_directory_path, 'token.json')
+    finally:
+        rmtree(temporary_directory_path)
+
+
+def _make_connection(stub_server):
+    authentication_handler = _make_authentication_handler(stub_server)
+    return Connection(authentication_handler, api_url=stub_server.api_url)
+
+
+def _make_authentication_handler(stub_server, **kwargs):
+    return ClientCredentialsAuth(
+        stub_server.api_url + _STUB_TOKEN_URL_PATH,
+        _STUB_CLIENT_ID,
+        _STUB_CLIENT_SECRET,
+        **kwargs
+        )
+
+
+class _StubOAuthServer(StubAPIServer):
+    """
+    Stub API server with a token endpoint issuing the tokens ``token-1``,
+    ``token-2``, etc.
+
+    """
+
+    def __init__(
+        self,
+        expires_in=3600,
+        revoked_access_token_values=(),
+        token_response_status_code=200,
+        ):
+        super(_StubOAuthServer, self).__init__(self._make_response)
+
+        self._expires_in = expires_in
+        self._revoked_access_token_values = revoked_access_token_values
+        self._token_response_status_code = token_response_status_code
+
+        self._lock = Lock()
+        self.token_requests = []
+        self.api_requests = []
+        self._token_responses_released = Event()
+        self._token_responses_released.set()
+
+    def hold_token_responses(self):
+        self._token_responses_released.clear()
+
+    def release_token_responses(self):
+        self._token_responses_released.set()
+
+    def wait_for_token_request_count(self, token_request_count):
+        while len(self.token_requests) < token_request_count:
+            sleep(0.01)
+
+    def _make_response(self, request):
+        if request.path == _STUB_TOKEN_URL_PATH:
+            response = self._make_token_response(request)
+        else:
+            response = self._make_api_response(request)
+        return response
+
+    def _make_token_response(self, request):
+        with self._lock:
+            self.token_requests.append(request)
+            token_request_count = len(self.token_requests)
+        self._token_responses_released.wait(_SLOW_TOKEN_RESPONSE_TIMEOUT)
+
+        if self._token_response_status_code != 200:
+            return StubResponse(self._token_response_status_code)
+
+        token_response_body = {
+            'access_token': 'token-{}'.format(token_request_count),
+            'token_type': 'Bearer',
+            }
+        if self._expires_in is not None:
+            token_response_body['expires_in'] = self._expires_in
+        return make_json_response(token_response_body)
+
+    def _make_api_response(self, request):
+        with self._lock:
+            self.api_requests.append(request)
+
+        authorization_header_value = request.headers['Authorization']
+        access_token_value = authorization_header_value.split(' ')[1]
+        if access_token_value in self._revoked_access_token_values:
+            response = StubResponse(401)
+        else:
+            response = make_json_response({})
+        return response
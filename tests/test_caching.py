@@ -0,0 +1,405 @@
+##############################################################################
+#
+# Copyright (c) 2016, 2degrees Limited.
+# All Rights Reserved.
+#
+# This file is part of twapi-connection
+# <https://github.com/2degrees/twapi-connection>, which is subject to the
+# provisions of the BSD at
+# <http://dev.2degreesnetwork.com/p/2degrees-license.html>. A copy of the
+# license should accompany this distribution. THIS SOFTWARE IS PROVIDED "AS IS"
+# AND ANY AND ALL EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT
+# NOT LIMITED TO, THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST
+# INFRINGEMENT, AND FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+
+from contextlib import contextmanager
+from multiprocessing import get_context as get_multiprocessing_context
+from os import path
+from shutil import rmtree
+from sqlite3 import connect as sqlite_connect
+from tempfile import mkdtemp
+
+from nose.tools import assert_false
+from nose.tools import assert_is_none
+from nose.tools import eq_
+from nose.tools import ok_
+from requests.models import Response
+
+from tests.utils import StubAPIServer
+from tests.utils import StubResponse
+from tests.utils import make_json_response
+from twapi_connection import Connection
+from twapi_connection.auth import BearerTokenAuth
+from twapi_connection.caching import CacheStatistics
+from twapi_connection.caching import MemoryResponseCache
+from twapi_connection.caching import SQLiteResponseCache
+
+_STUB_URL_PATH = '/foo'
+
+_STUB_ETAG = '"abc"'
+
+_STUB_LAST_MODIFIED = 'Sat, 01 Oct 2016 10:00:00 GMT'
+
+
+class TestCachingConnection(object):
+
+    def test_fresh_response(self):
+        response_cache = MemoryResponseCache(ttl=60)
+        with _RevalidatingServer() as stub_server:
+            connection = _make_connection(stub_server, response_cache)
+            first_response = connection.send_get_request(_STUB_URL_PATH)
+            second_response = connection.send_get_request(_STUB_URL_PATH)
+
+        eq_(1, len(stub_server.requests))
+        eq_(first_response.json(), second_response.json())
+        eq_(200, second_response.status_code)
+        eq_(CacheStatistics(1, 1, 0), response_cache.get_statistics())
+
+    def test_query_string_args_canonicalization(self):
+        response_cache = MemoryResponseCache(ttl=60)
+        with _RevalidatingServer() as stub_server:
+            connection = _make_connection(stub_server, response_cache)
+            connection.send_get_request(
+                _STUB_URL_PATH,
+                {'a': 1, 'b': [2, 3], 'c': None},
+                )
+            connection.send_get_request(
+                _STUB_URL_PATH,
+                {'b': ['2', '3'], 'a': '1'},
+                )
+            connection.send_get_request(_STUB_URL_PATH, {'a': '2'})
+
+        eq_(2, len(stub_server.requests))
+
+    def test_revalidation_with_etag(self):
+        response_cache = MemoryResponseCache(ttl=0)
+        with _RevalidatingServer({'ETag': _STUB_ETAG}) as stub_server:
+            connection = _make_connection(stub_server, response_cache)
+            first_response = connection.send_get_request(_STUB_URL_PATH)
+            second_response = connection.send_get_request(_STUB_URL_PATH)
+
+        first_request, second_request = stub_server.requests
+        assert_false('If-None-Match' in first_request.headers)
+        eq_(_STUB_ETAG, second_request.headers['If-None-Match'])
+
+        eq_(200, second_response.status_code)
+        eq_(first_response.json(), second_response.json())
+        eq_(CacheStatistics(0, 1, 1), response_cache.get_statistics())
+
+    def test_revalidation_with_last_modified(self):
+        response_cache = MemoryResponseCache(ttl=0)
+        response_headers = {'Last-Modified': _STUB_LAST_MODIFIED}
+        with _RevalidatingServer(response_headers) as stub_server:
+            connection = _make_connection(stub_server, response_cache)
+            first_response = connection.send_get_request(_STUB_URL_PATH)
+            second_response = connection.send_get_request(_STUB_URL_PATH)
+
+        second_request = stub_server.requests[1]
+        eq_(_STUB_LAST_MODIFIED, second_request.headers['If-Modified-Since'])
+        eq_(first_response.json(), second_response.json())
+        eq_(CacheStatistics(0, 1, 1), response_cache.get_statistics())
+
+    def test_modified_response(self):
+        response_cache = MemoryResponseCache(ttl=0)
+        with _RevalidatingServer({'ETag': _STUB_ETAG}) as stub_server:
+            connection = _make_connection(stub_server, response_cache)
+            connection.send_get_request(_STUB_URL_PATH)
+            stub_server.etag = '"def"'
+            connection.send_get_request(_STUB_URL_PATH)
+            connection.send_get_request(_STUB_URL_PATH)
+
+        eq_('"def"', stub_server.requests[2].headers['If-None-Match'])
+        eq_(CacheStatistics(0, 2, 1), response_cache.get_statistics())
+
+    def test_stale_response_without_validators(self):
+        response_cache = MemoryResponseCache(ttl=0)
+        with _RevalidatingServer() as stub_server:
+            connection = _make_connection(stub_server, response_cache)
+            connection.send_get_request(_STUB_URL_PATH)
+            connection.send_get_request(_STUB_URL_PATH)
+
+        for request in stub_server.requests:
+            assert_false('If-None-Match' in request.headers)
+            assert_false('If-Modified-Since' in request.headers)
+        eq_(CacheStatistics(0, 2, 0), response_cache.get_statistics())
+
+    def test_uncacheable_response(self):
+        response_cache = MemoryResponseCache(ttl=60)
+        response_headers = {'Cache-Control': 'no-store'}
+        with _RevalidatingServer(response_headers) as stub_server:
+            connection = _make_connection(stub_server, response_cache)
+            connection.send_get_request(_STUB_URL_PATH)
+            connection.send_get_request(_STUB_URL_PATH)
+
+        eq_(2, len(stub_server.requests))
+
+    def test_non_get_requests(self):
+        response_cache = MemoryResponseCache(ttl=60)
+        with _RevalidatingServer() as stub_server:
+            connection = _make_connection(stub_server, response_cache)
+            connection.send_head_request(_STUB_URL_PATH)
+            connection.send_head_request(_STUB_URL_PATH)
+            connection.send_post_request(_STUB_URL_PATH)
+            connection.send_post_request(_STUB_URL_PATH)
+
+        eq_(4, len(stub_server.requests))
+        eq_(CacheStatistics(0, 0, 0), response_cache.get_statistics())
+
+    def test_same_credentials(self):
+        response_cache = MemoryResponseCache(ttl=60)
+        with _RevalidatingServer() as stub_server:
+            for _ in range(2):
+                connection = _make_connection(
+                    stub_server,
+                    response_cache,
+                    BearerTokenAuth('token'),
+                    )
+                connection.send_get_request(_STUB_URL_PATH)
+
+        eq_(1, len(stub_server.requests))
+
+    def test_different_credentials(self):
+        response_cache = MemoryResponseCache(ttl=60)
+        with _RevalidatingServer() as stub_server:
+            for authentication_handler in ('user', 'a'), ('user', 'b'), None:
+                connection = _make_connection(
+                    stub_server,
+                    response_cache,
+                    authentication_handler,
+                    )
+                connection.send_get_request(_STUB_URL_PATH)
+
+        eq_(3, len(stub_server.requests))
+        eq_(CacheStatistics(0, 3, 0), response_cache.get_statistics())
+
+    def test_unknown_credentials(self):
+        response_cache = MemoryResponseCache(ttl=60)
+        with _RevalidatingServer() as stub_server:
+            connections = [
+                _make_connection(stub_server, response_cache, _custom_auth)
+                for _ in range(2)
+                ]
+            for connection in connections + connections:
+                connection.send_get_request(_STUB_URL_PATH)
+
+        eq_(2, len(stub_server.requests))
+
+
+class TestMemoryResponseCache(object):
+
+    def test_least_recently_used_eviction(self):
+        response_cache = MemoryResponseCache(max_size=10)
+        response_cache.set_entry('a', _make_response(b'1234'))
+        response_cache.set_entry('b', _make_response(b'1234'))
+        response_cache.get_entry('a')
+        response_cache.set_entry('c', _make_response(b'1234'))
+
+        ok_(response_cache.get_entry('a'))
+        assert_is_none(response_cache.get_entry('b'))
+        ok_(response_cache.get_entry('c'))
+
+    def test_entry_replacement(self):
+        response_cache = MemoryResponseCache(max_size=10)
+        response_cache.set_entry('a', _make_response(b'12345678'))
+        response_cache.set_entry('a', _make_response(b'12345678'))
+
+        eq_(b'12345678', response_cache.get_entry('a').content)
+
+    def test_oversized_response(self):
+        response_cache = MemoryResponseCache(max_size=10)
+        response_cache.set_entry('a', _make_response(b'12345678901'))
+
+        assert_is_none(response_cache.get_entry('a'))
+
+
+class TestSQLiteResponseCache(object):
+
+    def test_entry_persistence(self):
+        with _make_temporary_database_path() as database_path:
+            response = _make_response(b'{"foo": "bar"}')
+            response.headers['ETag'] = _STUB_ETAG
+            SQLiteResponseCache(database_path).set_entry('a', response)
+
+            cache_entry = SQLiteResponseCache(database_path).get_entry('a')
+
+            eq_(200, cache_entry.status_code)
+            eq_('OK', cache_entry.reason)
+            eq_(_STUB_ETAG, cache_entry.headers['etag'])
+            eq_(b'{"foo": "bar"}', cache_entry.content)
+            eq_(response.url, cache_entry.url)
+
+    def test_missing_entry(self):
+        with _make_temporary_database_path() as database_path:
+            response_cache = SQLiteResponseCache(database_path)
+
+            assert_is_none(response_cache.get_entry('a'))
+
+    def test_warm_cache(self):
+        """Responses cached by one connection are reused by another one."""
+        with _make_temporary_database_path() as database_path:
+            with _RevalidatingServer() as stub_server:
+                for _ in range(2):
+                    response_cache = SQLiteResponseCache(database_path)
+                    connection = _make_connection(stub_server, response_cache)
+                    response = connection.send_get_request(_STUB_URL_PATH)
+
+            eq_(1, len(stub_server.requests))
+            eq_({'response_number': 1}, response.json())
+            eq_(CacheStatistics(1, 0, 0), response_cache.get_statistics())
+
+    def test_revalidation(self):
+        with _make_temporary_database_path() as database_path:
+            response_cache = SQLiteResponseCache(database_path, ttl=0)
+            with _RevalidatingServer({'ETag': _STUB_ETAG}) as stub_server:
+                connection = _make_connection(stub_server, response_cache)
+                connection.send_get_request(_STUB_URL_PATH)
+                response = connection.send_get_request(_STUB_URL_PATH)
+
+            eq_({'response_number': 1}, response.json())
+            eq_(CacheStatistics(0, 1, 1), response_cache.get_statistics())
+
+    def test_least_recently_used_eviction(self):
+        with _make_temporary_database_path() as database_path:
+            response_cache = SQLiteResponseCache(database_path, max_size=10)
+            response_cache.set_entry('a', _make_response(b'1234'))
+            response_cache.set_entry('b', _make_response(b'1234'))
+            response_cache.set_entry('c', _make_response(b'1234'))
+
+            assert_is_none(response_cache.get_entry('a'))
+            ok_(response_cache.get_entry('b'))
+            ok_(response_cache.get_entry('c'))
+
+    def test_replaced_entry_size(self):
+        with _make_temporary_database_path() as database_path:
+            response_cache = SQLiteResponseCache(database_path, max_size=10)
+            for _ in range(3):
+                response_cache.set_entry('a', _make_response(b'1234'))
+            response_cache.set_entry('b', _make_response(b'1234'))
+
+            ok_(response_cache.get_entry('a'))
+            ok_(response_cache.get_entry('b'))
+
+    def test_database_without_cache_size(self):
+        """The size of the entries stored previously is taken into account."""
+        with _make_temporary_database_path() as database_path:
+            SQLiteResponseCache(database_path).set_entry(
+                'a',
+                _make_response(b'1234'),
+                )
+            database_connection = sqlite_connect(database_path)
+            database_connection.execute('DROP TABLE response_cache_size')
+            database_connection.commit()
+            database_connection.close()
+
+            response_cache = SQLiteResponseCache(database_path, max_size=10)
+            response_cache.set_entry('b', _make_response(b'1234'))
+            response_cache.set_entry('c', _make_response(b'1234'))
+
+            assert_is_none(response_cache.get_entry('a'))
+            ok_(response_cache.get_entry('b'))
+            ok_(response_cache.get_entry('c'))
+
+    def test_oversized_response(self):
+        with _make_temporary_database_path() as database_path:
+            response_cache = SQLiteResponseCache(database_path, max_size=10)
+            response_cache.set_entry('a', _make_response(b'12345678901'))
+
+            assert_is_none(response_cache.get_entry('a'))
+
+    def test_concurrent_processes(self):
+        with _make_temporary_database_path() as database_path:
+            max_size = 100
+            process_count = 4
+            multiprocessing_context = get_multiprocessing_context('fork')
+            processes = [
+                multiprocessing_context.Process(
+                    target=_fill_sqlite_response_cache,
+                    args=(database_path, max_size, str(process_index)),
+                    )
+                for process_index in range(process_count)
+                ]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+
+            eq_([0] * process_count, [p.exitcode for p in processes])
+
+            response_cache = SQLiteResponseCache(database_path, max_size)
+            cache_keys = [
+                '{}-{}'.format(process_index, entry_index)
+                for process_index in range(process_count)
+                for entry_index in range(50)
+                ]
+            cache_entries = [response_cache.get_entry(k) for k in cache_keys]
+            cache_size = sum(len(e.content) for e in cache_entries if e)
+            ok_(0 < cache_size <= max_size)
+
+
+class _RevalidatingServer(StubAPIServer):
+
+    def __init__(self, response_headers=None):
+        super(_RevalidatingServer, self).__init__(self._make_response)
+
+        self._response_headers = dict(response_headers or {})
+        self.etag = self._response_headers.get('ETag')
+        self._response_count = 0
+
+    def _make_response(self, request):
+        if self.etag and request.headers.get('If-None-Match') == self.etag:
+            return StubResponse(304)
+        if 'If-Modified-Since' in request.headers and \
+                request.headers['If-Modified-Since'] == \
+                self._response_headers.get('Last-Modified'):
+            return StubResponse(304)
+
+        self._response_count += 1
+        response_headers = dict(self._response_headers)
+        if self.etag:
+            response_headers['ETag'] = self.etag
+        response = make_json_response(
+            {'response_number': self._response_count},
+            headers=response_headers,
+            )
+        return response
+
+
+def _make_connection(stub_server, response_cache, auth=None):
+    connection = Connection(
+        auth,
+        api_url=stub_server.api_url,
+        response_cache=response_cache,
+        )
+    return connection
+
+
+def _custom_auth(request):
+    request.headers['Authorization'] = 'Custom'
+    return request
+
+
+@contextmanager
+def _make_temporary_database_path():
+    temporary_directory_path = mkdtemp()
+    try:
+        yield path.join(temporary_directory_path, 'cache.sqlite')
+    finally:
+        rmtree(temporary_directory_path)
+
+
+def _fill_sqlite_response_cache(database_path, max_size, cache_key_prefix):
+    response_cache = SQLiteResponseCache(database_path, max_size=max_size)
+    for entry_index in range(50):
+        cache_key = '{}-{}'.format(cache_key_prefix, entry_index)
+        response_cache.set_entry(cache_key, _make_response(b'1234567890'))
+
+
+def _make_response(content):
+    response = Response()
+    response.status_code = 200
+    response.reason = 'OK'
+    response.url = 'http://example.com/'
+    response._content = content
+    return response
@@ -0,0 +1,276 @@
+##############################################################################
+#
+# Copyright (c) 2016, 2degrees Limited.
+# All Rights Reserved.
+#
+# This file is part of twapi-connection
+# <https://github.com/2degrees/twapi-connection>, which is subject to the
+# provisions of the BSD at
+# <http://dev.2degreesnetwork.com/p/2degrees-license.html>. A copy of the
+# license should accompany this distribution. THIS SOFTWARE IS PROVIDED "AS IS"
+# AND ANY AND ALL EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT
+# NOT LIMITED TO, THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST
+# INFRINGEMENT, AND FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+
+from time import sleep
+
+from nose.tools import assert_raises
+from nose.tools import eq_
+from requests.exceptions import ConnectionError
+
+from tests.utils import StubAPIServer
+from tests.utils import StubResponse
+from tests.utils import make_echo_response
+from twapi_connection import Connection
+from twapi_connection.circuit_breaking import CLOSED_CIRCUIT_STATE
+from twapi_connection.circuit_breaking import CircuitBreaker
+from twapi_connection.circuit_breaking import HALF_OPEN_CIRCUIT_STATE
+from twapi_connection.circuit_breaking import OPEN_CIRCUIT_STATE
+from twapi_connection.exc import CircuitOpenError
+from twapi_connection.exc import DeadlineExceededError
+from twapi_connection.exc import NotFoundError
+from twapi_connection.exc import ServerError
+
+_STUB_URL = 'https://example.com/api/foo'
+
+_STUB_URL_PATH = '/foo'
+
+_RECOVERY_TIMEOUT = 0.05
+
+
+class TestCircuitBreaker(object):
+
+    def test_initial_state(self):
+        circuit_breaker = CircuitBreaker()
+
+        eq_(CLOSED_CIRCUIT_STATE, circuit_breaker.get_state(_STUB_URL))
+        circuit_breaker.require_request_permission(_STUB_URL)
+
+    def test_failures_below_threshold(self):
+        circuit_breaker = CircuitBreaker(failure_threshold=2)
+
+        circuit_breaker.record_failure(_STUB_URL)
+
+        eq_(CLOSED_CIRCUIT_STATE, circuit_breaker.get_state(_STUB_URL))
+
+    def test_failures_reaching_threshold(self):
+        circuit_breaker = CircuitBreaker(failure_threshold=2)
+
+        _record_failures(circuit_breaker, 2)
+
+        eq_(OPEN_CIRCUIT_STATE, circuit_breaker.get_state(_STUB_URL))
+        with assert_raises(CircuitOpenError) as context_manager:
+            circuit_breaker.require_request_permission(_STUB_URL)
+        eq_('https://example.com', context_manager.exception.circuit_key)
+
+    def test_non_consecutive_failures(self):
+        circuit_breaker = CircuitBreaker(failure_threshold=2)
+
+        circuit_breaker.record_failure(_STUB_URL)
+        circuit_breaker.record_success(_STUB_URL)
+        circuit_breaker.record_failure(_STUB_URL)
+
+        eq_(CLOSED_CIRCUIT_STATE, circuit_breaker.get_state(_STUB_URL))
+
+    def test_probe_request(self):
+        circuit_breaker = _make_open_circuit_breaker()
+
+        sleep(_RECOVERY_TIMEOUT)
+        circuit_breaker.require_request_permission(_STUB_URL)
+
+        eq_(HALF_OPEN_CIRCUIT_STATE, circuit_breaker.get_state(_STUB_URL))
+        with assert_raises(CircuitOpenError):
+            circuit_breaker.require_request_permission(_STUB_URL)
+
+    def test_released_probe_request(self):
+        circuit_breaker = _make_open_circuit_breaker()
+
+        sleep(_RECOVERY_TIMEOUT)
+        circuit_breaker.require_request_permission(_STUB_URL)
+        circuit_breaker.release_request_permission(_STUB_URL)
+
+        eq_(HALF_OPEN_CIRCUIT_STATE, circuit_breaker.get_state(_STUB_URL))
+        circuit_breaker.require_request_permission(_STUB_URL)
+
+    def test_successful_probe_request(self):
+        circuit_breaker = _make_open_circuit_breaker()
+
+        sleep(_RECOVERY_TIMEOUT)
+        circuit_breaker.require_request_permission(_STUB_URL)
+        circuit_breaker.record_success(_STUB_URL)
+
+        eq_(CLOSED_CIRCUIT_STATE, circuit_breaker.get_state(_STUB_URL))
+        circuit_breaker.require_request_permission(_STUB_URL)
+        circuit_breaker.require_request_permission(_STUB_URL)
+
+    def test_failed_probe_request(self):
+        circuit_breaker = _make_open_circuit_breaker()
+
+        sleep(_RECOVERY_TIMEOUT)
+        circuit_breaker.require_request_permission(_STUB_URL)
+        circuit_breaker.record_failure(_STUB_URL)
+
+        eq_(OPEN_CIRCUIT_STATE, circuit_breaker.get_state(_STUB_URL))
+        with assert_raises(CircuitOpenError):
+            circuit_breaker.require_request_permission(_STUB_URL)
+
+    def test_hosts(self):
+        circuit_breaker = _make_open_circuit_breaker()
+
+        other_url = 'https://example.org/api/foo'
+        eq_(CLOSED_CIRCUIT_STATE, circuit_breaker.get_state(other_url))
+
+    def test_endpoint_prefixes(self):
+        circuit_breaker = CircuitBreaker(
+            failure_threshold=1,
+            endpoint_prefixes=['/api/', '/api/foo'],
+            )
+
+        circuit_breaker.record_failure(_STUB_URL)
+
+        eq_(
+            'https://example.com/api/foo',
+            circuit_breaker.get_circuit_key(_STUB_URL),
+            )
+        eq_(OPEN_CIRCUIT_STATE, circuit_breaker.get_state(_STUB_URL))
+        other_url = 'https://example.com/api/bar'
+        eq_(CLOSED_CIRCUIT_STATE, circuit_breaker.get_state(other_url))
+
+    def test_state_change_listeners(self):
+        state_changes = []
+        circuit_breaker = _make_open_circuit_breaker(
+            state_change_listeners=[
+                lambda *args: state_changes.append(args),
+                ],
+            )
+
+        sleep(_RECOVERY_TIMEOUT)
+        circuit_breaker.require_request_permission(_STUB_URL)
+        circuit_breaker.record_success(_STUB_URL)
+
+        circuit_key = 'https://example.com'
+        expected_state_changes = [
+            (circuit_key, CLOSED_CIRCUIT_STATE, OPEN_CIRCUIT_STATE),
+            (circuit_key, OPEN_CIRCUIT_STATE, HALF_OPEN_CIRCUIT_STATE),
+            (circuit_key, HALF_OPEN_CIRCUIT_STATE, CLOSED_CIRCUIT_STATE),
+            ]
+        eq_(expected_state_changes, state_changes)
+
+    def test_added_state_change_listener(self):
+        state_changes = []
+        circuit_breaker = CircuitBreaker(failure_threshold=1)
+        circuit_breaker.add_state_change_listener(
+            lambda *args: state_changes.append(args),
+            )
+
+        circuit_breaker.record_failure(_STUB_URL)
+
+        eq_(1, len(state_changes))
+
+
+class TestCircuitBreakingConnection(object):
+
+    def test_server_errors(self):
+        with StubAPIServer(lambda request: StubResponse(503)) as stub_server:
+            connection = _make_connection(stub_server)
+            for _ in range(2):
+                with assert_raises(ServerError):
+                    connection.send_get_request(_STUB_URL_PATH)
+
+            with assert_raises(CircuitOpenError):
+                connection.send_get_request(_STUB_URL_PATH)
+
+        eq_(2, len(stub_server.requests))
+
+    def test_client_errors(self):
+        with StubAPIServer(lambda request: StubResponse(404)) as stub_server:
+            connection = _make_connection(stub_server)
+            for _ in range(3):
+                with assert_raises(NotFoundError):
+                    connection.send_get_request(_STUB_URL_PATH)
+
+        eq_(3, len(stub_server.requests))
+
+    def test_connection_errors(self):
+        with StubAPIServer() as stub_server:
+            api_url = stub_server.api_url
+        circuit_breaker = CircuitBreaker(failure_threshold=1)
+        connection = Connection(
+            None,
+            api_url=api_url,
+            circuit_breaker=circuit_breaker,
+            )
+
+        with assert_raises(ConnectionError):
+            connection.send_get_request(_STUB_URL_PATH)
+
+        with assert_raises(CircuitOpenError):
+            connection.send_get_request(_STUB_URL_PATH)
+
+    def test_deadlines_exceeded(self):
+        def make_response(request):
+            sleep(0.05)
+            return make_echo_response(request)
+
+        with StubAPIServer(make_response) as stub_server:
+            connection = _make_connection(stub_server)
+            for _ in range(3):
+                with assert_raises(DeadlineExceededError):
+                    connection.send_get_request(_STUB_URL_PATH, deadline=0.01)
+
+            response = connection.send_get_request(_STUB_URL_PATH)
+
+        eq_(200, response.status_code)
+
+    def test_recovery(self):
+        response_statuses = [503, 503, 200, 200]
+
+        def make_response(request):
+            status_code = response_statuses.pop(0)
+            if status_code == 200:
+                response = make_echo_response(request)
+            else:
+                response = StubResponse(status_code)
+            return response
+
+        with StubAPIServer(make_response) as stub_server:
+            connection = _make_connection(stub_server)
+            for _ in range(2):
+                with assert_raises(ServerError):
+                    connection.send_get_request(_STUB_URL_PATH)
+
+            sleep(_RECOVERY_TIMEOUT)
+            connection.send_get_request(_STUB_URL_PATH)
+            connection.send_get_request(_STUB_URL_PATH)
+
+        eq_(4, len(stub_server.requests))
+
+
+def _make_open_circuit_breaker(state_change_listeners=()):
+    circuit_breaker = CircuitBreaker(
+        failure_threshold=1,
+        recovery_timeout=_RECOVERY_TIMEOUT,
+        state_change_listeners=state_change_listeners,
+        )
+    circuit_breaker.record_failure(_STUB_URL)
+    return circuit_breaker
+
+
+def _record_failures(circuit_breaker, failure_count):
+    for _ in range(failure_count):
+        circuit_breaker.record_failure(_STUB_URL)
+
+
+def _make_connection(stub_server):
+    circuit_breaker = CircuitBreaker(
+        failure_threshold=2,
+        recovery_timeout=_RECOVERY_TIMEOUT,
+        )
+    connection = Connection(
+        None,
+        api_url=stub_server.api_url,
+        circuit_breaker=circuit_breaker,
+        )
+    return connection
@@ -0,0 +1,342 @@
+##############################################################################
+#
+# Copyright (c) 2016, 2degrees Limited.
+# All Rights Reserved.
+#
+# This file is part of twapi-connection
+# <https://github.com/2degrees/twapi-connection>, which is subject to the
+# provisions of the BSD at
+# <http://dev.2degreesnetwork.com/p/2degrees-license.html>. A copy of the
+# license should accompany this distribution. THIS SOFTWARE IS PROVIDED "AS IS"
+# AND ANY AND ALL EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT
+# NOT LIMITED TO, THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST
+# INFRINGEMENT, AND FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+
+from threading import Event
+from threading import Thread
+from time import monotonic
+from time import sleep
+from time import time
+
+from nose.tools import assert_is_instance
+from nose.tools import assert_raises
+from nose.tools import eq_
+from nose.tools import ok_
+
+from tests.utils import StubAPIServer
+from tests.utils import StubResponse
+from tests.utils import make_echo_response
+from twapi_connection import Connection
+from twapi_connection.coalescing import CallCoalescer
+from twapi_connection.exc import DeadlineExceededError
+from twapi_connection.exc import NotFoundError
+
+_STUB_URL_PATH = '/foo'
+
+
+class TestCallCoalescer(object):
+
+    def test_sequential_calls(self):
+        call_coalescer = CallCoalescer()
+
+        eq_(1, call_coalescer.call('a', int, '1'))
+        eq_(2, call_coalescer.call('a', int, '2'))
+        eq_(0, call_coalescer.get_coalesced_call_count())
+
+    def test_concurrent_calls(self):
+        call_coalescer = CallCoalescer()
+        function = _BlockingFunction()
+
+        outcomes = _call_concurrently(
+            [lambda: call_coalescer.call('a', function)] * 5,
+            lambda: call_coalescer.get_coalesced_call_count() == 4,
+            function.release,
+            )
+
+        eq_(1, function.call_count)
+        eq_([1] * 5, outcomes)
+        eq_(4, call_coalescer.get_coalesced_call_count())
+
+    def test_concurrent_calls_with_different_keys(self):
+        call_coalescer = CallCoalescer()
+        function = _BlockingFunction()
+
+        outcomes = _call_concurrently(
+            [
+                lambda: call_coalescer.call('a', function),
+                lambda: call_coalescer.call('b', function),
+                ],
+            lambda: function.call_count == 2,
+            function.release,
+            )
+
+        eq_([1, 2], sorted(outcomes))
+        eq_(0, call_coalescer.get_coalesced_call_count())
+
+    def test_exception(self):
+        call_coalescer = CallCoalescer()
+        exception = NotFoundError()
+        function = _BlockingFunction(exception)
+
+        outcomes = _call_concurrently(
+            [lambda: call_coalescer.call('a', function)] * 3,
+            lambda: call_coalescer.get_coalesced_call_count() == 2,
+            function.release,
+            )
+
+        eq_([exception] * 3, outcomes)
+
+    def test_wait_timeout(self):
+        call_coalescer = CallCoalescer()
+        function = _BlockingFunction()
+
+        thread = Thread(target=call_coalescer.call, args=('a', function))
+        thread.start()
+        _wait_until(lambda: function.call_count == 1)
+        try:
+            with assert_raises(TimeoutError):
+                call_coalescer.call('a', function, wait_timeout=0.05)
+        finally:
+            function.release()
+            thread.join()
+
+        eq_(1, function.call_count)
+
+
+class TestCoalescingConnection(object):
+
+    def test_identical_get_requests(self):
+        outcomes, stub_server, connection = \
+            self._send_concurrent_requests('send_get_request', 5)
+
+        eq_(1, len(stub_server.requests))
+        eq_(4, connection.get_coalesced_request_count())
+        eq_(1, len(set(id(response) for response in outcomes)))
+
+    def test_identical_head_requests(self):
+        _, stub_server, connection = \
+            self._send_concurrent_requests('send_head_request', 3)
+
+        eq_(1, len(stub_server.requests))
+        eq_(2, connection.get_coalesced_request_count())
+
+    def test_unsuccessful_requests(self):
+        outcomes, stub_server, connection = self._send_concurrent_requests(
+            'send_get_request',
+            3,
+            StubResponse(404),
+            )
+
+        eq_(1, len(stub_server.requests))
+        for outcome in outcomes:
+            assert_is_instance(outcome, NotFoundError)
+
+    def test_requests_with_different_query_string_args(self):
+        request_released = Event()
+
+        def make_response(request):
+            request_released.wait(5)
+            return make_echo_response(request)
+
+        with StubAPIServer(make_response) as stub_server:
+            connection = Connection(
+                None,
+                api_url=stub_server.api_url,
+                coalesce_requests=True,
+                )
+            _call_concurrently(
+                [
+                    lambda: connection.send_get_request(
+                        _STUB_URL_PATH,
+                        {'foo': 'bar'},
+                        ),
+                    lambda: connection.send_get_request(
+                        _STUB_URL_PATH,
+                        {'foo': 'baz'},
+                        ),
+                    ],
+                lambda: len(stub_server.requests) == 2,
+                request_released.set,
+                )
+
+        eq_(2, len(stub_server.requests))
+        eq_(0, connection.get_coalesced_request_count())
+
+    def test_non_idempotent_requests(self):
+        _, stub_server, connection = self._send_concurrent_requests(
+            'send_post_request',
+            2,
+            wait_for_all_requests=True,
+            )
+
+        eq_(2, len(stub_server.requests))
+        eq_(0, connection.get_coalesced_request_count())
+
+    def test_deadline(self):
+        request_released = Event()
+
+        def make_response(request):
+            request_released.wait(5)
+            return make_echo_response(request)
+
+        with StubAPIServer(make_response) as stub_server:
+            connection = Connection(
+                None,
+                api_url=stub_server.api_url,
+                coalesce_requests=True,
+                )
+            thread = Thread(
+                target=connection.send_get_request,
+                args=(_STUB_URL_PATH,),
+                )
+            thread.start()
+            _wait_until(lambda: len(stub_server.requests) == 1)
+            try:
+                start_time = monotonic()
+                with assert_raises(DeadlineExceededError):
+                    connection.send_get_request(_STUB_URL_PATH, deadline=0.1)
+                elapsed_time = monotonic() - start_time
+            finally:
+                request_released.set()
+                thread.join()
+
+        ok_(elapsed_time < 1)
+        eq_(1, len(stub_server.requests))
+        eq_(1, connection.get_coalesced_request_count())
+
+    def test_deadline_of_request_in_progress(self):
+        def make_response(request):
+            sleep(0.5)
+            return make_echo_response(request)
+
+        with StubAPIServer(make_response) as stub_server:
+            connection = Connection(
+                None,
+                api_url=stub_server.api_url,
+                coalesce_requests=True,
+                )
+            outcomes = []
+
+            def send_request_with_deadline():
+                try:
+                    connection.send_get_request(_STUB_URL_PATH, deadline=0.2)
+                except DeadlineExceededError as exc:
+                    outcomes.append(exc)
+
+            thread = Thread(target=send_request_with_deadline)
+            thread.start()
+            _wait_until(lambda: len(stub_server.requests) == 1)
+            # The request in progress runs out of time, but this one does not
+            response = connection.send_get_request(_STUB_URL_PATH)
+            thread.join()
+
+        eq_(200, response.status_code)
+        eq_(1, len(outcomes))
+        eq_(1, connection.get_coalesced_request_count())
+
+    def test_coalescing_disabled(self):
+        with StubAPIServer() as stub_server:
+            connection = Connection(None, api_url=stub_server.api_url)
+            connection.send_get_request(_STUB_URL_PATH)
+
+        eq_(0, connection.get_coalesced_request_count())
+
+    @staticmethod
+    def _send_concurrent_requests(
+        request_sender_name,
+        request_count,
+        stub_response=None,
+        wait_for_all_requests=False,
+        ):
+        request_released = Event()
+
+        def make_response(request):
+            request_released.wait(5)
+            return stub_response or make_echo_response(request)
+
+        with StubAPIServer(make_response) as stub_server:
+            connection = Connection(
+                None,
+                api_url=stub_server.api_url,
+                coalesce_requests=True,
+                )
+            request_sender = getattr(connection, request_sender_name)
+
+            if wait_for_all_requests:
+                def are_callers_waiting():
+                    return len(stub_server.requests) == request_count
+            else:
+                def are_callers_waiting():
+                    coalesced_request_count = \
+                        connection.get_coalesced_request_count()
+                    return coalesced_request_count == request_count - 1
+
+            outcomes = _call_concurrently(
+                [lambda: request_sender(_STUB_URL_PATH)] * request_count,
+                are_callers_waiting,
+                request_released.set,
+                )
+
+        return outcomes, stub_server, connection
+
+
+class _BlockingFunction(object):
+    """Function returning the number of times it was called, once released."""
+
+    def __init__(self, exception=None):
+        super(_BlockingFunction, self).__init__()
+
+        self._exception = exception
+        self.call_count = 0
+        self._released = Event()
+
+    def __call__(self):
+        self.call_count += 1
+        call_number = self.call_count
+        self._released.wait(5)
+        if self._exception:
+            raise self._exception
+        return call_number
+
+    def release(self):
+        self._released.set()
+
+
+def _call_concurrently(functions, are_callers_waiting, release):
+    """
+    Call ``functions`` from separate threads, and call ``release`` once
+    ``are_callers_waiting`` is true.
+
+    :return: The return value or exception of each function
+
+    """
+    outcomes = [None] * len(functions)
+
+    def call(index, function):
+        try:
+            outcomes[index] = function()
+        except Exception as exc:
+            outcomes[index] = exc
+
+    threads = [
+        Thread(target=call, args=(index, function))
+        for index, function in enumerate(functions)
+        ]
+    for thread in threads:
+        thread.start()
+
+    _wait_until(are_callers_waiting)
+    release()
+
+    for thread in threads:
+        thread.join()
+
+    return outcomes
+
+
+def _wait_until(condition, timeout=5):
+    deadline = time() + timeout
+    while not condition() and time() < deadline:
+        sleep(0.01)
@@ -0,0 +1,195 @@
+##############################################################################
+#
+# Copyright (c) 2016, 2degrees Limited.
+# All Rights Reserved.
+#
+# This file is part of twapi-connection
+# <https://github.com/2degrees/twapi-connection>, which is subject to the
+# provisions of the BSD at
+# <http://dev.2degreesnetwork.com/p/2degrees-license.html>. A copy of the
+# license should accompany this distribution. THIS SOFTWARE IS PROVIDED "AS IS"
+# AND ANY AND ALL EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT
+# NOT LIMITED TO, THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST
+# INFRINGEMENT, AND FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+
+from gzip import compress as gzip_compress
+from gzip import decompress as gzip_decompress
+from json import loads as json_deserialize
+from unittest import SkipTest
+from zlib import decompress as zlib_decompress
+
+from nose.tools import assert_in
+from nose.tools import assert_not_in
+from nose.tools import assert_raises
+from nose.tools import eq_
+from nose.tools import ok_
+
+from tests.utils import StubAPIServer
+from tests.utils import make_json_response
+from twapi_connection import Connection
+from twapi_connection.compression import RequestBodyCompressionPolicy
+from twapi_connection.compression import TransferStatistics
+from twapi_connection.compression import brotli
+from twapi_connection.compression import get_accept_encoding
+from twapi_connection.compression import get_compression_ratio
+
+_STUB_URL_PATH = '/foo'
+
+_LARGE_BODY_DESERIALIZATION = [{'foo': 'bar'}] * 1000
+
+_SMALL_BODY_DESERIALIZATION = {'foo': 'bar'}
+
+
+class TestRequestBodyCompressionPolicy(object):
+
+    def test_gzip(self):
+        compression_policy = RequestBodyCompressionPolicy('gzip', 10)
+
+        compressed_body = compression_policy.compress(b'a' * 100)
+
+        eq_(b'a' * 100, gzip_decompress(compressed_body))
+
+    def test_deflate(self):
+        compression_policy = RequestBodyCompressionPolicy('deflate', 10)
+
+        compressed_body = compression_policy.compress(b'a' * 100)
+
+        eq_(b'a' * 100, zlib_decompress(compressed_body))
+
+    def test_brotli(self):
+        if brotli is None:
+            raise SkipTest('brotli is not installed')
+        compression_policy = RequestBodyCompressionPolicy('br', 10)
+
+        compressed_body = compression_policy.compress(b'a' * 100)
+
+        eq_(b'a' * 100, brotli.decompress(compressed_body))
+
+    def test_compression_level(self):
+        compression_policy = RequestBodyCompressionPolicy(
+            'gzip',
+            10,
+            compression_level=1,
+            )
+
+        compressed_body = compression_policy.compress(b'a' * 100)
+
+        eq_(b'a' * 100, gzip_decompress(compressed_body))
+
+    def test_body_below_min_size(self):
+        compression_policy = RequestBodyCompressionPolicy('gzip', 10)
+
+        eq_(None, compression_policy.compress(b'a' * 9))
+
+    def test_unsupported_content_encoding(self):
+        with assert_raises(ValueError):
+            RequestBodyCompressionPolicy('compress')
+
+
+def test_accept_encoding():
+    accept_encoding = get_accept_encoding()
+
+    assert_in('gzip', accept_encoding)
+    assert_in('deflate', accept_encoding)
+    if brotli is None:
+        assert_not_in('br', accept_encoding)
+    else:
+        assert_in('br', accept_encoding)
+
+
+def test_compression_ratio():
+    eq_(4, get_compression_ratio(100, 25))
+    eq_(None, get_compression_ratio(0, 0))
+
+
+class TestCompressingConnection(object):
+
+    def test_compressed_request_body(self):
+        stub_server, connection = self._send_post_request(
+            _LARGE_BODY_DESERIALIZATION,
+            RequestBodyCompressionPolicy(),
+            )
+
+        request = stub_server.requests[0]
+        eq_('gzip', request.headers['Content-Encoding'])
+        eq_(
+            _LARGE_BODY_DESERIALIZATION,
+            json_deserialize(gzip_decompress(request.body).decode('utf-8')),
+            )
+
+        transfer_statistics = connection.get_transfer_statistics()
+        eq_(
+            len(request.body),
+            transfer_statistics.sent_request_body_byte_count,
+            )
+        ok_(
+            transfer_statistics.sent_request_body_byte_count <
+            transfer_statistics.request_body_byte_count
+            )
+
+    def test_request_body_below_min_size(self):
+        stub_server, connection = self._send_post_request(
+            _SMALL_BODY_DESERIALIZATION,
+            RequestBodyCompressionPolicy(),
+            )
+
+        request = stub_server.requests[0]
+        assert_not_in('Content-Encoding', request.headers)
+        eq_(_SMALL_BODY_DESERIALIZATION, request.json())
+
+    def test_compression_disabled(self):
+        stub_server, connection = self._send_post_request(
+            _LARGE_BODY_DESERIALIZATION,
+            )
+
+        request = stub_server.requests[0]
+        assert_not_in('Content-Encoding', request.headers)
+
+        transfer_statistics = connection.get_transfer_statistics()
+        eq_(
+            transfer_statistics.request_body_byte_count,
+            transfer_statistics.sent_request_body_byte_count,
+            )
+
+    def test_accept_encoding(self):
+        stub_server, _ = \
+            self._send_post_request(_SMALL_BODY_DESERIALIZATION)
+
+        request = stub_server.requests[0]
+        eq_(get_accept_encoding(), request.headers['Accept-Encoding'])
+
+    def test_compressed_response_body(self):
+        uncompressed_response = make_json_response(_LARGE_BODY_DESERIALIZATION)
+        compressed_response = make_json_response(
+            None,
+            headers={'Content-Encoding': 'gzip'},
+            )
+        compressed_response.body = gzip_compress(uncompressed_response.body)
+
+        with StubAPIServer(lambda request: compressed_response) \
+                as stub_server:
+            connection = Connection(None, api_url=stub_server.api_url)
+            response = connection.send_get_request(_STUB_URL_PATH)
+
+        eq_(_LARGE_BODY_DESERIALIZATION, response.json())
+
+        expected_transfer_statistics = TransferStatistics(
+            0,
+            0,
+            len(uncompressed_response.body),
+            len(compressed_response.body),
+            )
+        eq_(expected_transfer_statistics, connection.get_transfer_statistics())
+
+    @staticmethod
+    def _send_post_request(body_deserialization, compression_policy=None):
+        with StubAPIServer() as stub_server:
+            connection = Connection(
+                None,
+                api_url=stub_server.api_url,
+                request_body_compression_policy=compression_policy,
+                )
+            connection.send_post_request(_STUB_URL_PATH, body_deserialization)
+        return stub_server, connection
@@ -16,6 +16,13 @@
 
 from base64 import b64encode
 from json import dumps as json_serialize
+from json import loads as json_deserialize
+from threading import Barrier
+from threading import Event
+from threading import Lock
+from threading import Thread
+from time import sleep
+from time import time
 
 from nose.tools import assert_equal
 from nose.tools import assert_false
@@ -27,8 +34,16 @@ from nose.tools import ok_
 from requests.adapters import HTTPAdapter as RequestsHTTPAdapter
 from requests.models import Response as RequestsResponse
 
+from tests.utils import StubAPIServer
+from tests.utils import StubResponse
+from tests.utils import get_sole_pool_statistics
 from tests.utils import get_uuid4_str
+from tests.utils import make_echo_response
+from tests.utils import make_json_response
 from twapi_connection import Connection
+from twapi_connection.api_calls import APICall
+from twapi_connection.api_calls import SuccessfulAPICall
+from twapi_connection.api_calls import UnsuccessfulAPICall
 from twapi_connection.exc import AccessDeniedError
 from twapi_connection.exc import AuthenticationError
 from twapi_connection.exc import ClientError
@@ -94,8 +109,7 @@ class TestConnection(object):
         eq_(_STUB_URL_PATH, requested_url_path)
 
         if include_request_body:
-            body_serialization = json_serialize(body_deserialization)
-            eq_(body_serialization, prepared_request.body)
+            eq_(body_deserialization, json_deserialize(prepared_request.body))
         else:
             assert_false(prepared_request.body)
 
@@ -281,6 +295,285 @@ class TestAuthentication(object):
         eq_(expected_header_value, authentication_header_value)
 
 
+class TestBatchRequests(object):
+
+    def test_successful_requests(self):
+        api_calls = [
+            APICall(_STUB_URL_PATH, 'GET', {'index': '1'}),
+            APICall(_STUB_URL_PATH, 'POST', request_body_deserialization=[1]),
+            ]
+        connection = _MockConnection()
+
+        api_call_outcomes = list(connection.send_requests(api_calls))
+
+        eq_(2, len(api_call_outcomes))
+        for api_call, api_call_outcome in zip(api_calls, api_call_outcomes):
+            assert_is_instance(api_call_outcome, SuccessfulAPICall)
+            eq_(api_call.url, api_call_outcome.url)
+            eq_(api_call.http_method, api_call_outcome.http_method)
+            eq_(api_call.query_string_args, api_call_outcome.query_string_args)
+            eq_(
+                api_call.request_body_deserialization,
+                api_call_outcome.request_body_deserialization,
+                )
+            eq_(200, api_call_outcome.response.status_code)
+
+        eq_(
+            ['GET', 'POST'],
+            sorted(r.method for r in connection.prepared_requests),
+            )
+
+    def test_unsuccessful_requests(self):
+        response_data_maker = _URLPathDependentResponseMaker({
+            '/missing': _ResponseMaker(404, {}),
+            '/broken': _ResponseMaker(500),
+            })
+        connection = _MockConnection(response_data_maker)
+        api_calls = [
+            APICall('/missing', 'GET'),
+            APICall(_STUB_URL_PATH, 'GET'),
+            APICall('/broken', 'GET'),
+            ]
+
+        api_call_outcomes = list(connection.send_requests(api_calls))
+
+        eq_(
+            ['/missing', _STUB_URL_PATH, '/broken'],
+            [o.url for o in api_call_outcomes],
+            )
+        assert_is_instance(api_call_outcomes[0], UnsuccessfulAPICall)
+        assert_is_instance(api_call_outcomes[0].exception, NotFoundError)
+        assert_is_instance(api_call_outcomes[1], SuccessfulAPICall)
+        assert_is_instance(api_call_outcomes[2], UnsuccessfulAPICall)
+        assert_is_instance(api_call_outcomes[2].exception, ServerError)
+
+    def test_order_preserved(self):
+        connection = _MockConnection(_SlowFirstResponseMaker('/slow'))
+        api_calls = [APICall('/slow', 'GET'), APICall(_STUB_URL_PATH, 'GET')]
+
+        api_call_outcomes = \
+            list(connection.send_requests(api_calls, max_concurrency=2))
+
+        eq_(['/slow', _STUB_URL_PATH], [o.url for o in api_call_outcomes])
+
+    def test_order_not_preserved(self):
+        connection = _MockConnection(_SlowFirstResponseMaker('/slow'))
+        api_calls = [APICall('/slow', 'GET'), APICall(_STUB_URL_PATH, 'GET')]
+
+        api_call_outcomes = list(
+            connection.send_requests(
+                api_calls,
+                max_concurrency=2,
+                is_order_preserved=False,
+                ),
+            )
+
+        eq_([_STUB_URL_PATH, '/slow'], [o.url for o in api_call_outcomes])
+
+    def test_max_concurrency(self):
+        response_data_maker = _ConcurrencyTrackingResponseMaker()
+        connection = _MockConnection(response_data_maker)
+        api_calls = (APICall(_STUB_URL_PATH, 'GET') for _ in range(50))
+
+        api_call_outcomes = \
+            list(connection.send_requests(api_calls, max_concurrency=4))
+
+        eq_(50, len(api_call_outcomes))
+        ok_(1 < response_data_maker.max_concurrent_request_count <= 4)
+
+
+class TestConnectionPool(object):
+
+    def test_connection_reuse(self):
+        with StubAPIServer() as stub_server:
+            connection = \
+                Connection(None, api_url=stub_server.api_url, pool_maxsize=2)
+            with connection:
+                for _ in range(5):
+                    connection.send_get_request(_STUB_URL_PATH)
+
+                statistics = get_sole_pool_statistics(connection)
+
+        eq_(1, statistics.created_connection_count)
+        eq_(4, statistics.reused_connection_count)
+        eq_(0, statistics.discarded_connection_count)
+        eq_(1, statistics.idle_connection_count)
+
+    def test_pool_overflow(self):
+        """Connections beyond the size of the pool are discarded."""
+        request_count = 4
+        barrier = Barrier(request_count)
+
+        def make_response(request):
+            barrier.wait(5)
+            return make_echo_response(request)
+
+        with StubAPIServer(make_response) as stub_server:
+            connection = \
+                Connection(None, api_url=stub_server.api_url, pool_maxsize=1)
+            with connection:
+                _send_concurrent_get_requests(connection, request_count)
+
+                statistics = get_sole_pool_statistics(connection)
+
+        eq_(request_count, statistics.created_connection_count)
+        eq_(0, statistics.reused_connection_count)
+        eq_(request_count - 1, statistics.discarded_connection_count)
+        eq_(1, statistics.idle_connection_count)
+
+    def test_blocking_pool(self):
+        """Requests wait for a connection when the pool is blocking."""
+        with StubAPIServer() as stub_server:
+            connection = Connection(
+                None,
+                api_url=stub_server.api_url,
+                pool_maxsize=1,
+                pool_block=True,
+                )
+            with connection:
+                _send_concurrent_get_requests(connection, 4)
+
+                statistics = get_sole_pool_statistics(connection)
+
+        eq_(1, statistics.created_connection_count)
+        eq_(3, statistics.reused_connection_count)
+        eq_(0, statistics.discarded_connection_count)
+        eq_(1, statistics.idle_connection_count)
+
+
+class TestThreadSafety(object):
+
+    def test_concurrent_requests(self):
+        """Responses are not mixed up when threads share a connection."""
+        thread_count = 16
+        request_count_per_thread = 50
+        mismatched_responses = []
+
+        def send_requests(connection, thread_index):
+            for request_index in range(request_count_per_thread):
+                query_string_args = {
+                    'thread': str(thread_index),
+                    'request': str(request_index),
+                    }
+                response = connection.send_get_request(
+                    _STUB_URL_PATH,
+                    query_string_args,
+                    )
+                echoed_query_string_args = \
+                    response.json()['query_string_args']
+                if echoed_query_string_args != query_string_args:
+                    mismatched_responses.append(response)
+
+        with StubAPIServer() as stub_server:
+            connection = Connection(
+                None,
+                api_url=stub_server.api_url,
+                pool_maxsize=thread_count,
+                )
+            with connection:
+                threads = [
+                    Thread(target=send_requests, args=(connection, index))
+                    for index in range(thread_count)
+                    ]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+
+                pool_statistics_by_origin = \
+                    connection.get_connection_pool_statistics()
+
+        eq_([], mismatched_responses)
+        eq_(
+            thread_count * request_count_per_thread,
+            len(stub_server.requests),
+            )
+
+        statistics = list(pool_statistics_by_origin.values())[0]
+        ok_(statistics.created_connection_count <= thread_count)
+        eq_(0, statistics.discarded_connection_count)
+
+    def test_cookies_ignored(self):
+        def make_response(request):
+            response = StubResponse(
+                204,
+                headers={'Set-Cookie': 'foo={}'.format(get_uuid4_str())},
+                )
+            return response
+
+        with StubAPIServer(make_response) as stub_server:
+            connection = Connection(None, api_url=stub_server.api_url)
+            with connection:
+                _send_concurrent_get_requests(connection, 10)
+
+        eq_(0, len(connection._session.cookies))
+        for request in stub_server.requests:
+            assert_false('Cookie' in request.headers)
+
+
+class TestPagination(object):
+
+    def test_items(self):
+        with _PaginatedCollectionServer(3, 2) as stub_server:
+            connection = Connection(None, api_url=stub_server.api_url)
+            items = list(connection.iter_paginated_items('/items'))
+
+        eq_(list(range(6)), items)
+        eq_(3, len(stub_server.requests))
+
+    def test_items_without_prefetching(self):
+        with _PaginatedCollectionServer(3, 2) as stub_server:
+            connection = Connection(None, api_url=stub_server.api_url)
+            items = connection.iter_paginated_items(
+                '/items',
+                prefetched_page_count=0,
+                )
+
+            eq_([0, 1], [next(items), next(items)])
+            eq_(1, len(stub_server.requests))
+
+            eq_(list(range(2, 6)), list(items))
+            eq_(3, len(stub_server.requests))
+
+    def test_query_string_args(self):
+        with _PaginatedCollectionServer(2, 1) as stub_server:
+            connection = Connection(None, api_url=stub_server.api_url)
+            list(connection.iter_paginated_items('/items', {'foo': 'bar'}))
+
+        first_request, second_request = stub_server.requests
+        eq_({'foo': 'bar'}, first_request.query_string_args)
+        eq_({'page': '1'}, second_request.query_string_args)
+
+    def test_bounded_prefetching(self):
+        """
+        Pages are fetched until the queue of prefetched pages is full and
+        another page is waiting to be queued.
+
+        """
+        with _PaginatedCollectionServer(10, 1) as stub_server:
+            connection = Connection(None, api_url=stub_server.api_url)
+            items = connection.iter_paginated_items(
+                '/items',
+                prefetched_page_count=2,
+                )
+
+            eq_(0, next(items))
+            _wait_for_request_count(stub_server, 4)
+            sleep(0.2)
+            eq_(4, len(stub_server.requests))
+
+            items.close()
+
+    def test_unsuccessful_page_request(self):
+        with _PaginatedCollectionServer(2, 1, 404) as stub_server:
+            connection = Connection(None, api_url=stub_server.api_url)
+            items = connection.iter_paginated_items('/items')
+
+            eq_(0, next(items))
+            with assert_raises(NotFoundError):
+                next(items)
+
+
 class MockRequest:
 
     def __init__(self):
@@ -363,6 +656,117 @@ class _ResponseMaker(object):
         return response
 
 
+class _URLPathDependentResponseMaker(object):
+    def __init__(self, response_data_makers_by_url_path):
+        super(_URLPathDependentResponseMaker, self).__init__()
+
+        self._response_data_makers_by_url_path = \
+            response_data_makers_by_url_path
+        self._default_response_data_maker = \
+            _ResponseMaker(200, '', 'application/json')
+
+    def __call__(self, request):
+        url_path = _get_path_from_api_url(request.url)
+        response_data_maker = self._response_data_makers_by_url_path.get(
+            url_path,
+            self._default_response_data_maker,
+            )
+        return response_data_maker(request)
+
+
+class _SlowFirstResponseMaker(_ResponseMaker):
+    """Hold the response for a URL path until another request is answered."""
+
+    def __init__(self, slow_url_path):
+        super(_SlowFirstResponseMaker, self).__init__(
+            200,
+            '',
+            'application/json',
+            )
+
+        self._slow_url_path = slow_url_path
+        self._other_request_answered = Event()
+
+    def __call__(self, request):
+        if _get_path_from_api_url(request.url) == self._slow_url_path:
+            self._other_request_answered.wait(5)
+            response = super(_SlowFirstResponseMaker, self).__call__(request)
+        else:
+            response = super(_SlowFirstResponseMaker, self).__call__(request)
+            self._other_request_answered.set()
+        return response
+
+
+class _ConcurrencyTrackingResponseMaker(_ResponseMaker):
+    def __init__(self):
+        super(_ConcurrencyTrackingResponseMaker, self).__init__(
+            200,
+            '',
+            'application/json',
+            )
+
+        self.max_concurrent_request_count = 0
+        self._concurrent_request_count = 0
+        self._lock = Lock()
+
+    def __call__(self, request):
+        with self._lock:
+            self._concurrent_request_count += 1
+            self.max_concurrent_request_count = max(
+                self.max_concurrent_request_count,
+                self._concurrent_request_count,
+                )
+        sleep(0.01)
+        with self._lock:
+            self._concurrent_request_count -= 1
+        return super(_ConcurrencyTrackingResponseMaker, self).__call__(request)
+
+
+class _PaginatedCollectionServer(StubAPIServer):
+    """Serve the integers in a collection, in pages of the given size."""
+
+    def __init__(self, page_count, page_size, last_page_status_code=200):
+        super(_PaginatedCollectionServer, self).__init__(self._make_response)
+
+        self._page_count = page_count
+        self._page_size = page_size
+        self._last_page_status_code = last_page_status_code
+
+    def _make_response(self, request):
+        page_number = int(request.query_string_args.get('page', 0))
+        if page_number == self._page_count - 1:
+            if self._last_page_status_code != 200:
+                return StubResponse(self._last_page_status_code)
+            next_page_url = None
+        else:
+            next_page_url = \
+                '{}/items?page={}'.format(self.api_url, page_number + 1)
+
+        first_item = page_number * self._page_size
+        page = {
+            'results': list(range(first_item, first_item + self._page_size)),
+            'next': next_page_url,
+            }
+        return make_json_response(page)
+
+
+def _wait_for_request_count(stub_server, request_count, timeout=5):
+    deadline = time() + timeout
+    while len(stub_server.requests) < request_count and time() < deadline:
+        sleep(0.01)
+
+
+def _send_concurrent_get_requests(connection, request_count):
+    threads = [
+        Thread(target=connection.send_get_request, args=(_STUB_URL_PATH,))
+        for _ in range(request_count)
+        ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
 def _get_path_from_api_url(api_url):
     assert api_url.startswith(Connection._API_URL)
 
@@ -0,0 +1,131 @@
+##############################################################################
+#
+# Copyright (c) 2016, 2degrees Limited.
+# All Rights Reserved.
+#
+# This file is part of twapi-connection
+# <https://github.com/2degrees/twapi-connection>, which is subject to the
+# provisions of the BSD at
+# <http://dev.2degreesnetwork.com/p/2degrees-license.html>. A copy of the
+# license should accompany this distribution. THIS SOFTWARE IS PROVIDED "AS IS"
+# AND ANY AND ALL EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT
+# NOT LIMITED TO, THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST
+# INFRINGEMENT, AND FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+
+from multiprocessing import get_context as get_multiprocessing_context
+from time import monotonic
+from time import sleep
+
+from nose.tools import eq_
+
+from tests.utils import StubAPIServer
+from tests.utils import get_sole_pool_statistics
+from twapi_connection import Connection
+
+_STUB_URL_PATH = '/foo'
+
+_WARM_UP_TIMEOUT = 5
+
+
+class TestResetAfterFork(object):
+
+    def test_inherited_connections_discarded(self):
+        with StubAPIServer() as stub_server:
+            connection = Connection(None, api_url=stub_server.api_url)
+            with connection:
+                connection.send_get_request(_STUB_URL_PATH)
+                connection.reset_after_fork()
+
+                eq_({}, connection.get_connection_pool_statistics())
+                connection.send_get_request(_STUB_URL_PATH)
+
+    def test_child_process(self):
+        with StubAPIServer() as stub_server:
+            connection = Connection(None, api_url=stub_server.api_url)
+            with connection:
+                connection.send_get_request(_STUB_URL_PATH)
+
+                exit_code = _run_in_child_process(
+                    _check_child_connection_pool,
+                    connection,
+                    )
+
+                connection.send_get_request(_STUB_URL_PATH)
+                statistics = get_sole_pool_statistics(connection)
+
+        eq_(0, exit_code)
+        # The connection of the parent process was not closed by the child
+        eq_(1, statistics.created_connection_count)
+        eq_(1, statistics.reused_connection_count)
+        eq_(3, len(stub_server.requests))
+
+    def test_warm_up_in_child_process(self):
+        with StubAPIServer() as stub_server:
+            connection = Connection(
+                None,
+                api_url=stub_server.api_url,
+                warm_up_after_fork=2,
+                )
+            with connection:
+                exit_code = _run_in_child_process(
+                    _check_child_warm_up,
+                    connection,
+                    )
+
+                parent_statistics = connection.get_connection_pool_statistics()
+
+        eq_(0, exit_code)
+        eq_({}, parent_statistics)
+
+    def test_exited_connection_in_child_process(self):
+        with StubAPIServer() as stub_server:
+            connection = Connection(
+                None,
+                api_url=stub_server.api_url,
+                warm_up_after_fork=2,
+                )
+            with connection:
+                connection.send_get_request(_STUB_URL_PATH)
+
+            exit_code = _run_in_child_process(
+                _check_child_exited_connection,
+                connection,
+                )
+
+        eq_(0, exit_code)
+        eq_(1, len(stub_server.requests))
+
+
+def _check_child_exited_connection(connection):
+    # Any connection being warmed up would have been opened by now
+    sleep(0.2)
+    eq_({}, connection.get_connection_pool_statistics())
+
+
+def _check_child_connection_pool(connection):
+    eq_({}, connection.get_connection_pool_statistics())
+    connection.send_get_request(_STUB_URL_PATH)
+
+
+def _check_child_warm_up(connection):
+    start_time = monotonic()
+    while monotonic() - start_time < _WARM_UP_TIMEOUT:
+        pool_statistics_by_origin = connection.get_connection_pool_statistics()
+        statistics = list(pool_statistics_by_origin.values())
+        if statistics and statistics[0].idle_connection_count == 2:
+            break
+        sleep(0.01)
+
+    statistics = get_sole_pool_statistics(connection)
+    eq_(2, statistics.created_connection_count)
+    eq_(2, statistics.idle_connection_count)
+
+
+def _run_in_child_process(function, *args):
+    multiprocessing_context = get_multiprocessing_context('fork')
+    process = multiprocessing_context.Process(target=function, args=args)
+    process.start()
+    process.join()
+    return process.exitcode
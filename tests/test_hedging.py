@@ -0,0 +1,352 @@
+##############################################################################
+#
+# Copyright (c) 2016, 2degrees Limited.
+# All Rights Reserved.
+#
+# This file is part of twapi-connection
+# <https://github.com/2degrees/twapi-connection>, which is subject to the
+# provisions of the BSD at
+# <http://dev.2degreesnetwork.com/p/2degrees-license.html>. A copy of the
+# license should accompany this distribution. THIS SOFTWARE IS PROVIDED "AS IS"
+# AND ANY AND ALL EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT
+# NOT LIMITED TO, THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST
+# INFRINGEMENT, AND FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event
+from threading import Lock
+from threading import Timer
+
+from nose.tools import assert_false
+from nose.tools import assert_is_none
+from nose.tools import assert_raises
+from nose.tools import eq_
+from nose.tools import ok_
+
+from tests.utils import StubAPIServer
+from tests.utils import make_json_response
+from twapi_connection import Connection
+from twapi_connection.hedging import HedgingPolicy
+from twapi_connection.hedging import HedgingStatistics
+from twapi_connection.hedging import call_with_hedging
+
+_STUB_URL_PATH = '/foo'
+
+_SLOW_CALL_TIMEOUT = 5
+
+
+class TestHedgingPolicy(object):
+
+    def test_too_few_latencies(self):
+        hedging_policy = HedgingPolicy(min_latency_sample_count=2)
+        hedging_policy.record_latency(1)
+
+        assert_is_none(hedging_policy.get_hedge_delay())
+
+    def test_no_latencies(self):
+        hedging_policy = HedgingPolicy(min_latency_sample_count=0)
+
+        assert_is_none(hedging_policy.get_hedge_delay())
+
+    def test_latency_percentile(self):
+        hedging_policy = HedgingPolicy(latency_percentile=95)
+        for latency in range(100, 0, -1):
+            hedging_policy.record_latency(latency)
+
+        eq_(95, hedging_policy.get_hedge_delay())
+
+    def test_min_hedge_delay(self):
+        hedging_policy = _make_hedging_policy(
+            latency=0.001,
+            min_hedge_delay=0.1,
+            )
+
+        eq_(0.1, hedging_policy.get_hedge_delay())
+
+    def test_latency_window(self):
+        hedging_policy = HedgingPolicy(
+            latency_window_size=2,
+            min_latency_sample_count=1,
+            )
+        for latency in (10, 1, 2):
+            hedging_policy.record_latency(latency)
+
+        eq_(2, hedging_policy.get_hedge_delay())
+
+    def test_hedge_ratio(self):
+        hedging_policy = HedgingPolicy(max_hedge_ratio=0.5)
+
+        hedging_policy.record_request()
+        assert_false(hedging_policy.acquire_hedge_permission())
+
+        hedging_policy.record_request()
+        ok_(hedging_policy.acquire_hedge_permission())
+        assert_false(hedging_policy.acquire_hedge_permission())
+
+    def test_hedge_burst(self):
+        hedging_policy = HedgingPolicy(max_hedge_ratio=1, max_hedge_burst=2)
+        for _ in range(5):
+            hedging_policy.record_request()
+
+        ok_(hedging_policy.acquire_hedge_permission())
+        ok_(hedging_policy.acquire_hedge_permission())
+        assert_false(hedging_policy.acquire_hedge_permission())
+
+    def test_statistics(self):
+        hedging_policy = HedgingPolicy(max_hedge_ratio=1)
+        hedging_policy.record_request()
+        hedging_policy.record_request()
+        hedging_policy.acquire_hedge_permission()
+        hedging_policy.record_hedge_win()
+
+        eq_(HedgingStatistics(2, 1, 1), hedging_policy.get_statistics())
+
+
+class TestHedgedCalls(object):
+
+    def test_fast_call(self):
+        hedging_policy = _make_hedging_policy()
+        function = _StubFunction(slow_call_numbers=())
+
+        result = self._call_with_hedging(function, hedging_policy)
+
+        eq_(1, result.call_number)
+        eq_(HedgingStatistics(1, 0, 0), hedging_policy.get_statistics())
+
+    def test_slow_call(self):
+        hedging_policy = _make_hedging_policy()
+        function = _StubFunction(slow_call_numbers=(1,))
+
+        result = self._call_with_hedging(function, hedging_policy)
+        function.release_slow_calls()
+
+        eq_(2, result.call_number)
+        eq_(HedgingStatistics(1, 1, 1), hedging_policy.get_statistics())
+        ok_(function.wait_for_results_closed(1))
+        assert_false(result.is_closed)
+
+    def test_slow_hedge(self):
+        hedging_policy = _make_hedging_policy()
+        function = _StubFunction(slow_call_numbers=(1, 2))
+
+        function.release_slow_calls(1, 0.2)
+        result = self._call_with_hedging(function, hedging_policy)
+        function.release_slow_calls(2)
+
+        eq_(1, result.call_number)
+        eq_(HedgingStatistics(1, 1, 0), hedging_policy.get_statistics())
+        ok_(function.wait_for_results_closed(1))
+
+    def test_hedge_budget_exhausted(self):
+        hedging_policy = _make_hedging_policy(max_hedge_ratio=0)
+        function = _StubFunction(slow_call_numbers=(1,))
+
+        function.release_slow_calls(1, 0.2)
+        result = self._call_with_hedging(function, hedging_policy)
+
+        eq_(1, result.call_number)
+        eq_(1, function.call_count)
+
+    def test_not_enough_latencies(self):
+        hedging_policy = HedgingPolicy(max_hedge_ratio=1)
+        function = _StubFunction(slow_call_numbers=(1,))
+
+        function.release_slow_calls(1, 0.2)
+        result = self._call_with_hedging(function, hedging_policy)
+
+        eq_(1, result.call_number)
+        eq_(1, function.call_count)
+
+    def test_first_call_failing_after_hedge(self):
+        hedging_policy = _make_hedging_policy()
+        function = _StubFunction(
+            slow_call_numbers=(1,),
+            failing_call_numbers=(1,),
+            )
+
+        function.release_slow_calls(1, 0.2)
+        result = self._call_with_hedging(function, hedging_policy)
+
+        eq_(2, result.call_number)
+
+    def test_both_calls_failing(self):
+        hedging_policy = _make_hedging_policy()
+        function = _StubFunction(
+            slow_call_numbers=(1,),
+            failing_call_numbers=(1, 2),
+            )
+
+        function.release_slow_calls(1, 0.2)
+        with assert_raises(_StubError) as context_manager:
+            self._call_with_hedging(function, hedging_policy)
+
+        eq_(1, context_manager.exception.args[0])
+
+    def test_latency_of_first_calls_recorded(self):
+        hedging_policy = HedgingPolicy(min_latency_sample_count=1)
+        function = _StubFunction(slow_call_numbers=())
+
+        self._call_with_hedging(function, hedging_policy)
+
+        ok_(hedging_policy.get_hedge_delay() is not None)
+
+    def test_saturated_executor(self):
+        hedging_policy = _make_hedging_policy(latency_window_size=1)
+        function = _StubFunction(slow_call_numbers=())
+
+        executor = ThreadPoolExecutor(1)
+        try:
+            executor_released = Event()
+            executor.submit(executor_released.wait, _SLOW_CALL_TIMEOUT)
+            _set_event_later(executor_released, 0.2)
+            result = call_with_hedging(function, hedging_policy, executor)
+        finally:
+            executor.shutdown(wait=False)
+
+        eq_(1, result.call_number)
+        eq_(1, function.call_count)
+        eq_(HedgingStatistics(1, 0, 0), hedging_policy.get_statistics())
+        # The time spent queued is not part of the latency
+        ok_(hedging_policy.get_hedge_delay() < 0.1)
+
+    @staticmethod
+    def _call_with_hedging(function, hedging_policy):
+        # The losing calls must not be waited for
+        executor = ThreadPoolExecutor(2)
+        try:
+            result = call_with_hedging(function, hedging_policy, executor)
+        finally:
+            executor.shutdown(wait=False)
+        return result
+
+
+class TestConnectionHedging(object):
+
+    def test_get_request(self):
+        hedging_policy = _make_hedging_policy()
+        response_maker = _SlowFirstResponseMaker()
+
+        with StubAPIServer(response_maker) as stub_server:
+            connection = Connection(
+                None,
+                api_url=stub_server.api_url,
+                hedging_policy=hedging_policy,
+                )
+            with connection:
+                response = connection.send_get_request(_STUB_URL_PATH)
+            response_maker.release_first_response()
+
+        eq_({'request_number': 2}, response.json())
+        eq_(HedgingStatistics(1, 1, 1), hedging_policy.get_statistics())
+
+    def test_post_request(self):
+        hedging_policy = _make_hedging_policy()
+        response_maker = _SlowFirstResponseMaker()
+
+        with StubAPIServer(response_maker) as stub_server:
+            connection = Connection(
+                None,
+                api_url=stub_server.api_url,
+                hedging_policy=hedging_policy,
+                )
+            response_maker.release_first_response(0.2)
+            with connection:
+                response = connection.send_post_request(_STUB_URL_PATH)
+
+        eq_({'request_number': 1}, response.json())
+        eq_(HedgingStatistics(0, 0, 0), hedging_policy.get_statistics())
+
+
+def _make_hedging_policy(latency=0.01, **kwargs):
+    kwargs.setdefault('max_hedge_ratio', 1)
+    hedging_policy = HedgingPolicy(min_latency_sample_count=1, **kwargs)
+    hedging_policy.record_latency(latency)
+    return hedging_policy
+
+
+class _StubError(Exception):
+    pass
+
+
+class _StubResult(object):
+
+    def __init__(self, call_number, results_closed):
+        super(_StubResult, self).__init__()
+
+        self.call_number = call_number
+        self.is_closed = False
+        self._results_closed = results_closed
+
+    def close(self):
+        self.is_closed = True
+        self._results_closed.set()
+
+
+class _StubFunction(object):
+
+    def __init__(self, slow_call_numbers, failing_call_numbers=()):
+        super(_StubFunction, self).__init__()
+
+        self._slow_call_events = \
+            {call_number: Event() for call_number in slow_call_numbers}
+        self._failing_call_numbers = failing_call_numbers
+
+        self._lock = Lock()
+        self.call_count = 0
+        self._results_closed = Event()
+
+    def __call__(self):
+        with self._lock:
+            self.call_count += 1
+            call_number = self.call_count
+
+        slow_call_event = self._slow_call_events.get(call_number)
+        if slow_call_event:
+            slow_call_event.wait(_SLOW_CALL_TIMEOUT)
+
+        if call_number in self._failing_call_numbers:
+            raise _StubError(call_number)
+        return _StubResult(call_number, self._results_closed)
+
+    def release_slow_calls(self, call_number=None, delay=0):
+        if call_number is None:
+            slow_call_events = self._slow_call_events.values()
+        else:
+            slow_call_events = [self._slow_call_events[call_number]]
+
+        for slow_call_event in slow_call_events:
+            _set_event_later(slow_call_event, delay)
+
+    def wait_for_results_closed(self, timeout):
+        return self._results_closed.wait(timeout)
+
+
+class _SlowFirstResponseMaker(object):
+
+    def __init__(self):
+        super(_SlowFirstResponseMaker, self).__init__()
+
+        self._lock = Lock()
+        self._request_count = 0
+        self._first_response_released = Event()
+
+    def __call__(self, request):
+        with self._lock:
+            self._request_count += 1
+            request_number = self._request_count
+
+        if request_number == 1:
+            self._first_response_released.wait(_SLOW_CALL_TIMEOUT)
+        return make_json_response({'request_number': request_number})
+
+    def release_first_response(self, delay=0):
+        _set_event_later(self._first_response_released, delay)
+
+
+def _set_event_later(event, delay):
+    if delay:
+        Timer(delay, event.set).start()
+    else:
+        event.set()
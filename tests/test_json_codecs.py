@@ -0,0 +1,241 @@
+##############################################################################
+#
+# Copyright (c) 2016, 2degrees Limited.
+# All Rights Reserved.
+#
+# This file is part of twapi-connection
+# <https://github.com/2degrees/twapi-connection>, which is subject to the
+# provisions of the BSD at
+# <http://dev.2degreesnetwork.com/p/2degrees-license.html>. A copy of the
+# license should accompany this distribution. THIS SOFTWARE IS PROVIDED "AS IS"
+# AND ANY AND ALL EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT
+# NOT LIMITED TO, THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST
+# INFRINGEMENT, AND FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+
+from json import dumps as json_serialize
+from unittest import SkipTest
+
+from nose.tools import assert_is_instance
+from nose.tools import eq_
+from requests.models import Response
+from requests.utils import get_encoding_from_headers
+
+from tests.utils import StubAPIServer
+from tests.utils import StubResponse
+from tests.utils import make_json_response
+from twapi_connection import Connection
+from twapi_connection.json_codecs import JSONResponse
+from twapi_connection.json_codecs import OrjsonCodec
+from twapi_connection.json_codecs import StandardJSONCodec
+from twapi_connection.json_codecs import get_default_json_codec
+from twapi_connection.json_codecs import orjson
+
+_STUB_URL_PATH = '/foo'
+
+_STUB_BODY_DESERIALIZATION = {'foo': ['bär', 1, 2.5, None, True]}
+
+
+class _JSONCodecTestCase(object):
+
+    json_codec_class = None
+
+    def test_serialization(self):
+        json_codec = self._make_json_codec()
+
+        serialization = json_codec.serialize(_STUB_BODY_DESERIALIZATION)
+
+        assert_is_instance(serialization, bytes)
+        eq_(
+            _STUB_BODY_DESERIALIZATION,
+            StandardJSONCodec().deserialize(serialization),
+            )
+
+    def test_serialization_with_non_string_keys(self):
+        json_codec = self._make_json_codec()
+
+        serialization = json_codec.serialize({1: 'foo'})
+
+        eq_({'1': 'foo'}, json_codec.deserialize(serialization))
+
+    def test_bytes_deserialization(self):
+        json_codec = self._make_json_codec()
+        serialization = json_serialize(_STUB_BODY_DESERIALIZATION)
+
+        deserialization = json_codec.deserialize(serialization.encode('utf-8'))
+
+        eq_(_STUB_BODY_DESERIALIZATION, deserialization)
+
+    def test_string_deserialization(self):
+        json_codec = self._make_json_codec()
+        serialization = json_serialize(_STUB_BODY_DESERIALIZATION)
+
+        eq_(_STUB_BODY_DESERIALIZATION, json_codec.deserialize(serialization))
+
+    def _make_json_codec(self):
+        return self.json_codec_class()
+
+
+class TestStandardJSONCodec(_JSONCodecTestCase):
+
+    json_codec_class = StandardJSONCodec
+
+
+class TestOrjsonCodec(_JSONCodecTestCase):
+
+    json_codec_class = OrjsonCodec
+
+    def _make_json_codec(self):
+        if orjson is None:
+            raise SkipTest('orjson is not installed')
+        return super(TestOrjsonCodec, self)._make_json_codec()
+
+
+def test_default_json_codec():
+    json_codec = get_default_json_codec()
+
+    if orjson is None:
+        assert_is_instance(json_codec, StandardJSONCodec)
+    else:
+        assert_is_instance(json_codec, OrjsonCodec)
+
+
+class TestJSONResponse(object):
+
+    def test_utf8_body(self):
+        response = _make_json_response(
+            json_serialize(_STUB_BODY_DESERIALIZATION).encode('utf-8'),
+            'application/json',
+            )
+
+        eq_(_STUB_BODY_DESERIALIZATION, response.json())
+
+    def test_body_in_declared_charset(self):
+        serialization = \
+            json_serialize(_STUB_BODY_DESERIALIZATION, ensure_ascii=False)
+        response = _make_json_response(
+            serialization.encode('latin-1'),
+            'application/json; charset=ISO-8859-1',
+            )
+
+        eq_(_STUB_BODY_DESERIALIZATION, response.json())
+
+    def test_unknown_charset(self):
+        response = _make_json_response(
+            json_serialize(_STUB_BODY_DESERIALIZATION).encode('utf-8'),
+            'application/json; charset=foo',
+            )
+
+        eq_(_STUB_BODY_DESERIALIZATION, response.json())
+
+    def test_body_without_charset_deserialized_from_bytes(self):
+        json_codec = _RecordingJSONCodec()
+        serialization = \
+            json_serialize(_STUB_BODY_DESERIALIZATION).encode('utf-8')
+        response = _make_json_response(
+            serialization,
+            'application/json',
+            json_codec,
+            )
+
+        response.json()
+
+        eq_([serialization], json_codec.serializations)
+
+    def test_body_deserialization(self):
+        json_codec = _RecordingJSONCodec()
+        response = _make_json_response(
+            json_serialize(_STUB_BODY_DESERIALIZATION).encode('utf-8'),
+            'application/json',
+            json_codec,
+            )
+
+        eq_(_STUB_BODY_DESERIALIZATION, response.body_deserialization)
+        eq_(_STUB_BODY_DESERIALIZATION, response.body_deserialization)
+        eq_(1, len(json_codec.serializations))
+
+    def test_null_body_deserialization(self):
+        json_codec = _RecordingJSONCodec()
+        response = _make_json_response(b'null', 'application/json', json_codec)
+
+        eq_(None, response.body_deserialization)
+        eq_(None, response.body_deserialization)
+        eq_(1, len(json_codec.serializations))
+
+    def test_json_kwargs(self):
+        response = _make_json_response(b'{"foo": 1.5}', 'application/json')
+
+        eq_({'foo': '1.5'}, response.json(parse_float=str))
+
+
+class TestConnectionJSONCodec(object):
+
+    def test_request_body(self):
+        json_codec = _RecordingJSONCodec()
+
+        with StubAPIServer(_make_body_echo_response) as stub_server:
+            connection = Connection(
+                None,
+                api_url=stub_server.api_url,
+                json_codec=json_codec,
+                )
+            connection.send_post_request(
+                _STUB_URL_PATH,
+                _STUB_BODY_DESERIALIZATION,
+                )
+
+        eq_([_STUB_BODY_DESERIALIZATION], json_codec.deserializations)
+        eq_(_STUB_BODY_DESERIALIZATION, stub_server.requests[0].json())
+
+    def test_response_body(self):
+        json_codec = _RecordingJSONCodec()
+
+        with StubAPIServer(_make_body_echo_response) as stub_server:
+            connection = Connection(
+                None,
+                api_url=stub_server.api_url,
+                json_codec=json_codec,
+                )
+            response = connection.send_post_request(
+                _STUB_URL_PATH,
+                _STUB_BODY_DESERIALIZATION,
+                )
+
+        eq_(_STUB_BODY_DESERIALIZATION, response.json())
+        eq_(1, len(json_codec.serializations))
+
+
+class _RecordingJSONCodec(StandardJSONCodec):
+
+    def __init__(self):
+        super(_RecordingJSONCodec, self).__init__()
+
+        self.deserializations = []
+        self.serializations = []
+
+    def serialize(self, deserialization):
+        self.deserializations.append(deserialization)
+        return super(_RecordingJSONCodec, self).serialize(deserialization)
+
+    def deserialize(self, serialization):
+        self.serializations.append(serialization)
+        return super(_RecordingJSONCodec, self).deserialize(serialization)
+
+
+def _make_body_echo_response(request):
+    if request.body:
+        response = make_json_response(request.json())
+    else:
+        response = StubResponse()
+    return response
+
+
+def _make_json_response(content, content_type, json_codec=None):
+    response = Response()
+    response.status_code = 200
+    response.headers['Content-Type'] = content_type
+    response.encoding = get_encoding_from_headers(response.headers)
+    response._content = content
+    json_codec = json_codec or get_default_json_codec()
+    return JSONResponse.init_from_response(response, json_codec)
@@ -0,0 +1,259 @@
+##############################################################################
+#
+# Copyright (c) 2016, 2degrees Limited.
+# All Rights Reserved.
+#
+# This file is part of twapi-connection
+# <https://github.com/2degrees/twapi-connection>, which is subject to the
+# provisions of the BSD at
+# <http://dev.2degreesnetwork.com/p/2degrees-license.html>. A copy of the
+# license should accompany this distribution. THIS SOFTWARE IS PROVIDED "AS IS"
+# AND ANY AND ALL EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT
+# NOT LIMITED TO, THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST
+# INFRINGEMENT, AND FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+
+from socket import socket
+from time import monotonic
+from time import sleep
+
+from nose.tools import assert_false
+from nose.tools import eq_
+from nose.tools import ok_
+from requests.sessions import Session
+
+from tests.utils import StubAPIServer
+from tests.utils import get_sole_pool_statistics
+from twapi_connection import Connection
+from twapi_connection.adapters import InstrumentedHTTPAdapter
+from twapi_connection.keep_alive import KeepAlivePolicy
+
+_STUB_URL_PATH = '/foo'
+
+_MAINTENANCE_TIMEOUT = 5
+
+
+class TestConnectionWarmUp(object):
+
+    def test_connections_opened(self):
+        with StubAPIServer() as stub_server:
+            connection = Connection(None, api_url=stub_server.api_url)
+            with connection:
+                idle_connection_count = connection.warm_up(3)
+                for _ in range(3):
+                    connection.send_get_request(_STUB_URL_PATH)
+
+                statistics = get_sole_pool_statistics(connection)
+
+        eq_(3, idle_connection_count)
+        eq_(3, statistics.created_connection_count)
+        eq_(3, statistics.reused_connection_count)
+        eq_(3, len(stub_server.requests))
+
+    def test_pool_size_exceeded(self):
+        with StubAPIServer() as stub_server:
+            connection = Connection(
+                None,
+                api_url=stub_server.api_url,
+                pool_maxsize=2,
+                pool_block=True,
+                )
+            with connection:
+                idle_connection_count = connection.warm_up(5)
+                statistics = get_sole_pool_statistics(connection)
+
+        eq_(2, idle_connection_count)
+        eq_(2, statistics.created_connection_count)
+
+    def test_idle_connections_kept(self):
+        with StubAPIServer() as stub_server:
+            connection = Connection(None, api_url=stub_server.api_url)
+            with connection:
+                connection.send_get_request(_STUB_URL_PATH)
+                idle_connection_count = connection.warm_up(2)
+                statistics = get_sole_pool_statistics(connection)
+
+        eq_(2, idle_connection_count)
+        eq_(2, statistics.created_connection_count)
+
+    def test_warm_connections_not_counted_as_reused(self):
+        with StubAPIServer() as stub_server:
+            connection = Connection(None, api_url=stub_server.api_url)
+            with connection:
+                connection.send_get_request(_STUB_URL_PATH)
+                for _ in range(5):
+                    connection.warm_up(2)
+                statistics = get_sole_pool_statistics(connection)
+
+        eq_(2, statistics.created_connection_count)
+        eq_(0, statistics.reused_connection_count)
+
+    def test_closed_pool(self):
+        with StubAPIServer() as stub_server:
+            session, http_adapter = _make_session()
+            with session:
+                connection_pool = http_adapter.poolmanager.connection_from_url(
+                    stub_server.api_url,
+                    )
+                connection_pool.close()
+                idle_connection_count = connection_pool.warm_up(2)
+
+        eq_(0, idle_connection_count)
+
+    def test_unreachable_api(self):
+        connection = Connection(None, api_url=_get_unreachable_api_url())
+        with connection:
+            idle_connection_count = connection.warm_up(2)
+            statistics = get_sole_pool_statistics(connection)
+
+        eq_(0, idle_connection_count)
+        eq_(0, statistics.created_connection_count)
+
+
+class TestKeepAlivePolicy(object):
+
+    def test_idle_connection(self):
+        keep_alive_policy = KeepAlivePolicy(max_idle_time=10)
+
+        assert_false(keep_alive_policy.is_connection_expired(100, 9))
+        ok_(keep_alive_policy.is_connection_expired(100, 10))
+
+    def test_old_connection(self):
+        keep_alive_policy = \
+            KeepAlivePolicy(max_idle_time=10, max_connection_age=60)
+
+        assert_false(keep_alive_policy.is_connection_expired(59, 0))
+        ok_(keep_alive_policy.is_connection_expired(60, 0))
+
+
+class TestExpiredConnectionClosure(object):
+
+    def test_idle_connection(self):
+        keep_alive_policy = KeepAlivePolicy(max_idle_time=0)
+        closed_connection_count, statistics = \
+            self._close_expired_connections(keep_alive_policy)
+
+        eq_(1, closed_connection_count)
+        eq_(1, statistics.discarded_connection_count)
+        eq_(0, statistics.idle_connection_count)
+
+    def test_recently_used_connection(self):
+        keep_alive_policy = KeepAlivePolicy(max_idle_time=60)
+        closed_connection_count, statistics = \
+            self._close_expired_connections(keep_alive_policy)
+
+        eq_(0, closed_connection_count)
+        eq_(1, statistics.idle_connection_count)
+
+    def test_old_connection(self):
+        keep_alive_policy = \
+            KeepAlivePolicy(max_idle_time=60, max_connection_age=0)
+        closed_connection_count, statistics = \
+            self._close_expired_connections(keep_alive_policy)
+
+        eq_(1, closed_connection_count)
+        eq_(0, statistics.idle_connection_count)
+
+    def test_closed_connection_reopened(self):
+        with StubAPIServer() as stub_server:
+            session, http_adapter = _make_session()
+            with session:
+                url = stub_server.api_url + _STUB_URL_PATH
+                session.get(url)
+                http_adapter.close_expired_connections(
+                    KeepAlivePolicy(max_idle_time=0),
+                    )
+                response = session.get(url)
+                statistics = _get_sole_adapter_pool_statistics(http_adapter)
+
+        eq_(200, response.status_code)
+        eq_(2, statistics.created_connection_count)
+
+    @staticmethod
+    def _close_expired_connections(keep_alive_policy):
+        with StubAPIServer() as stub_server:
+            session, http_adapter = _make_session()
+            with session:
+                session.get(stub_server.api_url + _STUB_URL_PATH)
+                closed_connection_count = \
+                    http_adapter.close_expired_connections(keep_alive_policy)
+                statistics = _get_sole_adapter_pool_statistics(http_adapter)
+        return closed_connection_count, statistics
+
+
+class TestConnectionKeepAlive(object):
+
+    def test_idle_connections_closed(self):
+        keep_alive_policy = \
+            KeepAlivePolicy(max_idle_time=0, check_interval=0.01)
+
+        with StubAPIServer() as stub_server:
+            connection = Connection(
+                None,
+                api_url=stub_server.api_url,
+                keep_alive_policy=keep_alive_policy,
+                )
+            with connection:
+                connection.send_get_request(_STUB_URL_PATH)
+                statistics = _wait_for_pool_statistics(
+                    connection,
+                    lambda statistics: statistics.idle_connection_count == 0,
+                    )
+
+        eq_(1, statistics.discarded_connection_count)
+
+    def test_idle_connections_kept_open(self):
+        keep_alive_policy = KeepAlivePolicy(
+            min_idle_connection_count=2,
+            check_interval=0.01,
+            )
+
+        with StubAPIServer() as stub_server:
+            connection = Connection(
+                None,
+                api_url=stub_server.api_url,
+                keep_alive_policy=keep_alive_policy,
+                )
+            with connection:
+                statistics = _wait_for_pool_statistics(
+                    connection,
+                    lambda statistics: statistics.idle_connection_count == 2,
+                    )
+
+        eq_(2, statistics.created_connection_count)
+        eq_(0, len(stub_server.requests))
+
+
+def _make_session():
+    session = Session()
+    http_adapter = InstrumentedHTTPAdapter()
+    session.mount('http://', http_adapter)
+    return session, http_adapter
+
+
+def _wait_for_pool_statistics(connection, condition):
+    start_time = monotonic()
+    while monotonic() - start_time < _MAINTENANCE_TIMEOUT:
+        pool_statistics_by_origin = connection.get_connection_pool_statistics()
+        statistics = list(pool_statistics_by_origin.values())
+        if statistics and condition(statistics[0]):
+            break
+        sleep(0.01)
+    return get_sole_pool_statistics(connection)
+
+
+def _get_sole_adapter_pool_statistics(http_adapter):
+    pool_statistics_by_origin = http_adapter.get_connection_pool_statistics()
+    eq_(1, len(pool_statistics_by_origin))
+    return list(pool_statistics_by_origin.values())[0]
+
+
+def _get_unreachable_api_url():
+    # The port is released without being listened on, so connections to it
+    # are refused
+    unused_socket = socket()
+    unused_socket.bind(('127.0.0.1', 0))
+    port = unused_socket.getsockname()[1]
+    unused_socket.close()
+    return 'http://127.0.0.1:{}/api'.format(port)
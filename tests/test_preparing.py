@@ -0,0 +1,247 @@
+##############################################################################
+#
+# Copyright (c) 2016, 2degrees Limited.
+# All Rights Reserved.
+#
+# This file is part of twapi-connection
+# <https://github.com/2degrees/twapi-connection>, which is subject to the
+# provisions of the BSD at
+# <http://dev.2degreesnetwork.com/p/2degrees-license.html>. A copy of the
+# license should accompany this distribution. THIS SOFTWARE IS PROVIDED "AS IS"
+# AND ANY AND ALL EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT
+# NOT LIMITED TO, THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST
+# INFRINGEMENT, AND FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+
+from base64 import b64decode
+from os import environ
+from unittest.mock import patch
+
+from nose.tools import assert_not_in
+from nose.tools import eq_
+from requests.auth import HTTPBasicAuth
+from requests.models import Request
+from requests.sessions import Session
+
+from tests.utils import StubAPIServer
+from tests.utils import StubResponse
+from tests.utils import make_echo_response
+from twapi_connection import Connection
+from twapi_connection.preparing import PreparedRequestFactory
+
+_STUB_URL = 'http://example.com/foo'
+
+_STUB_AUTH = HTTPBasicAuth('username', 'password')
+
+_STUB_PROXY_URL = 'http://proxy.example.com:3128'
+
+
+class TestPreparedRequestFactory(object):
+
+    def test_get_request(self):
+        self._assert_prepared_request_equivalent('GET', _STUB_URL)
+
+    def test_query_string_args(self):
+        self._assert_prepared_request_equivalent(
+            'GET',
+            _STUB_URL,
+            query_string_args={'foo': 'bär', 'baz': ['1', '2']},
+            )
+
+    def test_query_string_args_added_to_existing_ones(self):
+        self._assert_prepared_request_equivalent(
+            'GET',
+            _STUB_URL + '?foo=bar',
+            query_string_args={'baz': '1'},
+            )
+
+    def test_request_body(self):
+        self._assert_prepared_request_equivalent(
+            'POST',
+            _STUB_URL,
+            headers={'content-type': 'application/json'},
+            body=b'{"foo": "bar"}',
+            )
+
+    def test_streamed_request_body(self):
+        session = Session()
+        factory = PreparedRequestFactory(session, _STUB_AUTH)
+
+        prepared_request, _ = factory.make_prepared_request(
+            'PUT',
+            _STUB_URL,
+            body=iter([b'[]']),
+            )
+
+        eq_('chunked', prepared_request.headers['Transfer-Encoding'])
+        assert_not_in('Content-Length', prepared_request.headers)
+
+    def test_template_reused(self):
+        session = Session()
+        factory = PreparedRequestFactory(session, _STUB_AUTH)
+
+        factory.make_prepared_request('GET', _STUB_URL, {'foo': '1'})
+        factory.make_prepared_request('GET', _STUB_URL, {'foo': '2'})
+        prepared_request, _ = factory.make_prepared_request(
+            'POST',
+            _STUB_URL,
+            body=b'{}',
+            )
+
+        eq_(2, factory.get_template_count())
+        eq_('2', prepared_request.headers['Content-Length'])
+
+    def test_template_unchanged_by_requests(self):
+        session = Session()
+        factory = PreparedRequestFactory(session, _HookRegisteringAuth())
+
+        for _ in range(2):
+            prepared_request, _ = factory.make_prepared_request(
+                'GET',
+                _STUB_URL,
+                {'foo': 'bar'},
+                {'X-Foo': 'bar'},
+                )
+
+        eq_(1, len(prepared_request.hooks['response']))
+        eq_(_STUB_URL + '?foo=bar', prepared_request.url)
+
+        prepared_request, _ = factory.make_prepared_request('GET', _STUB_URL)
+
+        eq_(_STUB_URL, prepared_request.url)
+        assert_not_in('X-Foo', prepared_request.headers)
+
+    def test_least_recently_used_templates_discarded(self):
+        session = Session()
+        factory = PreparedRequestFactory(session, None, 2)
+
+        factory.make_prepared_request('GET', _STUB_URL + '/1')
+        factory.make_prepared_request('GET', _STUB_URL + '/2')
+        factory.make_prepared_request('GET', _STUB_URL + '/1')
+        factory.make_prepared_request('GET', _STUB_URL + '/3')
+
+        eq_(2, factory.get_template_count())
+
+    def test_environment_read_once_per_template(self):
+        session = Session()
+        factory = PreparedRequestFactory(session, None)
+
+        with patch.dict(environ, {'HTTP_PROXY': _STUB_PROXY_URL}):
+            _, send_kwargs = factory.make_prepared_request('GET', _STUB_URL)
+        eq_(_STUB_PROXY_URL, send_kwargs['proxies']['http'])
+
+        with patch.dict(environ, {'HTTP_PROXY': ''}):
+            _, send_kwargs = factory.make_prepared_request('GET', _STUB_URL)
+        eq_(_STUB_PROXY_URL, send_kwargs['proxies']['http'])
+        assert_not_in('stream', send_kwargs)
+
+    @staticmethod
+    def _assert_prepared_request_equivalent(
+        method,
+        url,
+        query_string_args=None,
+        headers=None,
+        body=None,
+        ):
+        session = Session()
+        session.headers['User-Agent'] = 'twapi-connection'
+        factory = PreparedRequestFactory(session, _STUB_AUTH)
+
+        prepared_request, send_kwargs = factory.make_prepared_request(
+            method,
+            url,
+            query_string_args,
+            headers,
+            body,
+            )
+
+        request = Request(
+            method,
+            url,
+            headers=headers,
+            data=body or {},
+            params=query_string_args or {},
+            auth=_STUB_AUTH,
+            )
+        expected_prepared_request = session.prepare_request(request)
+        expected_send_kwargs = session.merge_environment_settings(
+            expected_prepared_request.url,
+            {},
+            None,
+            None,
+            None,
+            )
+        del expected_send_kwargs['stream']
+
+        eq_(expected_prepared_request.method, prepared_request.method)
+        eq_(expected_prepared_request.url, prepared_request.url)
+        eq_(expected_prepared_request.headers, prepared_request.headers)
+        eq_(expected_prepared_request.body, prepared_request.body)
+        eq_(expected_send_kwargs, send_kwargs)
+
+
+class TestConnectionPreparedRequestReuse(object):
+
+    def test_get_request(self):
+        with StubAPIServer(make_echo_response) as stub_server:
+            connection = self._make_connection(stub_server)
+            for foo in ('1', '2'):
+                response = \
+                    connection.send_get_request('/foo', {'foo': foo})
+
+                eq_({'foo': foo}, response.json()['query_string_args'])
+
+        request = stub_server.requests[-1]
+        eq_(_STUB_AUTH.username, _get_basic_auth_username(request))
+
+    def test_post_request(self):
+        with StubAPIServer() as stub_server:
+            connection = self._make_connection(stub_server)
+            connection.send_post_request('/foo', {'foo': 'bar'})
+
+        request = stub_server.requests[0]
+        eq_({'foo': 'bar'}, request.json())
+        eq_('application/json', request.headers['Content-Type'])
+
+    def test_redirect(self):
+        with StubAPIServer(_make_redirect_response) as stub_server:
+            connection = self._make_connection(stub_server)
+            response = connection.send_get_request('/foo')
+
+        eq_(200, response.status_code)
+        eq_('/new', response.json()['path'])
+        eq_(['/foo', '/new'], [r.path for r in stub_server.requests])
+
+    @staticmethod
+    def _make_connection(stub_server):
+        return Connection(
+            _STUB_AUTH,
+            api_url=stub_server.api_url,
+            reuse_prepared_requests=True,
+            )
+
+
+class _HookRegisteringAuth(object):
+
+    def __call__(self, prepared_request):
+        prepared_request.register_hook('response', _return_response)
+        return prepared_request
+
+
+def _return_response(response, *args, **kwargs):
+    return response
+
+
+def _make_redirect_response(request):
+    if request.path == '/new':
+        response = make_echo_response(request)
+    else:
+        response = StubResponse(301, headers={'Location': '/new'})
+    return response
+
+
+def _get_basic_auth_username(request):
+    authorization_header_value = request.headers['Authorization']
+    credentials = b64decode(authorization_header_value.split(' ')[1])
+    return credentials.decode('utf-8').split(':')[0]
@@ -0,0 +1,243 @@
+##############################################################################
+#
+# Copyright (c) 2016, 2degrees Limited.
+# All Rights Reserved.
+#
+# This file is part of twapi-connection
+# <https://github.com/2degrees/twapi-connection>, which is subject to the
+# provisions of the BSD at
+# <http://dev.2degreesnetwork.com/p/2degrees-license.html>. A copy of the
+# license should accompany this distribution. THIS SOFTWARE IS PROVIDED "AS IS"
+# AND ANY AND ALL EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT
+# NOT LIMITED TO, THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST
+# INFRINGEMENT, AND FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+
+from asyncio import gather
+from asyncio import new_event_loop
+from threading import Thread
+from time import monotonic
+from time import time
+
+from nose.tools import assert_almost_equal
+from nose.tools import assert_false
+from nose.tools import assert_raises
+from nose.tools import eq_
+from nose.tools import ok_
+from requests.models import Response
+
+from tests.utils import StubAPIServer
+from tests.utils import make_echo_response
+from twapi_connection import Connection
+from twapi_connection.exc import DeadlineExceededError
+from twapi_connection.rate_limiting import TokenBucketRateLimiter
+
+_STUB_URL_PATH = '/foo'
+
+
+class TestTokenBucketRateLimiter(object):
+
+    def test_burst(self):
+        rate_limiter = TokenBucketRateLimiter(1, 3)
+
+        elapsed_time = _time_acquisitions(rate_limiter, 3)
+
+        ok_(elapsed_time < 0.5)
+
+    def test_rate(self):
+        rate_limiter = TokenBucketRateLimiter(20)
+
+        elapsed_time = _time_acquisitions(rate_limiter, 4)
+
+        ok_(0.15 <= elapsed_time)
+
+    def test_concurrent_acquisitions(self):
+        rate_limiter = TokenBucketRateLimiter(20)
+        threads = [Thread(target=rate_limiter.acquire) for _ in range(4)]
+
+        start_time = monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed_time = monotonic() - start_time
+
+        ok_(0.15 <= elapsed_time)
+
+    def test_acquisition_timeout(self):
+        rate_limiter = TokenBucketRateLimiter(1)
+        rate_limiter.acquire()
+
+        start_time = monotonic()
+        is_acquired = rate_limiter.acquire(0.5)
+        elapsed_time = monotonic() - start_time
+
+        assert_false(is_acquired)
+        ok_(elapsed_time < 0.5)
+        # The token was not reserved
+        ok_(rate_limiter.acquire(1.5))
+
+    def test_async_acquisitions(self):
+        rate_limiter = TokenBucketRateLimiter(20)
+
+        async def acquire_concurrently():
+            await gather(*[rate_limiter.acquire_async() for _ in range(4)])
+
+        event_loop = new_event_loop()
+        try:
+            start_time = monotonic()
+            event_loop.run_until_complete(acquire_concurrently())
+            elapsed_time = monotonic() - start_time
+        finally:
+            event_loop.close()
+
+        ok_(0.15 <= elapsed_time)
+
+    def test_deadline(self):
+        rate_limiter = TokenBucketRateLimiter(0.1)
+
+        with StubAPIServer() as stub_server:
+            connection = Connection(
+                None,
+                api_url=stub_server.api_url,
+                rate_limiter=rate_limiter,
+                )
+            connection.send_get_request(_STUB_URL_PATH)
+            start_time = monotonic()
+            with assert_raises(DeadlineExceededError):
+                connection.send_get_request(_STUB_URL_PATH, deadline=0.5)
+            elapsed_time = monotonic() - start_time
+
+        ok_(elapsed_time < 0.5)
+        eq_(1, len(stub_server.requests))
+
+    def test_rate_limit_headers(self):
+        rate_limiter = TokenBucketRateLimiter(100)
+
+        rate_limiter.update_from_response(
+            _make_response(
+                {'RateLimit-Remaining': '10', 'RateLimit-Reset': '5'},
+                ),
+            )
+
+        eq_(2, rate_limiter.get_rate())
+
+    def test_prefixed_rate_limit_headers(self):
+        rate_limiter = TokenBucketRateLimiter(100)
+
+        rate_limiter.update_from_response(
+            _make_response(
+                {'X-RateLimit-Remaining': '10', 'X-RateLimit-Reset': '5'},
+                ),
+            )
+
+        eq_(2, rate_limiter.get_rate())
+
+    def test_reset_timestamp(self):
+        rate_limiter = TokenBucketRateLimiter(100)
+        reset_timestamp = str(int(time() + 10))
+
+        rate_limiter.update_from_response(
+            _make_response(
+                {
+                    'RateLimit-Remaining': '10',
+                    'RateLimit-Reset': reset_timestamp,
+                    },
+                ),
+            )
+
+        assert_almost_equal(1, rate_limiter.get_rate(), delta=0.2)
+
+    def test_exhausted_quota(self):
+        rate_limiter = TokenBucketRateLimiter(100, 10)
+
+        rate_limiter.update_from_response(
+            _make_response(
+                {'RateLimit-Remaining': '0', 'RateLimit-Reset': '1'},
+                ),
+            )
+
+        eq_(1, rate_limiter.get_rate())
+
+    def test_rate_above_configured_rate(self):
+        rate_limiter = TokenBucketRateLimiter(1)
+
+        rate_limiter.update_from_response(
+            _make_response(
+                {'RateLimit-Remaining': '10', 'RateLimit-Reset': '1'},
+                ),
+            )
+
+        eq_(1, rate_limiter.get_rate())
+
+    def test_configured_rate_after_reset(self):
+        rate_limiter = TokenBucketRateLimiter(100)
+
+        rate_limiter.update_from_response(
+            _make_response(
+                {'RateLimit-Remaining': '1', 'RateLimit-Reset': '0.05'},
+                ),
+            )
+        _time_acquisitions(rate_limiter, 2)
+
+        eq_(100, rate_limiter.get_rate())
+
+    def test_no_rate_limit_headers(self):
+        rate_limiter = TokenBucketRateLimiter(100)
+
+        rate_limiter.update_from_response(_make_response({}))
+
+        eq_(100, rate_limiter.get_rate())
+
+
+class TestRateLimitedConnection(object):
+
+    def test_requests(self):
+        rate_limiter = TokenBucketRateLimiter(20)
+
+        with StubAPIServer() as stub_server:
+            connection = Connection(
+                None,
+                api_url=stub_server.api_url,
+                rate_limiter=rate_limiter,
+                )
+            start_time = monotonic()
+            for _ in range(4):
+                connection.send_get_request(_STUB_URL_PATH)
+            elapsed_time = monotonic() - start_time
+
+        ok_(0.15 <= elapsed_time)
+
+    def test_rate_limit_headers(self):
+        rate_limiter = TokenBucketRateLimiter(100)
+
+        def make_response(request):
+            response = make_echo_response(request)
+            response.headers['X-RateLimit-Remaining'] = '30'
+            response.headers['X-RateLimit-Reset'] = '60'
+            return response
+
+        with StubAPIServer(make_response) as stub_server:
+            connection = Connection(
+                None,
+                api_url=stub_server.api_url,
+                rate_limiter=rate_limiter,
+                )
+            connection.send_get_request(_STUB_URL_PATH)
+
+        eq_(0.5, rate_limiter.get_rate())
+
+
+def _time_acquisitions(rate_limiter, acquisition_count):
+    start_time = monotonic()
+    for _ in range(acquisition_count):
+        rate_limiter.acquire()
+    return monotonic() - start_time
+
+
+def _make_response(headers):
+    response = Response()
+    response.status_code = 200
+    response.headers.update(headers)
+    return response
@@ -0,0 +1,213 @@
+##############################################################################
+#
+# Copyright (c) 2016, 2degrees Limited.
+# All Rights Reserved.
+#
+# This file is part of twapi-connection
+# <https://github.com/2degrees/twapi-connection>, which is subject to the
+# provisions of the BSD at
+# <http://dev.2degreesnetwork.com/p/2degrees-license.html>. A copy of the
+# license should accompany this distribution. THIS SOFTWARE IS PROVIDED "AS IS"
+# AND ANY AND ALL EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT
+# NOT LIMITED TO, THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST
+# INFRINGEMENT, AND FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+
+from socket import AF_INET
+from socket import EAI_NONAME
+from socket import IPPROTO_TCP
+from socket import SOCK_STREAM
+from socket import gaierror
+
+from nose.tools import assert_is_none
+from nose.tools import assert_raises
+from nose.tools import eq_
+from requests.exceptions import ConnectionError as RequestsConnectionError
+
+from tests.utils import StubAPIServer
+from twapi_connection import Connection
+from twapi_connection.resolving import DNSCache
+from twapi_connection.resolving import DNSCacheStatistics
+
+_STUB_HOST = 'api.example.com'
+
+_STUB_PORT = 443
+
+_STUB_URL_PATH = '/foo'
+
+
+class TestDNSCache(object):
+
+    def test_addresses_cached(self):
+        resolver = _StubResolver(['192.0.2.1'])
+        dns_cache = DNSCache(resolver=resolver)
+
+        for _ in range(2):
+            addresses = dns_cache.resolve(_STUB_HOST, _STUB_PORT)
+
+        eq_(['192.0.2.1'], _get_ip_addresses(addresses))
+        eq_(1, resolver.call_count)
+        eq_(DNSCacheStatistics(1, 0, 1), dns_cache.get_statistics())
+
+    def test_expired_addresses(self):
+        resolver = _StubResolver(['192.0.2.1'])
+        dns_cache = DNSCache(ttl=0, resolver=resolver)
+
+        for _ in range(2):
+            dns_cache.resolve(_STUB_HOST, _STUB_PORT)
+
+        eq_(2, resolver.call_count)
+        eq_(DNSCacheStatistics(0, 0, 2), dns_cache.get_statistics())
+
+    def test_addresses_cached_by_port(self):
+        resolver = _StubResolver(['192.0.2.1'])
+        dns_cache = DNSCache(resolver=resolver)
+
+        dns_cache.resolve(_STUB_HOST, 80)
+        dns_cache.resolve(_STUB_HOST, 443)
+
+        eq_(2, resolver.call_count)
+
+    def test_failure_cached(self):
+        resolver = _StubResolver([])
+        dns_cache = DNSCache(resolver=resolver)
+
+        for _ in range(2):
+            with assert_raises(gaierror) as context_manager:
+                dns_cache.resolve(_STUB_HOST, _STUB_PORT)
+
+        eq_(EAI_NONAME, context_manager.exception.args[0])
+        eq_(1, resolver.call_count)
+        eq_(DNSCacheStatistics(1, 1, 1), dns_cache.get_statistics())
+
+    def test_expired_failure(self):
+        resolver = _StubResolver([])
+        dns_cache = DNSCache(negative_ttl=0, resolver=resolver)
+
+        for _ in range(2):
+            with assert_raises(gaierror):
+                dns_cache.resolve(_STUB_HOST, _STUB_PORT)
+
+        eq_(2, resolver.call_count)
+
+    def test_round_robin(self):
+        resolver = _StubResolver(['192.0.2.1', '192.0.2.2', '192.0.2.3'])
+        dns_cache = DNSCache(resolver=resolver)
+
+        first_addresses = [
+            _get_ip_addresses(dns_cache.resolve(_STUB_HOST, _STUB_PORT))[0]
+            for _ in range(4)
+            ]
+
+        eq_(
+            ['192.0.2.1', '192.0.2.2', '192.0.2.3', '192.0.2.1'],
+            first_addresses,
+            )
+
+    def test_ip_address(self):
+        resolver = _StubResolver(['192.0.2.1'])
+        dns_cache = DNSCache(resolver=resolver)
+
+        for _ in range(2):
+            dns_cache.resolve('192.0.2.1', _STUB_PORT)
+
+        eq_(2, resolver.call_count)
+        eq_(DNSCacheStatistics(0, 0, 0), dns_cache.get_statistics())
+
+    def test_hit_rate(self):
+        dns_cache = DNSCache(resolver=_StubResolver(['192.0.2.1']))
+        assert_is_none(dns_cache.get_hit_rate())
+
+        for _ in range(4):
+            dns_cache.resolve(_STUB_HOST, _STUB_PORT)
+
+        eq_(0.75, dns_cache.get_hit_rate())
+
+    def test_clear(self):
+        resolver = _StubResolver(['192.0.2.1'])
+        dns_cache = DNSCache(resolver=resolver)
+
+        dns_cache.resolve(_STUB_HOST, _STUB_PORT)
+        dns_cache.clear()
+        dns_cache.resolve(_STUB_HOST, _STUB_PORT)
+
+        eq_(2, resolver.call_count)
+
+
+class TestConnectionDNSCache(object):
+
+    def test_host_resolved_once(self):
+        resolver = _StubResolver(['127.0.0.1'])
+        dns_cache = DNSCache(resolver=resolver)
+
+        with StubAPIServer() as stub_server:
+            api_url = _replace_host(stub_server.api_url)
+            for _ in range(2):
+                connection = \
+                    Connection(None, api_url=api_url, dns_cache=dns_cache)
+                with connection:
+                    response = connection.send_get_request(_STUB_URL_PATH)
+
+        eq_(200, response.status_code)
+        eq_(1, resolver.call_count)
+        eq_(DNSCacheStatistics(1, 0, 1), dns_cache.get_statistics())
+
+    def test_unreachable_address_skipped(self):
+        # The stub server only listens on 127.0.0.1
+        resolver = _StubResolver(['127.0.0.2', '127.0.0.1'])
+        dns_cache = DNSCache(resolver=resolver)
+
+        with StubAPIServer() as stub_server:
+            api_url = _replace_host(stub_server.api_url)
+            connection = Connection(None, api_url=api_url, dns_cache=dns_cache)
+            with connection:
+                response = connection.send_get_request(_STUB_URL_PATH)
+
+        eq_(200, response.status_code)
+
+    def test_unresolvable_host(self):
+        resolver = _StubResolver([])
+        dns_cache = DNSCache(resolver=resolver)
+
+        connection = Connection(
+            None,
+            api_url='http://{}/api'.format(_STUB_HOST),
+            dns_cache=dns_cache,
+            )
+        with connection:
+            with assert_raises(RequestsConnectionError):
+                connection.send_get_request(_STUB_URL_PATH)
+
+        # Connection attempts are retried, but the host is only looked up once
+        eq_(1, resolver.call_count)
+
+
+class _StubResolver(object):
+
+    def __init__(self, ip_addresses):
+        super(_StubResolver, self).__init__()
+
+        self._ip_addresses = ip_addresses
+
+        self.call_count = 0
+
+    def __call__(self, host, port, family=0, type=0):
+        self.call_count += 1
+
+        if not self._ip_addresses:
+            raise gaierror(EAI_NONAME, 'Name or service not known')
+
+        addresses = [
+            (AF_INET, SOCK_STREAM, IPPROTO_TCP, '', (ip_address, port))
+            for ip_address in self._ip_addresses
+            ]
+        return addresses
+
+
+def _get_ip_addresses(addresses):
+    return [address[4][0] for address in addresses]
+
+
+def _replace_host(url):
+    return url.replace('127.0.0.1', _STUB_HOST)
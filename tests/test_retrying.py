@@ -0,0 +1,267 @@
+##############################################################################
+#
+# Copyright (c) 2016, 2degrees Limited.
+# All Rights Reserved.
+#
+# This file is part of twapi-connection
+# <https://github.com/2degrees/twapi-connection>, which is subject to the
+# provisions of the BSD at
+# <http://dev.2degreesnetwork.com/p/2degrees-license.html>. A copy of the
+# license should accompany this distribution. THIS SOFTWARE IS PROVIDED "AS IS"
+# AND ANY AND ALL EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT
+# NOT LIMITED TO, THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST
+# INFRINGEMENT, AND FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+
+from email.utils import formatdate
+from time import time
+
+from nose.tools import assert_almost_equal
+from nose.tools import assert_raises
+from nose.tools import eq_
+from nose.tools import ok_
+from requests.models import Response
+
+from tests.utils import StubAPIServer
+from tests.utils import StubResponse
+from tests.utils import make_echo_response
+from twapi_connection import Connection
+from twapi_connection.exc import ServerError
+from twapi_connection.exc import TooManyRequestsError
+from twapi_connection.retrying import RetryPolicy
+from twapi_connection.retrying import get_retry_after
+
+_STUB_URL_PATH = '/foo'
+
+_BACKOFF_FACTOR = 0.01
+
+
+class TestRetryPolicy(object):
+
+    def test_retriable_status_code(self):
+        retry_policy = RetryPolicy(backoff_factor=_BACKOFF_FACTOR)
+
+        retry_delay = _get_retry_delay(retry_policy, 'GET', 503, 1)
+
+        ok_(0 <= retry_delay <= _BACKOFF_FACTOR)
+
+    def test_non_retriable_status_code(self):
+        retry_policy = RetryPolicy()
+
+        eq_(None, _get_retry_delay(retry_policy, 'GET', 500, 1))
+
+    def test_non_idempotent_http_method(self):
+        retry_policy = RetryPolicy()
+
+        eq_(None, _get_retry_delay(retry_policy, 'POST', 503, 1))
+
+    def test_non_idempotent_http_method_opted_in(self):
+        retry_policy = RetryPolicy(retriable_http_methods=['POST'])
+
+        retry_delay = _get_retry_delay(retry_policy, 'POST', 503, 1)
+
+        ok_(retry_delay is not None)
+
+    def test_exponential_backoff(self):
+        retry_policy = RetryPolicy(
+            max_attempt_count=5,
+            backoff_factor=1,
+            max_backoff=100,
+            )
+
+        retry_delays = [
+            _get_retry_delay(retry_policy, 'GET', 503, 3)
+            for _ in range(100)
+            ]
+
+        ok_(all(0 <= retry_delay <= 4 for retry_delay in retry_delays))
+        ok_(any(1 < retry_delay for retry_delay in retry_delays))
+
+    def test_max_backoff(self):
+        retry_policy = RetryPolicy(
+            max_attempt_count=20,
+            backoff_factor=1,
+            max_backoff=2,
+            )
+
+        retry_delay = _get_retry_delay(retry_policy, 'GET', 503, 10)
+
+        ok_(retry_delay <= 2)
+
+    def test_max_attempt_count(self):
+        retry_policy = RetryPolicy(max_attempt_count=2)
+
+        ok_(_get_retry_delay(retry_policy, 'GET', 503, 1) is not None)
+        eq_(None, _get_retry_delay(retry_policy, 'GET', 503, 2))
+
+    def test_max_attempt_count_by_status_code(self):
+        retry_policy = RetryPolicy(
+            max_attempt_count=5,
+            max_attempt_count_by_status_code={502: 1},
+            )
+
+        eq_(None, _get_retry_delay(retry_policy, 'GET', 502, 1))
+        ok_(_get_retry_delay(retry_policy, 'GET', 503, 1) is not None)
+
+    def test_max_attempt_count_by_http_method(self):
+        retry_policy = RetryPolicy(
+            max_attempt_count=5,
+            max_attempt_count_by_http_method={'PUT': 1},
+            )
+
+        eq_(None, _get_retry_delay(retry_policy, 'PUT', 503, 1))
+        ok_(_get_retry_delay(retry_policy, 'GET', 503, 1) is not None)
+
+    def test_retry_after(self):
+        retry_policy = RetryPolicy()
+        response = _make_response(429, {'Retry-After': '2'})
+
+        eq_(2, retry_policy.get_retry_delay('GET', response, 1))
+
+    def test_retry_after_exceeding_max_backoff(self):
+        retry_policy = RetryPolicy(max_backoff=1)
+        response = _make_response(429, {'Retry-After': '2'})
+
+        eq_(None, retry_policy.get_retry_delay('GET', response, 1))
+
+
+class TestRetryAfter(object):
+
+    def test_seconds(self):
+        eq_(120, get_retry_after(_make_response(429, {'Retry-After': '120'})))
+
+    def test_http_date(self):
+        retry_after_header_value = formatdate(time() + 60, usegmt=True)
+        response = \
+            _make_response(429, {'Retry-After': retry_after_header_value})
+
+        assert_almost_equal(60, get_retry_after(response), delta=2)
+
+    def test_past_http_date(self):
+        retry_after_header_value = formatdate(time() - 60, usegmt=True)
+        response = \
+            _make_response(429, {'Retry-After': retry_after_header_value})
+
+        eq_(0, get_retry_after(response))
+
+    def test_absent(self):
+        eq_(None, get_retry_after(_make_response(429)))
+
+    def test_invalid(self):
+        response = _make_response(429, {'Retry-After': 'soon'})
+
+        eq_(None, get_retry_after(response))
+
+
+class TestRetryingConnection(object):
+
+    def test_transient_error(self):
+        response_maker = _FailingResponseMaker([StubResponse(503)])
+
+        with StubAPIServer(response_maker) as stub_server:
+            connection = _make_connection(stub_server)
+            response = connection.send_get_request(_STUB_URL_PATH)
+
+        eq_(200, response.status_code)
+        eq_(2, len(stub_server.requests))
+
+    def test_persistent_error(self):
+        response_maker = _FailingResponseMaker([StubResponse(503)] * 3)
+
+        with StubAPIServer(response_maker) as stub_server:
+            connection = _make_connection(stub_server)
+            with assert_raises(ServerError) as context_manager:
+                connection.send_get_request(_STUB_URL_PATH)
+
+        eq_(3, len(stub_server.requests))
+        exception = context_manager.exception
+        eq_(503, exception.http_status_code)
+        eq_(3, exception.attempt_count)
+        ok_(0 <= exception.total_backoff_time <= _BACKOFF_FACTOR * 3)
+
+    def test_too_many_requests(self):
+        response_maker = _FailingResponseMaker(
+            [StubResponse(429, headers={'Retry-After': '0.05'})],
+            )
+
+        with StubAPIServer(response_maker) as stub_server:
+            connection = _make_connection(stub_server)
+            connection.send_get_request(_STUB_URL_PATH)
+
+        eq_(2, len(stub_server.requests))
+
+    def test_too_many_requests_exception(self):
+        response_maker = _FailingResponseMaker(
+            [StubResponse(429, headers={'Retry-After': '0.05'})] * 3,
+            )
+
+        with StubAPIServer(response_maker) as stub_server:
+            connection = _make_connection(stub_server)
+            with assert_raises(TooManyRequestsError) as context_manager:
+                connection.send_get_request(_STUB_URL_PATH)
+
+        exception = context_manager.exception
+        eq_(0.05, exception.retry_after)
+        eq_(3, exception.attempt_count)
+        assert_almost_equal(0.1, exception.total_backoff_time)
+
+    def test_non_idempotent_request(self):
+        response_maker = _FailingResponseMaker([StubResponse(503)])
+
+        with StubAPIServer(response_maker) as stub_server:
+            connection = _make_connection(stub_server)
+            with assert_raises(ServerError) as context_manager:
+                connection.send_post_request(_STUB_URL_PATH)
+
+        eq_(1, len(stub_server.requests))
+        eq_(1, context_manager.exception.attempt_count)
+        eq_(0, context_manager.exception.total_backoff_time)
+
+    def test_no_retry_policy(self):
+        response_maker = _FailingResponseMaker([StubResponse(503)])
+
+        with StubAPIServer(response_maker) as stub_server:
+            connection = Connection(None, api_url=stub_server.api_url)
+            with assert_raises(ServerError):
+                connection.send_get_request(_STUB_URL_PATH)
+
+        eq_(1, len(stub_server.requests))
+
+
+class _FailingResponseMaker(object):
+    """Return ``failure_responses`` in turn, then echo the requests."""
+
+    def __init__(self, failure_responses):
+        super(_FailingResponseMaker, self).__init__()
+
+        self._failure_responses = list(failure_responses)
+
+    def __call__(self, request):
+        if self._failure_responses:
+            response = self._failure_responses.pop(0)
+        else:
+            response = make_echo_response(request)
+        return response
+
+
+def _make_connection(stub_server):
+    retry_policy = RetryPolicy(backoff_factor=_BACKOFF_FACTOR)
+    connection = Connection(
+        None,
+        api_url=stub_server.api_url,
+        retry_policy=retry_policy,
+        )
+    return connection
+
+
+def _make_response(status_code, headers=None):
+    response = Response()
+    response.status_code = status_code
+    response.headers.update(headers or {})
+    return response
+
+
+def _get_retry_delay(retry_policy, http_method, status_code, attempt_count):
+    response = _make_response(status_code)
+    return retry_policy.get_retry_delay(http_method, response, attempt_count)
@@ -0,0 +1,594 @@
+##############################################################################
+#
+# Copyright (c) 2016, 2degrees Limited.
+# All Rights Reserved.
+#
+# This file is part of twapi-connection
+# <https://github.com/2degrees/twapi-connection>, which is subject to the
+# provisions of the BSD at
+# <http://dev.2degreesnetwork.com/p/2degrees-license.html>. A copy of the
+# license should accompany this distribution. THIS SOFTWARE IS PROVIDED "AS IS"
+# AND ANY AND ALL EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT
+# NOT LIMITED TO, THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST
+# INFRINGEMENT, AND FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+
+from gzip import compress as gzip_compress
+from io import BytesIO
+from json import dumps as json_serialize
+from json import loads as json_deserialize
+from threading import Lock
+from threading import Thread
+from unittest.mock import patch
+
+from nose.tools import assert_not_in
+from nose.tools import assert_raises
+from nose.tools import eq_
+from nose.tools import ok_
+from requests.exceptions import ConnectionError as RequestsConnectionError
+
+from tests.utils import StubAPIServer
+from tests.utils import StubResponse
+from tests.utils import make_json_response
+from twapi_connection import Connection
+from twapi_connection.exc import NotFoundError
+from twapi_connection.exc import ResponseBodyTooLargeError
+from twapi_connection.exc import ServerError
+from twapi_connection.exc import UnsupportedResponseError
+from twapi_connection.json_codecs import StandardJSONCodec
+from twapi_connection.retrying import RetryPolicy
+from twapi_connection.streaming import BufferReader
+from twapi_connection.streaming import _JSON_DECODER
+from twapi_connection.streaming import iter_deserialization_items
+from twapi_connection.streaming import iter_json_array_serialization
+from twapi_connection.streaming import iter_json_items
+from twapi_connection.streaming import write_chunks
+
+_STUB_URL_PATH = '/foo'
+
+_STUB_DOWNLOAD_BODY = bytes(range(256)) * 4
+
+_STUB_ARRAY = [
+    1,
+    -2.5e3,
+    'ba"r',
+    None,
+    True,
+    False,
+    {'a': [1, {'b': 'c'}]},
+    [],
+    'ünïcödé',
+    ]
+
+
+class TestJSONItemsIteration(object):
+
+    def test_array(self):
+        eq_(_STUB_ARRAY, _iter_serialization_items(_STUB_ARRAY))
+
+    def test_object(self):
+        body_deserialization = {'a': 1, 'b': [2, 3], 'c': {'d': None}}
+
+        items = _iter_serialization_items(body_deserialization)
+
+        eq_(list(body_deserialization.items()), items)
+
+    def test_empty_array(self):
+        eq_([], _iter_serialization_items([]))
+
+    def test_empty_object(self):
+        eq_([], _iter_serialization_items({}))
+
+    def test_whitespace(self):
+        serialization = b' \n[ 1 ,\t2 ]\r\n'
+
+        eq_([1, 2], list(iter_json_items([serialization])))
+
+    def test_single_byte_chunks(self):
+        serialization = json_serialize(_STUB_ARRAY).encode('utf-8')
+        chunks = [serialization[index:index + 1]
+                  for index in range(len(serialization))]
+
+        eq_(_STUB_ARRAY, list(iter_json_items(chunks)))
+
+    def test_number_split_across_chunks(self):
+        eq_([123, 45], list(iter_json_items([b'[12', b'3,4', b'5]'])))
+
+    def test_long_item_split_across_chunks(self):
+        item = 'a' * 10000
+        serialization = json_serialize([item]).encode('utf-8')
+        chunks = [serialization[index:index + 1]
+                  for index in range(len(serialization))]
+
+        with patch.object(
+            _JSON_DECODER,
+            'raw_decode',
+            wraps=_JSON_DECODER.raw_decode,
+            ) as raw_decode_mock:
+            items = list(iter_json_items(chunks))
+
+        eq_([item], items)
+        # The item is not parsed again after every chunk
+        ok_(raw_decode_mock.call_count < 20)
+
+    def test_encoding(self):
+        serialization = json_serialize(['é'], ensure_ascii=False)
+
+        items = iter_json_items([serialization.encode('latin-1')], 'latin-1')
+
+        eq_(['é'], list(items))
+
+    def test_items_decoded_lazily(self):
+        def generate_chunks():
+            yield b'[1,'
+            raise AssertionError('Chunk read too early')
+
+        items = iter_json_items(generate_chunks())
+
+        eq_(1, next(items))
+
+    def test_scalar(self):
+        with assert_raises(UnsupportedResponseError):
+            list(iter_json_items([b'1']))
+
+    def test_truncated_serialization(self):
+        with assert_raises(UnsupportedResponseError):
+            list(iter_json_items([b'[1, 2']))
+
+    def test_invalid_item(self):
+        with assert_raises(UnsupportedResponseError):
+            list(iter_json_items([b'[1, foo]']))
+
+    def test_missing_separator(self):
+        with assert_raises(UnsupportedResponseError):
+            list(iter_json_items([b'[1 2]']))
+
+    def test_trailing_data(self):
+        with assert_raises(UnsupportedResponseError):
+            list(iter_json_items([b'[1] 2']))
+
+
+class TestDeserializationItemsIteration(object):
+
+    def test_array(self):
+        eq_([1, 2], list(iter_deserialization_items([1, 2])))
+
+    def test_object(self):
+        eq_([('a', 1)], list(iter_deserialization_items({'a': 1})))
+
+
+class TestStreamingConnection(object):
+
+    def test_array(self):
+        with StubAPIServer(lambda request: make_json_response(_STUB_ARRAY)) \
+                as stub_server:
+            connection = Connection(None, api_url=stub_server.api_url)
+            items = connection.send_get_request(_STUB_URL_PATH, stream=True)
+
+            eq_(_STUB_ARRAY, list(items))
+
+    def test_query_string_args(self):
+        def make_response(request):
+            return make_json_response(request.query_string_args)
+
+        with StubAPIServer(make_response) as stub_server:
+            connection = Connection(None, api_url=stub_server.api_url)
+            items = connection.send_get_request(
+                _STUB_URL_PATH,
+                {'foo': 'bar'},
+                stream=True,
+                )
+
+            eq_([('foo', 'bar')], list(items))
+
+    def test_unexpected_content_type(self):
+        stub_response = StubResponse(
+            body=b'[]',
+            headers={'Content-Type': 'text/plain'},
+            )
+
+        with StubAPIServer(lambda request: stub_response) as stub_server:
+            connection = Connection(None, api_url=stub_server.api_url)
+            with assert_raises(UnsupportedResponseError):
+                connection.send_get_request(_STUB_URL_PATH, stream=True)
+
+    def test_unexpected_response_status_code(self):
+        stub_response = StubResponse(204)
+
+        with StubAPIServer(lambda request: stub_response) as stub_server:
+            connection = Connection(None, api_url=stub_server.api_url)
+            with assert_raises(UnsupportedResponseError):
+                connection.send_get_request(_STUB_URL_PATH, stream=True)
+
+    def test_error_response(self):
+        with StubAPIServer(lambda request: StubResponse(404)) as stub_server:
+            connection = Connection(None, api_url=stub_server.api_url)
+            with assert_raises(NotFoundError):
+                connection.send_get_request(_STUB_URL_PATH, stream=True)
+
+    def test_connection_released(self):
+        with StubAPIServer(lambda request: make_json_response([1, 2])) \
+                as stub_server:
+            connection = Connection(None, api_url=stub_server.api_url)
+            for _ in range(2):
+                items = \
+                    connection.send_get_request(_STUB_URL_PATH, stream=True)
+                eq_([1, 2], list(items))
+
+        connection_pool_statistics = \
+            list(connection.get_connection_pool_statistics().values())[0]
+        eq_(1, connection_pool_statistics.created_connection_count)
+
+
+    def test_connection_released_when_closed_early(self):
+        with StubAPIServer(lambda request: make_json_response([1, 2])) \
+                as stub_server:
+            connection = Connection(
+                None,
+                api_url=stub_server.api_url,
+                pool_maxsize=1,
+                pool_block=True,
+                )
+            items = connection.send_get_request(_STUB_URL_PATH, stream=True)
+            items.close()
+
+            # The request would wait for the connection forever otherwise
+            responses = []
+            thread = Thread(
+                target=lambda: responses.append(
+                    connection.send_get_request(_STUB_URL_PATH),
+                    ),
+                daemon=True,
+                )
+            thread.start()
+            thread.join(5)
+
+        eq_(1, len(responses))
+
+
+class TestJSONArraySerializationIteration(object):
+
+    def test_items(self):
+        chunks = _iter_json_array_serialization_chunks(iter(_STUB_ARRAY))
+
+        eq_(_STUB_ARRAY, json_deserialize(b''.join(chunks).decode('utf-8')))
+
+    def test_no_items(self):
+        chunks = _iter_json_array_serialization_chunks(iter([]))
+
+        eq_([b'[]'], chunks)
+
+    def test_chunk_size(self):
+        chunks = _iter_json_array_serialization_chunks(iter(range(10)), 4)
+
+        eq_([b'[0,1', b',2,3', b',4,5', b',6,7', b',8,9', b']'], chunks)
+
+    def test_items_serialized_lazily(self):
+        consumed_items = []
+
+        def generate_items():
+            for item in _STUB_ARRAY:
+                consumed_items.append(item)
+                yield item
+
+        chunks = iter_json_array_serialization(
+            generate_items(),
+            StandardJSONCodec(),
+            1,
+            )
+        next(chunks)
+
+        eq_(_STUB_ARRAY[:1], consumed_items)
+
+
+class TestBufferReader(object):
+
+    def test_read_chunks(self):
+        reader = BufferReader(bytearray(b'abcde'))
+
+        eq_(5, len(reader))
+        eq_(b'ab', reader.read(2))
+        eq_(3, len(reader))
+        eq_(b'cde', reader.read(4))
+        eq_(b'', reader.read(1))
+
+    def test_read_all(self):
+        reader = BufferReader(memoryview(b'abcde')[1:])
+
+        eq_(b'bcde', reader.read())
+
+    def test_non_byte_buffer(self):
+        reader = BufferReader(memoryview(bytearray(4)).cast('H'))
+
+        eq_(4, len(reader))
+
+
+class TestStreamingRequestBody(object):
+
+    def test_iterator(self):
+        stub_server = self._send_put_request(iter(_STUB_ARRAY))
+
+        request = stub_server.requests[0]
+        eq_('chunked', request.headers['Transfer-Encoding'])
+        eq_('application/json', request.headers['Content-Type'])
+        eq_(_STUB_ARRAY, request.json())
+
+    def test_file(self):
+        serialization = json_serialize(_STUB_ARRAY).encode('utf-8')
+
+        stub_server = self._send_put_request(BytesIO(serialization))
+
+        request = stub_server.requests[0]
+        eq_(str(len(serialization)), request.headers['Content-Length'])
+        assert_not_in('Transfer-Encoding', request.headers)
+        eq_(serialization, request.body)
+
+    def test_bytes(self):
+        serialization = json_serialize(_STUB_ARRAY).encode('utf-8')
+
+        stub_server = self._send_put_request(bytearray(serialization))
+
+        request = stub_server.requests[0]
+        eq_(str(len(serialization)), request.headers['Content-Length'])
+        eq_(serialization, request.body)
+
+    def test_streamed_body_not_retried(self):
+        retry_policy = RetryPolicy(backoff_factor=0)
+
+        with StubAPIServer(lambda request: StubResponse(503)) as stub_server:
+            connection = Connection(
+                None,
+                api_url=stub_server.api_url,
+                retry_policy=retry_policy,
+                )
+            with assert_raises(ServerError):
+                connection.send_put_request(_STUB_URL_PATH, iter(_STUB_ARRAY))
+
+        eq_(1, len(stub_server.requests))
+
+    def test_buffer_not_copied(self):
+        serialization = json_serialize(_STUB_ARRAY).encode('utf-8')
+        buffer = bytearray(serialization)
+
+        stub_server = self._send_put_request(memoryview(buffer))
+
+        request = stub_server.requests[0]
+        eq_(str(len(serialization)), request.headers['Content-Length'])
+        eq_(serialization, request.body)
+
+    def test_buffer_retried(self):
+        retry_policy = RetryPolicy(backoff_factor=0)
+        response_maker = _FailingFirstResponseMaker(StubResponse(503))
+
+        with StubAPIServer(response_maker) as stub_server:
+            connection = Connection(
+                None,
+                api_url=stub_server.api_url,
+                retry_policy=retry_policy,
+                )
+            connection.send_put_request(_STUB_URL_PATH, bytearray(b'[1]'))
+
+        eq_([b'[1]', b'[1]'], [r.body for r in stub_server.requests])
+
+    def test_streamed_body_not_resent_after_disconnection(self):
+        response_maker = _FailingFirstResponseMaker(None)
+
+        with StubAPIServer(response_maker) as stub_server:
+            connection = Connection(None, api_url=stub_server.api_url)
+            with assert_raises(RequestsConnectionError):
+                connection.send_put_request(_STUB_URL_PATH, iter(_STUB_ARRAY))
+
+        eq_(1, len(stub_server.requests))
+
+    def test_body_resent_after_disconnection(self):
+        response_maker = _FailingFirstResponseMaker(None)
+
+        with StubAPIServer(response_maker) as stub_server:
+            connection = Connection(None, api_url=stub_server.api_url)
+            connection.send_put_request(_STUB_URL_PATH, _STUB_ARRAY)
+
+        eq_(2, len(stub_server.requests))
+        eq_(_STUB_ARRAY, stub_server.requests[1].json())
+
+    @staticmethod
+    def _send_put_request(body_deserialization):
+        with StubAPIServer() as stub_server:
+            connection = Connection(None, api_url=stub_server.api_url)
+            connection.send_put_request(_STUB_URL_PATH, body_deserialization)
+        return stub_server
+
+
+class TestChunksWriting(object):
+
+    def test_file(self):
+        destination = BytesIO()
+
+        byte_count = write_chunks([b'ab', b'c'], destination)
+
+        eq_(3, byte_count)
+        eq_(b'abc', destination.getvalue())
+
+    def test_callable(self):
+        chunks = []
+
+        byte_count = write_chunks([b'ab', b'c'], chunks.append)
+
+        eq_(3, byte_count)
+        eq_([b'ab', b'c'], chunks)
+
+    def test_buffer(self):
+        destination = bytearray(4)
+
+        byte_count = write_chunks([b'ab', b'c'], destination)
+
+        eq_(3, byte_count)
+        eq_(bytearray(b'abc\x00'), destination)
+
+    def test_buffer_too_small(self):
+        destination = bytearray(2)
+
+        with assert_raises(ResponseBodyTooLargeError) as context_manager:
+            write_chunks([b'ab', b'c'], destination)
+
+        eq_(2, context_manager.exception.max_size)
+        eq_(bytearray(b'ab'), destination)
+
+    def test_max_size(self):
+        destination = BytesIO()
+
+        with assert_raises(ResponseBodyTooLargeError):
+            write_chunks([b'ab', b'c'], destination, 2)
+
+        eq_(b'ab', destination.getvalue())
+
+    def test_max_size_smaller_than_buffer(self):
+        with assert_raises(ResponseBodyTooLargeError):
+            write_chunks([b'ab', b'c'], bytearray(4), 2)
+
+
+class TestDownloadingConnection(object):
+
+    def test_file(self):
+        destination = BytesIO()
+
+        with StubAPIServer(_make_download_response) as stub_server:
+            connection = Connection(None, api_url=stub_server.api_url)
+            byte_count = connection.send_download_request(
+                _STUB_URL_PATH,
+                destination,
+                {'foo': 'bar'},
+                chunk_size=100,
+                )
+
+        eq_(len(_STUB_DOWNLOAD_BODY), byte_count)
+        eq_(_STUB_DOWNLOAD_BODY, destination.getvalue())
+        eq_({'foo': 'bar'}, stub_server.requests[0].query_string_args)
+
+    def test_buffer(self):
+        destination = bytearray(len(_STUB_DOWNLOAD_BODY))
+
+        with StubAPIServer(_make_download_response) as stub_server:
+            connection = Connection(None, api_url=stub_server.api_url)
+            connection.send_download_request(_STUB_URL_PATH, destination)
+
+        eq_(_STUB_DOWNLOAD_BODY, destination)
+
+    def test_compressed_body(self):
+        stub_response = StubResponse(
+            body=gzip_compress(_STUB_DOWNLOAD_BODY),
+            headers={'Content-Encoding': 'gzip'},
+            )
+        destination = BytesIO()
+
+        with StubAPIServer(lambda request: stub_response) as stub_server:
+            connection = Connection(None, api_url=stub_server.api_url)
+            connection.send_download_request(_STUB_URL_PATH, destination)
+
+        eq_(_STUB_DOWNLOAD_BODY, destination.getvalue())
+
+    def test_error_response(self):
+        chunks = []
+
+        with StubAPIServer(lambda request: StubResponse(404, b'foo')) \
+                as stub_server:
+            connection = Connection(None, api_url=stub_server.api_url)
+            with assert_raises(NotFoundError):
+                connection.send_download_request(_STUB_URL_PATH, chunks.append)
+
+        eq_([], chunks)
+
+    def test_unexpected_response_status_code(self):
+        chunks = []
+
+        with StubAPIServer(lambda request: StubResponse(204)) as stub_server:
+            connection = Connection(None, api_url=stub_server.api_url)
+            with assert_raises(UnsupportedResponseError):
+                connection.send_download_request(_STUB_URL_PATH, chunks.append)
+
+        eq_([], chunks)
+
+    def test_content_length_exceeding_max_size(self):
+        chunks = []
+
+        with StubAPIServer(_make_download_response) as stub_server:
+            connection = Connection(None, api_url=stub_server.api_url)
+            with assert_raises(ResponseBodyTooLargeError):
+                connection.send_download_request(
+                    _STUB_URL_PATH,
+                    chunks.append,
+                    max_size=len(_STUB_DOWNLOAD_BODY) - 1,
+                    )
+
+        eq_([], chunks)
+
+    def test_body_exceeding_max_size(self):
+        # The size of the decompressed body is not known in advance
+        stub_response = StubResponse(
+            body=gzip_compress(_STUB_DOWNLOAD_BODY),
+            headers={'Content-Encoding': 'gzip'},
+            )
+        destination = BytesIO()
+
+        with StubAPIServer(lambda request: stub_response) as stub_server:
+            connection = Connection(None, api_url=stub_server.api_url)
+            with assert_raises(ResponseBodyTooLargeError):
+                connection.send_download_request(
+                    _STUB_URL_PATH,
+                    destination,
+                    chunk_size=100,
+                    max_size=250,
+                    )
+
+        eq_(_STUB_DOWNLOAD_BODY[:200], destination.getvalue())
+
+    def test_connection_released(self):
+        with StubAPIServer(_make_download_response) as stub_server:
+            connection = Connection(None, api_url=stub_server.api_url)
+            for _ in range(2):
+                connection.send_download_request(_STUB_URL_PATH, BytesIO())
+
+        connection_pool_statistics = \
+            list(connection.get_connection_pool_statistics().values())[0]
+        eq_(1, connection_pool_statistics.created_connection_count)
+
+
+class _FailingFirstResponseMaker(object):
+
+    def __init__(self, first_response):
+        super(_FailingFirstResponseMaker, self).__init__()
+
+        self._first_response = first_response
+
+        self._lock = Lock()
+        self._request_count = 0
+
+    def __call__(self, request):
+        with self._lock:
+            self._request_count += 1
+            request_number = self._request_count
+
+        if request_number == 1:
+            return self._first_response
+        return make_json_response({})
+
+
+def _make_download_response(request):
+    return StubResponse(
+        body=_STUB_DOWNLOAD_BODY,
+        headers={'Content-Type': 'application/octet-stream'},
+        )
+
+
+def _iter_json_array_serialization_chunks(items, chunk_size=64):
+    chunks = iter_json_array_serialization(
+        items,
+        StandardJSONCodec(),
+        chunk_size,
+        )
+    return list(chunks)
+
+
+def _iter_serialization_items(body_deserialization):
+    serialization = json_serialize(body_deserialization).encode('utf-8')
+    return list(iter_json_items([serialization]))
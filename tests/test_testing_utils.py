@@ -25,7 +25,7 @@ from nose.tools import eq_
 from tests.utils import assert_raises_substring
 from tests.utils import get_uuid4_str
 from twapi_connection.exc import AuthenticationError
-from twapi_connection.testing import MockConnection, MockResponse, \
+from twapi_connection.testing import APICall, MockConnection, MockResponse, \
     SuccessfulAPICall, UnsuccessfulAPICall
 
 _STUB_URL_PATH = '/foo'
@@ -55,6 +55,42 @@ class TestMockConnection(object):
 
         self._assert_sole_api_call_equals(_STUB_API_CALL_1, connection)
         eq_(_STUB_RESPONSE, response)
+        eq_({'foo': 'bar'}, response.body_deserialization)
+
+    def test_streamed_get_request(self):
+        connection = \
+            self._make_connection_for_expected_api_call(_STUB_API_CALL_1)
+
+        items = connection.send_get_request(_STUB_URL_PATH, stream=True)
+
+        self._assert_sole_api_call_equals(_STUB_API_CALL_1, connection)
+        eq_([('foo', 'bar')], list(items))
+
+    def test_deadline(self):
+        connection = \
+            self._make_connection_for_expected_api_call(_STUB_API_CALL_1)
+
+        response = connection.send_get_request(_STUB_URL_PATH, deadline=1)
+
+        self._assert_sole_api_call_equals(_STUB_API_CALL_1, connection)
+        eq_(_STUB_RESPONSE, response)
+
+    def test_download_request(self):
+        expected_api_call = SuccessfulAPICall(
+            _STUB_URL_PATH,
+            'GET',
+            response=MockResponse(b'foo'),
+            )
+        connection = \
+            self._make_connection_for_expected_api_call(expected_api_call)
+        chunks = []
+
+        byte_count = \
+            connection.send_download_request(_STUB_URL_PATH, chunks.append)
+
+        self._assert_sole_api_call_equals(expected_api_call, connection)
+        eq_(3, byte_count)
+        eq_([b'foo'], chunks)
 
     def test_get_request_with_query_string_args(self):
         query_string_args = {'foo': 'bar'}
@@ -153,6 +189,24 @@ class TestMockConnection(object):
         self._assert_sole_api_call_equals(expected_api_call, connection)
         eq_(_STUB_RESPONSE, response)
 
+    def test_streamed_put_request(self):
+        request_body_deserialization = [{'foo': 'bar'}]
+        expected_api_call = SuccessfulAPICall(
+            _STUB_URL_PATH,
+            'PUT',
+            request_body_deserialization=request_body_deserialization,
+            response=_STUB_RESPONSE,
+            )
+        connection = \
+            self._make_connection_for_expected_api_call(expected_api_call)
+
+        connection.send_put_request(
+            _STUB_URL_PATH,
+            iter(request_body_deserialization),
+            )
+
+        self._assert_sole_api_call_equals(expected_api_call, connection)
+
     def test_delete_request(self):
         expected_api_call = SuccessfulAPICall(
             _STUB_URL_PATH,
@@ -224,6 +278,55 @@ class TestMockConnection(object):
         eq_(exception, context_manager.exception)
         self._assert_sole_api_call_equals(expected_api_call, connection)
 
+    def test_batch_requests(self):
+        exception = AuthenticationError()
+        unsuccessful_api_call = UnsuccessfulAPICall(
+            _STUB_URL_PATH,
+            'POST',
+            exception=exception,
+            )
+        connection = MockConnection(
+            _ConstantCallable([_STUB_API_CALL_1, unsuccessful_api_call]),
+            )
+
+        api_call_outcomes = connection.send_requests([
+            APICall(_STUB_URL_PATH, 'GET'),
+            APICall(_STUB_URL_PATH, 'POST'),
+            ])
+
+        eq_([_STUB_API_CALL_1, unsuccessful_api_call], list(api_call_outcomes))
+        eq_([_STUB_API_CALL_1, unsuccessful_api_call], connection.api_calls)
+
+    def test_paginated_items(self):
+        next_page_url = _STUB_URL_PATH + '?page=2'
+        connection = MockConnection(
+            _ConstantCallable([
+                SuccessfulAPICall(
+                    _STUB_URL_PATH,
+                    'GET',
+                    {'foo': 'bar'},
+                    response=MockResponse(
+                        {'results': [1, 2], 'next': next_page_url},
+                        ),
+                    ),
+                SuccessfulAPICall(
+                    next_page_url,
+                    'GET',
+                    response=MockResponse({'results': [3], 'next': None}),
+                    ),
+                ]),
+            )
+
+        with connection:
+            items = \
+                connection.iter_paginated_items(_STUB_URL_PATH, {'foo': 'bar'})
+            eq_([1, 2, 3], list(items))
+
+    def test_warm_up(self):
+        connection = MockConnection()
+        with connection:
+            eq_(0, connection.warm_up(2))
+
     def test_too_few_requests(self):
         connection = \
             self._make_connection_for_expected_api_call(_STUB_API_CALL_1)
@@ -0,0 +1,286 @@
+##############################################################################
+#
+# Copyright (c) 2016, 2degrees Limited.
+# All Rights Reserved.
+#
+# This file is part of twapi-connection
+# <https://github.com/2degrees/twapi-connection>, which is subject to the
+# provisions of the BSD at
+# <http://dev.2degreesnetwork.com/p/2degrees-license.html>. A copy of the
+# license should accompany this distribution. THIS SOFTWARE IS PROVIDED "AS IS"
+# AND ANY AND ALL EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT
+# NOT LIMITED TO, THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST
+# INFRINGEMENT, AND FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+
+from threading import Event
+from time import monotonic
+from time import sleep
+
+from nose.tools import assert_false
+from nose.tools import assert_is_instance
+from nose.tools import assert_is_none
+from nose.tools import assert_raises
+from nose.tools import eq_
+from nose.tools import ok_
+from requests.exceptions import ConnectionError as RequestsConnectionError
+from requests.exceptions import ConnectTimeout as RequestsConnectTimeout
+from requests.exceptions import ReadTimeout as RequestsReadTimeout
+from requests.exceptions import Timeout as RequestsTimeout
+from urllib3.exceptions import MaxRetryError
+from urllib3.exceptions import ReadTimeoutError as URLLib3ReadTimeoutError
+
+from tests.utils import StubAPIServer
+from tests.utils import StubResponse
+from tests.utils import make_json_response
+from twapi_connection import Connection
+from twapi_connection.exc import ConnectTimeoutError
+from twapi_connection.exc import DeadlineExceededError
+from twapi_connection.exc import ReadTimeoutError
+from twapi_connection.exc import ServerError
+from twapi_connection.retrying import RetryPolicy
+from twapi_connection.timeouts import Deadline
+from twapi_connection.timeouts import DeadlineRetry
+from twapi_connection.timeouts import DeadlineTimeout
+from twapi_connection.timeouts import make_timeout_error
+
+_STUB_URL_PATH = '/foo'
+
+_SLOW_RESPONSE_DELAY = 5
+
+
+class TestDeadline(object):
+
+    def test_timeout_shorter_than_remaining_time(self):
+        deadline = Deadline(10)
+
+        eq_(1, deadline.clip_timeout(1))
+        assert_false(deadline.is_last_timeout_clipped)
+
+    def test_timeout_longer_than_remaining_time(self):
+        deadline = Deadline(1)
+
+        ok_(deadline.clip_timeout(10) <= 1)
+        ok_(deadline.is_last_timeout_clipped)
+
+    def test_no_timeout(self):
+        deadline = Deadline(1)
+
+        ok_(deadline.clip_timeout(None) <= 1)
+        ok_(deadline.is_last_timeout_clipped)
+
+    def test_expired_deadline(self):
+        deadline = Deadline(0)
+
+        ok_(deadline.has_expired())
+        eq_(0, deadline.get_remaining_time())
+        ok_(0 < deadline.clip_timeout(10))
+
+
+class TestDeadlineTimeout(object):
+
+    def test_timeouts_clipped(self):
+        timeout = DeadlineTimeout.init_from_timeout((10, 20), Deadline(5))
+
+        ok_(timeout.connect_timeout <= 5)
+        ok_(timeout.read_timeout <= 5)
+
+    def test_timeouts_not_clipped(self):
+        timeout = DeadlineTimeout.init_from_timeout(1, Deadline(5))
+
+        eq_(1, timeout.connect_timeout)
+        eq_(1, timeout.read_timeout)
+
+    def test_clone(self):
+        deadline = Deadline(5)
+        timeout = DeadlineTimeout(1, 10, deadline).clone()
+
+        assert_is_instance(timeout, DeadlineTimeout)
+        eq_(1, timeout.connect_timeout)
+        ok_(timeout.read_timeout <= 5)
+
+
+class TestDeadlineRetry(object):
+
+    def test_deadline_not_expired(self):
+        retry = DeadlineRetry(3, deadline=Deadline(5))
+
+        assert_false(retry.is_exhausted())
+
+    def test_deadline_expired(self):
+        retry = DeadlineRetry(3, deadline=Deadline(0))
+
+        ok_(retry.is_exhausted())
+
+    def test_new(self):
+        deadline = Deadline(0)
+        retry = DeadlineRetry(3).new(deadline=deadline).new(read=0)
+
+        assert_is_instance(retry, DeadlineRetry)
+        ok_(retry.is_exhausted())
+
+
+class TestTimeoutErrors(object):
+
+    def test_connect_timeout(self):
+        timeout_error = make_timeout_error(RequestsConnectTimeout())
+
+        assert_is_instance(timeout_error, ConnectTimeoutError)
+        assert_is_instance(timeout_error, RequestsConnectTimeout)
+
+    def test_read_timeout(self):
+        timeout_error = make_timeout_error(RequestsReadTimeout())
+
+        assert_is_instance(timeout_error, ReadTimeoutError)
+        assert_is_instance(timeout_error, RequestsReadTimeout)
+
+    def test_read_timeout_retried(self):
+        read_timeout_error = URLLib3ReadTimeoutError(None, None, 'Timed out')
+        exception = RequestsConnectionError(
+            MaxRetryError(None, _STUB_URL_PATH, read_timeout_error),
+            )
+
+        timeout_error = make_timeout_error(exception)
+
+        assert_is_instance(timeout_error, ReadTimeoutError)
+
+    def test_read_timeout_in_body(self):
+        read_timeout_error = URLLib3ReadTimeoutError(None, None, 'Timed out')
+        exception = RequestsConnectionError(read_timeout_error)
+
+        timeout_error = make_timeout_error(exception)
+
+        assert_is_instance(timeout_error, ReadTimeoutError)
+
+    def test_clipped_timeout(self):
+        deadline = Deadline(1)
+        deadline.clip_timeout(10)
+
+        timeout_error = make_timeout_error(RequestsReadTimeout(), deadline)
+
+        assert_is_instance(timeout_error, DeadlineExceededError)
+        assert_is_instance(timeout_error, RequestsTimeout)
+
+    def test_unclipped_timeout(self):
+        deadline = Deadline(10)
+        deadline.clip_timeout(1)
+
+        timeout_error = make_timeout_error(RequestsReadTimeout(), deadline)
+
+        assert_is_instance(timeout_error, ReadTimeoutError)
+
+    def test_other_error(self):
+        assert_is_none(make_timeout_error(RequestsConnectionError()))
+
+
+class TestConnectionTimeouts(object):
+
+    def test_read_timeout(self):
+        response_maker = _SlowResponseMaker()
+        with StubAPIServer(response_maker) as stub_server:
+            connection = Connection(
+                None,
+                timeout=(5, 0.1),
+                api_url=stub_server.api_url,
+                )
+            with assert_raises(ReadTimeoutError):
+                connection.send_post_request(_STUB_URL_PATH)
+            response_maker.release_responses()
+
+    def test_deadline(self):
+        response_maker = _SlowResponseMaker()
+        with StubAPIServer(response_maker) as stub_server:
+            connection = Connection(None, api_url=stub_server.api_url)
+            start_time = monotonic()
+            with assert_raises(DeadlineExceededError):
+                connection.send_post_request(_STUB_URL_PATH, deadline=0.2)
+            elapsed_time = monotonic() - start_time
+            response_maker.release_responses()
+
+        ok_(elapsed_time < 1)
+
+    def test_deadline_bounds_connection_retries(self):
+        # GET requests whose responses time out are retried by urllib3
+        response_maker = _SlowResponseMaker()
+        with StubAPIServer(response_maker) as stub_server:
+            connection = Connection(
+                None,
+                timeout=0.2,
+                api_url=stub_server.api_url,
+                )
+            start_time = monotonic()
+            with assert_raises(DeadlineExceededError):
+                connection.send_get_request(_STUB_URL_PATH, deadline=0.3)
+            elapsed_time = monotonic() - start_time
+            response_maker.release_responses()
+
+        ok_(elapsed_time < 0.6)
+
+    def test_no_connection_retries_after_deadline(self):
+        response_maker = _SlowResponseMaker()
+        with StubAPIServer(response_maker) as stub_server:
+            connection = Connection(None, api_url=stub_server.api_url)
+            with assert_raises(DeadlineExceededError):
+                connection.send_get_request(_STUB_URL_PATH, deadline=0.05)
+            # Any retry would have been sent by now
+            sleep(0.1)
+            request_count = len(stub_server.requests)
+            response_maker.release_responses()
+
+        eq_(1, request_count)
+
+    def test_deadline_not_exceeded(self):
+        with StubAPIServer() as stub_server:
+            connection = Connection(None, api_url=stub_server.api_url)
+            response = connection.send_get_request(
+                _STUB_URL_PATH,
+                {'foo': 'bar'},
+                deadline=5,
+                )
+
+        eq_({'foo': 'bar'}, response.json()['query_string_args'])
+
+    def test_streamed_download_deadline(self):
+        response_maker = _SlowResponseMaker()
+        with StubAPIServer(response_maker) as stub_server:
+            connection = Connection(None, api_url=stub_server.api_url)
+            with assert_raises(DeadlineExceededError):
+                connection.send_download_request(
+                    _STUB_URL_PATH,
+                    [].append,
+                    deadline=0.1,
+                    )
+            response_maker.release_responses()
+
+    def test_retry_past_deadline(self):
+        retry_policy = RetryPolicy(max_backoff=60)
+        stub_response = StubResponse(503, headers={'Retry-After': '10'})
+
+        with StubAPIServer(lambda request: stub_response) as stub_server:
+            connection = Connection(
+                None,
+                api_url=stub_server.api_url,
+                retry_policy=retry_policy,
+                )
+            with assert_raises(ServerError) as context_manager:
+                connection.send_get_request(_STUB_URL_PATH, deadline=5)
+
+        eq_(1, context_manager.exception.attempt_count)
+        eq_(1, len(stub_server.requests))
+
+
+
+class _SlowResponseMaker(object):
+
+    def __init__(self):
+        super(_SlowResponseMaker, self).__init__()
+
+        self._response_released = Event()
+
+    def __call__(self, request):
+        self._response_released.wait(_SLOW_RESPONSE_DELAY)
+        return make_json_response({})
+
+    def release_responses(self):
+        self._response_released.set()
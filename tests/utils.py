@@ -14,10 +14,20 @@
 #
 ##############################################################################
 
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from json import dumps as json_serialize
+from json import loads as json_deserialize
 from re import escape as escape_regexp
+from threading import Thread
+from urllib.parse import parse_qsl
 from uuid import uuid4 as get_uuid4
 
 from nose.tools import assert_raises_regexp
+from nose.tools import eq_
+from nose.tools import ok_
+
+_SERVER_POLL_INTERVAL = 0.01
 
 
 def get_uuid4_str():
@@ -39,3 +49,170 @@ def assert_raises_substring(
         *args,
         **kwargs
         )
+
+
+def get_sole_pool_statistics(connection):
+    pool_statistics_by_origin = connection.get_connection_pool_statistics()
+    eq_(1, len(pool_statistics_by_origin))
+
+    origin, statistics = pool_statistics_by_origin.popitem()
+    ok_(connection._api_url.startswith(origin))
+    return statistics
+
+
+class StubAPIServer(object):
+    """
+    Local, threaded HTTP server whose responses are built by a callable.
+
+    ``response_maker`` receives a :class:`StubRequest` and returns a
+    :class:`StubResponse`; by default, the request is echoed back in a JSON
+    body. If it returns ``None``, the connection is closed without a
+    response. The server is started and stopped by using it as a context
+    manager.
+
+    """
+
+    def __init__(self, response_maker=None):
+        super(StubAPIServer, self).__init__()
+
+        self._response_maker = response_maker or make_echo_response
+
+        self.requests = []
+        self.api_url = None
+
+        self._http_server = None
+        self._server_thread = None
+
+    def __enter__(self):
+        response_maker = self._response_maker
+        requests = self.requests
+
+        class RequestHandler(_StubRequestHandler):
+            def make_response(self, request):
+                requests.append(request)
+                return response_maker(request)
+
+        self._http_server = \
+            ThreadingHTTPServer(('127.0.0.1', 0), RequestHandler)
+        self._http_server.daemon_threads = True
+        self.api_url = 'http://127.0.0.1:{}'.format(
+            self._http_server.server_port,
+            )
+
+        self._server_thread = Thread(
+            target=self._http_server.serve_forever,
+            args=(_SERVER_POLL_INTERVAL,),
+            daemon=True,
+            )
+        self._server_thread.start()
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._http_server.shutdown()
+        self._http_server.server_close()
+        self._server_thread.join()
+
+
+class StubRequest(object):
+
+    def __init__(self, method, path, query_string_args, headers, body):
+        super(StubRequest, self).__init__()
+
+        self.method = method
+        self.path = path
+        self.query_string_args = query_string_args
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        return json_deserialize(self.body.decode('utf-8'))
+
+
+class StubResponse(object):
+
+    def __init__(self, status_code=200, body=b'', headers=None):
+        super(StubResponse, self).__init__()
+
+        self.status_code = status_code
+        self.body = body
+        self.headers = headers or {}
+
+
+def make_json_response(body_deserialization, status_code=200, headers=None):
+    headers = dict(headers or {}, **{'Content-Type': 'application/json'})
+    body = json_serialize(body_deserialization).encode('utf-8')
+    return StubResponse(status_code, body, headers)
+
+
+def make_echo_response(request):
+    body_deserialization = {
+        'method': request.method,
+        'path': request.path,
+        'query_string_args': request.query_string_args,
+        }
+    return make_json_response(body_deserialization)
+
+
+class _StubRequestHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self._handle_request()
+
+    do_HEAD = do_POST = do_PUT = do_DELETE = do_GET
+
+    def make_response(self, request):
+        raise NotImplementedError()
+
+    def _handle_request(self):
+        url_path, _, query_string = self.path.partition('?')
+
+        request_body = self._read_request_body()
+
+        request = StubRequest(
+            self.command,
+            url_path,
+            dict(parse_qsl(query_string)),
+            self.headers,
+            request_body,
+            )
+        response = self.make_response(request)
+        if response is None:
+            self.close_connection = True
+            return
+
+        self.send_response(response.status_code)
+        for header_name, header_value in response.headers.items():
+            self.send_header(header_name, header_value)
+        self.send_header('Content-Length', str(len(response.body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(response.body)
+
+    def _read_request_body(self):
+        transfer_encoding = self.headers.get('Transfer-Encoding', '')
+        if transfer_encoding.lower() == 'chunked':
+            request_body = self._read_chunked_request_body()
+        else:
+            request_body_length = int(self.headers.get('Content-Length', 0))
+            if request_body_length:
+                request_body = self.rfile.read(request_body_length)
+            else:
+                request_body = b''
+        return request_body
+
+    def _read_chunked_request_body(self):
+        request_body = b''
+        while True:
+            chunk_size = int(self.rfile.readline().split(b';')[0], 16)
+            if chunk_size:
+                request_body += self.rfile.read(chunk_size)
+            self.rfile.readline()
+            if not chunk_size:
+                break
+        return request_body
+
+    def log_message(self, *args, **kwargs):
+        pass
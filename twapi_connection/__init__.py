@@ -18,76 +18,458 @@ try:
 except ImportError:
     from http import client as HTTPStatus
 
-from json import dumps as json_serialize
+from collections import deque
+from collections.abc import Iterator
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait as wait_for_futures
+from functools import partial
+from http.cookiejar import DefaultCookiePolicy
+from threading import Thread
+from time import sleep
+from uuid import uuid4
 
 from pkg_resources import get_distribution
-from requests.adapters import HTTPAdapter
+from requests.adapters import DEFAULT_POOLBLOCK
+from requests.adapters import DEFAULT_POOLSIZE
+from requests.exceptions import RequestException
+from requests.models import Request
 from requests.sessions import Session
 
+from twapi_connection.adapters import InstrumentedHTTPAdapter
+from twapi_connection.api_calls import get_api_call_outcome
+from twapi_connection.api_calls import get_request_key
+from twapi_connection.auth import ClientCredentialsAuth
+from twapi_connection.auth import get_authentication_identity
+from twapi_connection.coalescing import CallCoalescer
+from twapi_connection.compression import TransferStatisticsCollector
+from twapi_connection.compression import get_accept_encoding
 from twapi_connection.exc import AccessDeniedError
 from twapi_connection.exc import AuthenticationError
 from twapi_connection.exc import ClientError
+from twapi_connection.exc import DeadlineExceededError
 from twapi_connection.exc import NotFoundError
 from twapi_connection.exc import ServerError
+from twapi_connection.exc import TooManyRequestsError
+from twapi_connection.exc import TwodAPIException
 from twapi_connection.exc import UnsupportedResponseError
+from twapi_connection.forking import register_fork_aware_object
+from twapi_connection.forking import reset_session_after_fork
+from twapi_connection.forking import unregister_fork_aware_object
+from twapi_connection.hedging import call_with_hedging
+from twapi_connection.json_codecs import JSONResponse
+from twapi_connection.json_codecs import get_default_json_codec
+from twapi_connection.keep_alive import KeepAliveManager
+from twapi_connection.pagination import iter_paginated_items
+from twapi_connection.preparing import PreparedRequestFactory
+from twapi_connection.retrying import get_retry_after
+from twapi_connection.streaming import BufferReader
+from twapi_connection.streaming import iter_json_array_serialization
+from twapi_connection.streaming import iter_response_json_items
+from twapi_connection.streaming import write_response_body
+from twapi_connection.timeouts import Deadline
+from twapi_connection.timeouts import DeadlineRetry
+from twapi_connection.timeouts import DeadlineTimeout
+from twapi_connection.timeouts import make_timeout_error
+
+_DEFAULT_DOWNLOAD_CHUNK_SIZE = 64 * 1024
 
 _DISTRIBUTION_NAME = 'twapi-connection'
 _DISTRIBUTION_VERSION = get_distribution(_DISTRIBUTION_NAME).version
 _USER_AGENT = '2degrees Python Client/' + _DISTRIBUTION_VERSION
 
 
-_HTTP_CONNECTION_MAX_RETRIES = 3
+# Responses are never retried at this level, even if they specify a
+# Retry-After header: That is down to the retry policy of the connection
+_HTTP_CONNECTION_MAX_RETRIES = \
+    DeadlineRetry(3, respect_retry_after_header=False)
+
+_NO_COOKIES_POLICY = DefaultCookiePolicy(allowed_domains=())
+
+_DEFAULT_PREFETCHED_PAGE_COUNT = 1
+
+_COALESCIBLE_HTTP_METHODS = frozenset(['GET', 'HEAD'])
+
+_HEDGEABLE_HTTP_METHODS = frozenset(['GET', 'HEAD'])
 
 
-class Connection:
+class _BaseConnection(object):
 
     _API_URL = 'https://www.2degreesnetwork.com/api'
 
-    def __init__(self, auth, timeout=None, api_url=None):
-        super(Connection, self).__init__()
+    def __init__(self, api_url=None):
+        super(_BaseConnection, self).__init__()
 
         self._api_url = api_url or self._API_URL
 
+    def _resolve_url(self, url):
+        if url.startswith(self._api_url):
+            url = url
+        else:
+            url = self._api_url + url
+        return url
+
+    @staticmethod
+    def _require_successful_response(response):
+        if 400 <= response.status_code < 500:
+            if response.status_code == HTTPStatus.UNAUTHORIZED:
+                exception_class = AuthenticationError
+            elif response.status_code == HTTPStatus.FORBIDDEN:
+                exception_class = AccessDeniedError
+            elif response.status_code == HTTPStatus.NOT_FOUND:
+                exception_class = NotFoundError
+            elif response.status_code == HTTPStatus.TOO_MANY_REQUESTS:
+                raise TooManyRequestsError(get_retry_after(response))
+            else:
+                exception_class = ClientError
+            raise exception_class()
+        elif 500 <= response.status_code < 600:
+            raise ServerError(response.reason, response.status_code)
+
+    @classmethod
+    def _require_deserializable_response_body(
+        cls,
+        response,
+        is_conditional_request=False,
+        ):
+        if response.status_code in (HTTPStatus.OK, HTTPStatus.NO_CONTENT):
+            if response.content:
+                cls._require_json_response(response)
+        elif response.status_code == HTTPStatus.NOT_MODIFIED and \
+                is_conditional_request:
+            pass
+        else:
+            exception_message = \
+                'Unsupported response status {}'.format(response.status_code)
+            raise UnsupportedResponseError(exception_message)
+
+    @classmethod
+    def _require_streamable_response_body(
+        cls,
+        response,
+        is_response_body_json=True,
+        ):
+        if response.status_code == HTTPStatus.OK:
+            if is_response_body_json:
+                cls._require_json_response(response)
+        else:
+            exception_message = \
+                'Unsupported response status {}'.format(response.status_code)
+            raise UnsupportedResponseError(exception_message)
+
+    @staticmethod
+    def _require_json_response(response):
+        content_type_header_value = response.headers.get('Content-Type')
+        if not content_type_header_value:
+            exception_message = 'Response does not specify a Content-Type'
+            raise UnsupportedResponseError(exception_message)
+
+        content_type = content_type_header_value.split(';')[0].lower()
+        if content_type != 'application/json':
+            exception_message = \
+                'Unsupported response content type {}'.format(content_type)
+            raise UnsupportedResponseError(exception_message)
+
+
+class Connection(_BaseConnection):
+    """
+    Connection to the 2degrees API
+
+    A single instance can be shared by any number of threads, which then reuse
+    the same pool of keep-alive connections. This is safe because the state of
+    the underlying :class:`requests.Session` is only modified during
+    initialization: the headers and adapters are set up front, and the cookies
+    set by the API are ignored so that the cookie jar is never written to by
+    concurrent requests.
+
+    An instance can also be created before forking (e.g., at import time in a
+    pre-fork server): the child processes discard the keep-alive connections
+    they inherit, as described in :meth:`reset_after_fork`.
+
+    :param auth: The authentication handler, as accepted by :mod:`requests`
+    :param timeout: The connect and read timeout in seconds, or a
+        ``(connect timeout, read timeout)`` tuple, which apply to each
+        attempt. Overall time budgets are set per call with ``deadline``.
+    :param str api_url: The base URL of the API
+    :param int pool_connections: The number of hosts whose connection pools
+        are kept
+    :param int pool_maxsize: The maximum number of idle connections kept per
+        host
+    :param bool pool_block: Whether to wait for a connection to be returned
+        to the pool when ``pool_maxsize`` connections are in use, instead of
+        opening a new connection that gets discarded after its request
+    :param response_cache: The cache for the responses to ``GET`` requests,
+        which are only served to the connections using the same credentials.
+        The credentials of authentication handlers that are not supported by
+        :func:`~twapi_connection.auth.get_authentication_identity` are
+        assumed to be unique to this connection.
+    :type response_cache: :class:`~twapi_connection.caching.ResponseCache`
+    :param bool coalesce_requests: Whether a ``GET`` or ``HEAD`` request
+        should wait for an identical request in progress and share its
+        response or exception, instead of being sent too
+    :param retry_policy: The policy for retrying requests whose responses
+        have a transient error status, if any
+    :type retry_policy: :class:`~twapi_connection.retrying.RetryPolicy`
+    :param rate_limiter: The limiter of the rate at which requests are sent,
+        which is shared by all the threads using this connection and which
+        applies to each attempt
+    :type rate_limiter:
+        :class:`~twapi_connection.rate_limiting.TokenBucketRateLimiter`
+    :param circuit_breaker: The circuit breaker failing requests fast while
+        the API is unavailable, which applies to each attempt
+    :type circuit_breaker:
+        :class:`~twapi_connection.circuit_breaking.CircuitBreaker`
+    :param json_codec: The codec for the JSON in the bodies of requests and
+        responses, which defaults to the fastest one available
+    :type json_codec: :class:`~twapi_connection.json_codecs.OrjsonCodec` or
+        :class:`~twapi_connection.json_codecs.StandardJSONCodec`
+    :param request_body_compression_policy: The policy for compressing the
+        bodies of requests, which are sent uncompressed if not set
+    :type request_body_compression_policy:
+        :class:`~twapi_connection.compression.RequestBodyCompressionPolicy`
+    :param bool reuse_prepared_requests: Whether to prepare requests from
+        templates cached by method and URL, which skips most of the work
+        done by :mod:`requests` on each call. The proxies and ``.netrc``
+        file in the environment are then only read once per URL, and the
+        session must not be altered after initialization.
+    :param hedging_policy: The policy for hedging ``GET`` and ``HEAD``
+        requests, whose attempts are then sent from a pool of threads twice
+        as large as ``pool_maxsize``
+    :type hedging_policy: :class:`~twapi_connection.hedging.HedgingPolicy`
+    :param int warm_up_after_fork: The number of keep-alive connections to
+        the API to open in the background in each child process after a
+        fork, up to ``pool_maxsize``
+    :param keep_alive_policy: The policy for closing idle keep-alive
+        connections and keeping some open, which is applied by a background
+        thread until the connection is exited
+    :type keep_alive_policy:
+        :class:`~twapi_connection.keep_alive.KeepAlivePolicy`
+    :param dns_cache: The cache used to resolve the host name of the API
+        when opening new connections, which may be shared with other
+        connections. Host names are resolved by the system resolver on each
+        new connection otherwise.
+    :type dns_cache: :class:`~twapi_connection.resolving.DNSCache`
+
+    """
+
+    def __init__(
+        self,
+        auth,
+        timeout=None,
+        api_url=None,
+        pool_connections=DEFAULT_POOLSIZE,
+        pool_maxsize=DEFAULT_POOLSIZE,
+        pool_block=DEFAULT_POOLBLOCK,
+        response_cache=None,
+        coalesce_requests=False,
+        retry_policy=None,
+        rate_limiter=None,
+        circuit_breaker=None,
+        json_codec=None,
+        request_body_compression_policy=None,
+        reuse_prepared_requests=False,
+        hedging_policy=None,
+        warm_up_after_fork=0,
+        keep_alive_policy=None,
+        dns_cache=None,
+        ):
+        super(Connection, self).__init__(api_url)
+
         self._authentication_handler = auth
+        if isinstance(auth, ClientCredentialsAuth):
+            auth.set_default_timeout(timeout)
 
         self._session = Session()
         self._session.headers['User-Agent'] = _USER_AGENT
+        self._session.headers['Accept-Encoding'] = get_accept_encoding()
+        self._session.cookies.set_policy(_NO_COOKIES_POLICY)
 
         self._timeout = timeout
 
-        http_adapter = HTTPAdapter(max_retries=_HTTP_CONNECTION_MAX_RETRIES)
-        self._session.mount('', http_adapter)
+        self._response_cache = response_cache
+        # Used instead of the identity of unknown credentials, whose cached
+        # responses are then not shared with any other connection
+        self._response_cache_namespace = uuid4().hex
+
+        self._retry_policy = retry_policy
+
+        self._rate_limiter = rate_limiter
+
+        self._circuit_breaker = circuit_breaker
 
-    def send_get_request(self, url, query_string_args=None):
+        self._json_codec = json_codec or get_default_json_codec()
+
+        self._request_body_compression_policy = \
+            request_body_compression_policy
+        self._transfer_statistics_collector = TransferStatisticsCollector()
+
+        if reuse_prepared_requests:
+            self._prepared_request_factory = \
+                PreparedRequestFactory(self._session, auth)
+        else:
+            self._prepared_request_factory = None
+
+        self._hedging_policy = hedging_policy
+        if hedging_policy:
+            self._hedging_executor = ThreadPoolExecutor(pool_maxsize * 2)
+        else:
+            self._hedging_executor = None
+
+        if coalesce_requests:
+            self._request_coalescer = CallCoalescer()
+        else:
+            self._request_coalescer = None
+
+        self._pool_maxsize = pool_maxsize
+        self._http_adapter = InstrumentedHTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            max_retries=_HTTP_CONNECTION_MAX_RETRIES,
+            pool_block=pool_block,
+            dns_cache=dns_cache,
+            )
+        # The default adapters are mounted on these prefixes, which would take
+        # precedence over shorter ones
+        self._session.mount('http://', self._http_adapter)
+        self._session.mount('https://', self._http_adapter)
+
+        self._keep_alive_policy = keep_alive_policy
+        self._keep_alive_manager = self._start_keep_alive_manager()
+
+        self._warm_up_after_fork = warm_up_after_fork
+        register_fork_aware_object(self)
+
+    def send_get_request(
+        self,
+        url,
+        query_string_args=None,
+        stream=False,
+        deadline=None,
+        ):
         """
         Send a GET request
 
         :param str url: The URL or URL path to the endpoint
         :param dict query_string_args: The query string arguments
+        :param bool stream: Whether to decode the items in the ``JSON`` \
+            array or object in the body of the response as it is received, \
+            instead of buffering the whole body. Such responses are never \
+            cached nor shared with identical requests.
+        :param float deadline: The maximum number of seconds the call may \
+            take, including retries, the time spent backing off and the \
+            waits for the rate limiter or for an identical request, after \
+            which :class:`~twapi_connection.exc.DeadlineExceededError` is \
+            raised. A request that would be retried after the deadline \
+            fails instead. When ``stream`` is set, it does not apply to \
+            the reading of the items.
 
         :return: Decoded version of the ``JSON`` the remote put in \
-                the body of the response.
+                the body of the response, or an iterator of the elements in \
+                the array or of the ``(key, value)`` pairs in the object if \
+                ``stream`` is set. The iterator should be exhausted or \
+                closed to release the connection.
 
         """
-        return self._send_request('GET', url, query_string_args)
+        if stream:
+            url = self._resolve_url(url)
+            response = self._send_http_request(
+                'GET',
+                url,
+                query_string_args,
+                stream=True,
+                deadline=_make_deadline(deadline),
+                )
+            return iter_response_json_items(response)
 
-    def send_head_request(self, url, query_string_args=None):
+        return self._send_request(
+            'GET',
+            url,
+            query_string_args,
+            deadline=deadline,
+            )
+
+    def send_download_request(
+        self,
+        url,
+        destination,
+        query_string_args=None,
+        chunk_size=_DEFAULT_DOWNLOAD_CHUNK_SIZE,
+        max_size=None,
+        deadline=None,
+        ):
+        """
+        Send a GET request and write the body of the response to \
+        ``destination`` as it is received, instead of buffering it
+
+        The status of the response is validated before anything is written.
+        Such responses are never cached nor shared with identical requests.
+
+        :param str url: The URL or URL path to the endpoint
+        :param destination: A file-like object, a callable taking each \
+            chunk of bytes, or a writable buffer (e.g., a pre-allocated \
+            :class:`bytearray`) which is filled from its start
+        :param dict query_string_args: The query string arguments
+        :param int chunk_size: The number of bytes read at a time
+        :param int max_size: The maximum size of the body in bytes, which \
+            defaults to the size of ``destination`` if it is a buffer
+        :param float deadline: The maximum number of seconds the request \
+            may take until the response starts to be written, as in \
+            :meth:`send_get_request`
+
+        :return: The number of bytes written
+        :raises twapi_connection.exc.ResponseBodyTooLargeError: If the body \
+            is larger than ``max_size``, in which case it is only written \
+            partially and the download is aborted
+
+        """
+        url = self._resolve_url(url)
+        response = self._send_http_request(
+            'GET',
+            url,
+            query_string_args,
+            stream=True,
+            is_response_body_json=False,
+            deadline=_make_deadline(deadline),
+            )
+        return write_response_body(
+            response,
+            destination,
+            chunk_size,
+            max_size,
+            )
+
+    def send_head_request(self, url, query_string_args=None, deadline=None):
         """
         Send a HEAD request
 
         :param str url: The URL or URL path to the endpoint
         :param dict query_string_args: The query string arguments
+        :param float deadline: The maximum number of seconds the call may \
+            take, as in :meth:`send_get_request`
 
         """
-        return self._send_request('HEAD', url, query_string_args)
+        return self._send_request(
+            'HEAD',
+            url,
+            query_string_args,
+            deadline=deadline,
+            )
 
-    def send_post_request(self, url, body_deserialization=None):
+    def send_post_request(
+        self,
+        url,
+        body_deserialization=None,
+        deadline=None,
+        ):
         """
         Send a POST request
 
         :param str url: The URL or URL path to the endpoint
         :param dict body_deserialization: The request's body message \
-            deserialized
+            deserialized. See :meth:`send_put_request` for the bodies that \
+            can be streamed.
+        :param float deadline: The maximum number of seconds the call may \
+            take, as in :meth:`send_get_request`
 
         :return: Decoded version of the ``JSON`` the remote put in \
                 the body of the response.
@@ -96,14 +478,22 @@ class Connection:
             'POST',
             url,
             body_deserialization=body_deserialization,
+            deadline=deadline,
             )
 
-    def send_put_request(self, url, body_deserialization):
+    def send_put_request(self, url, body_deserialization, deadline=None):
         """
         Send a PUT request
 
         :param str url: The URL or URL path to the endpoint
-        :param body_deserialization: The request's body message deserialized
+        :param body_deserialization: The request's body message \
+            deserialized. It can also be an iterator, whose items are \
+            streamed as a ``JSON`` array with chunked transfer encoding, or \
+            the ``JSON`` already serialized in a bytes-like or file-like \
+            object, which is sent as is. Streamed bodies are never retried \
+            nor compressed.
+        :param float deadline: The maximum number of seconds the call may \
+            take, as in :meth:`send_get_request`
 
         :return: Decoded version of the ``JSON`` the remote put in \
                 the body of the response.
@@ -112,18 +502,233 @@ class Connection:
             'PUT',
             url,
             body_deserialization=body_deserialization,
+            deadline=deadline,
             )
 
-    def send_delete_request(self, url):
+    def send_delete_request(self, url, deadline=None):
         """
         Send a DELETE request
 
         :param str url: The URL or URL path to the endpoint
+        :param float deadline: The maximum number of seconds the call may \
+            take, as in :meth:`send_get_request`
 
         :return: Decoded version of the ``JSON`` the remote put in \
                 the body of the response.
         """
-        return self._send_request('DELETE', url)
+        return self._send_request('DELETE', url, deadline=deadline)
+
+    def iter_paginated_items(
+        self,
+        url,
+        query_string_args=None,
+        prefetched_page_count=_DEFAULT_PREFETCHED_PAGE_COUNT,
+        ):
+        """
+        Iterate over the items in a paginated collection
+
+        The following pages are requested in the background, while the
+        items in the current page are consumed.
+
+        :param str url: The URL or URL path to the first page
+        :param dict query_string_args: The query string arguments for the \
+            first page
+        :param int prefetched_page_count: The maximum number of pages \
+            requested ahead of the one being consumed, or ``0`` to request \
+            each page only once the previous one is consumed
+
+        :return: An iterator of the decoded items in the collection
+
+        """
+        return iter_paginated_items(
+            self,
+            url,
+            query_string_args,
+            prefetched_page_count,
+            )
+
+    def send_requests(
+        self,
+        api_calls,
+        max_concurrency=None,
+        is_order_preserved=True,
+        ):
+        """
+        Send the requests described by ``api_calls`` concurrently
+
+        The requests are sent from a pool of ``max_concurrency`` threads
+        sharing this connection's HTTP connection pool, and no more than
+        twice as many requests are pending at any time, so ``api_calls`` may
+        be a lazy iterable of any length.
+
+        Exceptions from the API are reported alongside each request instead of
+        aborting the whole batch.
+
+        :param api_calls: The requests to be sent, described by
+            :data:`~twapi_connection.api_calls.APICall`-like objects
+        :param int max_concurrency: The maximum number of requests in flight,
+            which defaults to the size of the connection pool
+        :param bool is_order_preserved: Whether the outcomes are yielded in
+            the order of ``api_calls``, or as soon as each is available
+
+        :return: An iterator of
+            :data:`~twapi_connection.api_calls.SuccessfulAPICall` and
+            :data:`~twapi_connection.api_calls.UnsuccessfulAPICall` objects
+
+        """
+        max_concurrency = max_concurrency or self._pool_maxsize
+        api_calls = iter(api_calls)
+        pending_api_call_count_limit = max_concurrency * 2
+
+        with ThreadPoolExecutor(max_concurrency) as executor:
+            pending_futures = deque()
+            are_api_calls_exhausted = False
+            while True:
+                while not are_api_calls_exhausted and \
+                        len(pending_futures) < pending_api_call_count_limit:
+                    try:
+                        api_call = next(api_calls)
+                    except StopIteration:
+                        are_api_calls_exhausted = True
+                    else:
+                        future = executor.submit(
+                            get_api_call_outcome,
+                            api_call,
+                            self._send_request,
+                            )
+                        pending_futures.append(future)
+
+                if not pending_futures:
+                    break
+
+                if is_order_preserved:
+                    completed_futures = [pending_futures.popleft()]
+                else:
+                    completed_futures, _ = wait_for_futures(
+                        pending_futures,
+                        return_when=FIRST_COMPLETED,
+                        )
+                    for future in completed_futures:
+                        pending_futures.remove(future)
+
+                for future in completed_futures:
+                    yield future.result()
+
+    def get_connection_pool_statistics(self):
+        """
+        Return the statistics of the HTTP connection pools
+
+        :return: :data:`~twapi_connection.adapters.ConnectionPoolStatistics` \
+            by the origin of the pool (e.g., \
+            ``https://www.2degreesnetwork.com:443``)
+        :rtype: dict
+
+        """
+        return self._http_adapter.get_connection_pool_statistics()
+
+    def get_transfer_statistics(self):
+        """
+        Return the number of bytes in the bodies of the requests sent and the
+        responses received, before compression and on the wire
+
+        The compression ratios can be worked out with
+        :func:`~twapi_connection.compression.get_compression_ratio`.
+        Streamed responses are not taken into account.
+
+        :rtype: :data:`~twapi_connection.compression.TransferStatistics`
+
+        """
+        return self._transfer_statistics_collector.get_statistics()
+
+    def get_coalesced_request_count(self):
+        """
+        Return the number of requests that shared the response of an
+        identical request in progress
+
+        """
+        if self._request_coalescer:
+            coalesced_request_count = \
+                self._request_coalescer.get_coalesced_call_count()
+        else:
+            coalesced_request_count = 0
+        return coalesced_request_count
+
+    def warm_up(self, connection_count):
+        """
+        Open up to ``connection_count`` keep-alive connections to the API,
+        so that the next requests do not wait for the DNS resolution, and
+        the TCP and TLS handshakes.
+
+        The connections already idle in the pool count towards
+        ``connection_count``, which is capped to ``pool_maxsize``. Failing
+        to connect is not an error, as the next request reports it anyway.
+        Connections through a proxy are not opened.
+
+        :return: The number of idle connections to the API
+        :rtype: int
+
+        """
+        prepared_request = \
+            self._session.prepare_request(Request('HEAD', self._api_url))
+        send_kwargs = self._session.merge_environment_settings(
+            prepared_request.url,
+            {},
+            None,
+            None,
+            None,
+            )
+        idle_connection_count = self._http_adapter.warm_up(
+            prepared_request,
+            connection_count,
+            verify=send_kwargs['verify'],
+            proxies=send_kwargs['proxies'],
+            cert=send_kwargs['cert'],
+            )
+        return idle_connection_count
+
+    def reset_after_fork(self):
+        """
+        Discard the state inherited from the parent process: the keep-alive
+        connections, the requests being coalesced and the threads sending
+        hedged requests or maintaining the keep-alive connections. Then start
+        opening the number of connections set in ``warm_up_after_fork``, if
+        any.
+
+        This is called in the child process after each fork. It only needs
+        to be called explicitly on platforms without
+        :func:`os.register_at_fork`.
+
+        """
+        reset_session_after_fork(self._session)
+
+        if self._hedging_executor:
+            self._hedging_executor = \
+                ThreadPoolExecutor(self._pool_maxsize * 2)
+
+        if self._request_coalescer:
+            self._request_coalescer = CallCoalescer()
+
+        self._keep_alive_manager = self._start_keep_alive_manager()
+
+        if self._warm_up_after_fork:
+            warm_up_thread = Thread(
+                target=self.warm_up,
+                args=(self._warm_up_after_fork,),
+                daemon=True,
+                )
+            warm_up_thread.start()
+
+    def _start_keep_alive_manager(self):
+        if not self._keep_alive_policy:
+            return None
+
+        keep_alive_manager = KeepAliveManager(
+            self._keep_alive_policy,
+            self._http_adapter,
+            self.warm_up,
+            )
+        keep_alive_manager.start()
+        return keep_alive_manager
 
     def _send_request(
         self,
@@ -131,77 +736,399 @@ class Connection:
         url,
         query_string_args=None,
         body_deserialization=None,
+        deadline=None,
         ):
-        if url.startswith(self._api_url):
-            url = url
+        url = self._resolve_url(url)
+        deadline = _make_deadline(deadline)
+
+        if self._request_coalescer and method in _COALESCIBLE_HTTP_METHODS:
+            request_key = get_request_key(method, url, query_string_args)
+            while True:
+                # Identical requests do not wait for the one in progress past
+                # their own deadline
+                wait_timeout = deadline and deadline.get_remaining_time()
+                try:
+                    response = self._request_coalescer.call(
+                        request_key,
+                        self._send_uncoalesced_request,
+                        method,
+                        url,
+                        query_string_args,
+                        deadline=deadline,
+                        wait_timeout=wait_timeout,
+                        )
+                except TimeoutError:
+                    raise DeadlineExceededError()
+                except DeadlineExceededError:
+                    # The request in progress may have had a shorter deadline,
+                    # in which case this one is sent again
+                    if deadline and deadline.has_expired():
+                        raise
+                else:
+                    break
         else:
-            url = self._api_url + url
+            response = self._send_uncoalesced_request(
+                method,
+                url,
+                query_string_args,
+                body_deserialization,
+                deadline,
+                )
+        return response
 
-        query_string_args = query_string_args or {}
+    def _send_uncoalesced_request(
+        self,
+        method,
+        url,
+        query_string_args=None,
+        body_deserialization=None,
+        deadline=None,
+        ):
+        if self._response_cache and method == 'GET':
+            response = self._send_cacheable_request(
+                url,
+                query_string_args,
+                deadline,
+                )
+        else:
+            response = self._send_http_request(
+                method,
+                url,
+                query_string_args,
+                body_deserialization,
+                deadline=deadline,
+                )
+        return JSONResponse.init_from_response(response, self._json_codec)
+
+    def _get_response_cache_key(self, url, query_string_args):
+        authentication_identity = \
+            get_authentication_identity(self._authentication_handler) or \
+            self._response_cache_namespace
+        request_key = get_request_key('GET', url, query_string_args)
+        return '{} {}'.format(authentication_identity, request_key)
 
-        request_headers = \
-            {'content-type': 'application/json'} if body_deserialization else {}
+    def _send_cacheable_request(self, url, query_string_args, deadline=None):
+        response_cache = self._response_cache
+        cache_key = self._get_response_cache_key(url, query_string_args)
+        cache_entry = response_cache.get_entry(cache_key)
 
+        if cache_entry and response_cache.is_entry_fresh(cache_entry):
+            response_cache.record_hit()
+            return cache_entry.make_response()
+
+        if cache_entry:
+            request_headers = cache_entry.get_revalidation_headers()
+        else:
+            request_headers = None
+        response = self._send_http_request(
+            'GET',
+            url,
+            query_string_args,
+            request_headers=request_headers,
+            deadline=deadline,
+            )
+
+        if response.status_code == HTTPStatus.NOT_MODIFIED:
+            response_cache.refresh_entry(cache_key, cache_entry)
+            response_cache.record_revalidation()
+            response = cache_entry.make_response()
+        else:
+            if response.status_code == HTTPStatus.OK:
+                response_cache.set_entry(cache_key, response)
+            response_cache.record_miss()
+
+        return response
+
+    def _send_http_request(
+        self,
+        method,
+        url,
+        query_string_args=None,
+        body_deserialization=None,
+        request_headers=None,
+        stream=False,
+        is_response_body_json=True,
+        deadline=None,
+        ):
+        query_string_args = query_string_args or {}
+
+        request_headers = dict(request_headers or {})
         if body_deserialization:
-            request_body_serialization = json_serialize(body_deserialization)
+            request_headers['content-type'] = 'application/json'
+            request_body_serialization = \
+                self._serialize_request_body(body_deserialization)
         else:
             request_body_serialization = None
 
-        response = self._session.request(
-            method,
-            url,
-            params=query_string_args,
-            auth=self._authentication_handler,
-            data=request_body_serialization,
-            headers=request_headers,
-            timeout=self._timeout,
-            )
+        # Bodies streamed from iterators and files cannot be sent again, so
+        # they are never retried nor compressed
+        is_request_body_streamed = request_body_serialization is not None \
+            and not isinstance(request_body_serialization, (bytes, memoryview))
+        if request_body_serialization and not is_request_body_streamed:
+            request_body_size = len(request_body_serialization)
+            compression_policy = self._request_body_compression_policy
+            if compression_policy:
+                compressed_request_body_serialization = \
+                    compression_policy.compress(request_body_serialization)
+            else:
+                compressed_request_body_serialization = None
+            if compressed_request_body_serialization is not None:
+                request_headers['Content-Encoding'] = \
+                    compression_policy.content_encoding
+                request_body_serialization = \
+                    compressed_request_body_serialization
+            sent_request_body_size = len(request_body_serialization)
+        else:
+            request_body_size = sent_request_body_size = None
+
+        response = None
+        attempt_count = 0
+        total_backoff_time = 0
+        is_conditional_request = \
+            'If-None-Match' in request_headers or \
+            'If-Modified-Since' in request_headers
+        try:
+            while True:
+                if deadline and deadline.has_expired():
+                    raise DeadlineExceededError()
+
+                attempt_count += 1
+                send_http_request_attempt = partial(
+                    self._send_http_request_attempt,
+                    method,
+                    url,
+                    query_string_args,
+                    request_body_serialization,
+                    request_headers,
+                    stream,
+                    deadline,
+                    )
+                if self._hedging_policy and \
+                        method in _HEDGEABLE_HTTP_METHODS:
+                    response = call_with_hedging(
+                        send_http_request_attempt,
+                        self._hedging_policy,
+                        self._hedging_executor,
+                        )
+                else:
+                    response = send_http_request_attempt()
+                self._record_transfer_statistics(
+                    request_body_size,
+                    sent_request_body_size,
+                    response,
+                    stream,
+                    )
 
-        self._require_successful_response(response)
-        self._require_deserializable_response_body(response)
+                if self._retry_policy and not is_request_body_streamed:
+                    retry_delay = self._retry_policy.get_retry_delay(
+                        method,
+                        response,
+                        attempt_count,
+                        )
+                else:
+                    retry_delay = None
+                if retry_delay is None:
+                    break
+                # The error in the response is more useful than the deadline
+                # being exceeded while backing off
+                if deadline and deadline.get_remaining_time() <= retry_delay:
+                    break
+
+                # Release the connection back to the pool before waiting
+                response.close()
+                sleep(retry_delay)
+                total_backoff_time += retry_delay
+
+            self._require_successful_response(response)
+            if stream:
+                self._require_streamable_response_body(
+                    response,
+                    is_response_body_json,
+                    )
+            else:
+                self._require_deserializable_response_body(
+                    response,
+                    is_conditional_request,
+                    )
+        except TwodAPIException as exc:
+            exc.attempt_count = attempt_count
+            exc.total_backoff_time = total_backoff_time
+            if stream and response is not None:
+                response.close()
+            raise
 
         return response
 
-    @staticmethod
-    def _require_successful_response(response):
-        if 400 <= response.status_code < 500:
-            if response.status_code == HTTPStatus.UNAUTHORIZED:
-                exception_class = AuthenticationError
-            elif response.status_code == HTTPStatus.FORBIDDEN:
-                exception_class = AccessDeniedError
-            elif response.status_code == HTTPStatus.NOT_FOUND:
-                exception_class = NotFoundError
+    def _send_http_request_attempt(
+        self,
+        method,
+        url,
+        query_string_args,
+        request_body_serialization,
+        request_headers,
+        stream,
+        deadline=None,
+        ):
+        circuit_breaker = self._circuit_breaker
+        if circuit_breaker:
+            circuit_breaker.require_request_permission(url)
+
+        if self._rate_limiter:
+            rate_limit_timeout = deadline and deadline.get_remaining_time()
+            if not self._rate_limiter.acquire(rate_limit_timeout):
+                if circuit_breaker:
+                    circuit_breaker.release_request_permission(url)
+                raise DeadlineExceededError()
+
+        try:
+            response = self._send_session_request(
+                method,
+                url,
+                query_string_args,
+                request_body_serialization,
+                request_headers,
+                stream,
+                deadline,
+                )
+        except DeadlineExceededError:
+            # The caller ran out of time, which says nothing about the API
+            if circuit_breaker:
+                circuit_breaker.release_request_permission(url)
+            raise
+        except Exception:
+            if circuit_breaker:
+                circuit_breaker.record_failure(url)
+            raise
+
+        if circuit_breaker:
+            if HTTPStatus.INTERNAL_SERVER_ERROR <= response.status_code:
+                circuit_breaker.record_failure(url)
             else:
-                exception_class = ClientError
-            raise exception_class()
-        elif 500 <= response.status_code < 600:
-            raise ServerError(response.reason, response.status_code)
+                circuit_breaker.record_success(url)
 
-    @classmethod
-    def _require_deserializable_response_body(cls, response):
-        if response.status_code in (HTTPStatus.OK, HTTPStatus.NO_CONTENT):
-            if response.content:
-                cls._require_json_response(response)
+        if self._rate_limiter:
+            self._rate_limiter.update_from_response(response)
+
+        return response
+
+    def _send_session_request(
+        self,
+        method,
+        url,
+        query_string_args,
+        request_body_serialization,
+        request_headers,
+        stream,
+        deadline,
+        ):
+        if deadline:
+            timeout = \
+                DeadlineTimeout.init_from_timeout(self._timeout, deadline)
         else:
-            exception_message = \
-                'Unsupported response status {}'.format(response.status_code)
-            raise UnsupportedResponseError(exception_message)
+            timeout = self._timeout
 
-    @staticmethod
-    def _require_json_response(response):
-        content_type_header_value = response.headers.get('Content-Type')
-        if not content_type_header_value:
-            exception_message = 'Response does not specify a Content-Type'
-            raise UnsupportedResponseError(exception_message)
+        if isinstance(request_body_serialization, memoryview):
+            # requests would iterate over the buffer as if it were a stream of
+            # chunks, so it gets a reader of its own for each attempt
+            request_body_serialization = \
+                BufferReader(request_body_serialization)
 
-        content_type = content_type_header_value.split(';')[0].lower()
-        if content_type != 'application/json':
-            exception_message = \
-                'Unsupported response content type {}'.format(content_type)
-            raise UnsupportedResponseError(exception_message)
+        try:
+            if self._prepared_request_factory:
+                prepared_request, send_kwargs = \
+                    self._prepared_request_factory.make_prepared_request(
+                        method,
+                        url,
+                        query_string_args,
+                        request_headers,
+                        request_body_serialization,
+                        )
+                response = self._session.send(
+                    prepared_request,
+                    timeout=timeout,
+                    stream=stream,
+                    **send_kwargs
+                    )
+            else:
+                response = self._session.request(
+                    method,
+                    url,
+                    params=query_string_args,
+                    auth=self._authentication_handler,
+                    data=request_body_serialization,
+                    headers=request_headers,
+                    timeout=timeout,
+                    stream=stream,
+                    )
+        except RequestException as exc:
+            timeout_error = make_timeout_error(exc, deadline)
+            if timeout_error is None:
+                raise
+            raise timeout_error from exc
+        return response
+
+    def _serialize_request_body(self, body_deserialization):
+        if isinstance(body_deserialization, bytes):
+            request_body_serialization = body_deserialization
+        elif isinstance(body_deserialization, (bytearray, memoryview)):
+            # Viewed as bytes without being copied
+            request_body_serialization = \
+                memoryview(body_deserialization).cast('B')
+        elif hasattr(body_deserialization, 'read'):
+            request_body_serialization = body_deserialization
+        elif isinstance(body_deserialization, Iterator):
+            request_body_serialization = iter_json_array_serialization(
+                body_deserialization,
+                self._json_codec,
+                )
+        else:
+            request_body_serialization = \
+                self._json_codec.serialize(body_deserialization)
+        return request_body_serialization
+
+    def _record_transfer_statistics(
+        self,
+        request_body_size,
+        sent_request_body_size,
+        response,
+        is_response_streamed,
+        ):
+        statistics_collector = self._transfer_statistics_collector
+        if request_body_size:
+            statistics_collector.record_request_body(
+                request_body_size,
+                sent_request_body_size,
+                )
+        if not is_response_streamed:
+            response_body_size = len(response.content)
+            # The raw response reports the number of bytes read off the wire,
+            # before decompression
+            get_received_byte_count = getattr(response.raw, 'tell', None)
+            if get_received_byte_count:
+                received_response_body_size = get_received_byte_count()
+            else:
+                received_response_body_size = response_body_size
+            statistics_collector.record_response_body(
+                response_body_size,
+                received_response_body_size,
+                )
 
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
+        # Its threads and connections must not be revived in child processes
+        unregister_fork_aware_object(self)
+        if self._hedging_executor:
+            self._hedging_executor.shutdown(wait=False)
+        if self._keep_alive_manager:
+            self._keep_alive_manager.stop()
         self._session.close()
+
+
+def _make_deadline(duration):
+    if duration is None:
+        deadline = None
+    else:
+        deadline = Deadline(duration)
+    return deadline
@@ -0,0 +1,451 @@
+##############################################################################
+#
+# Copyright (c) 2016, 2degrees Limited.
+# All Rights Reserved.
+#
+# This file is part of twapi-connection
+# <https://github.com/2degrees/twapi-connection>, which is subject to the
+# provisions of the BSD at
+# <http://dev.2degreesnetwork.com/p/2degrees-license.html>. A copy of the
+# license should accompany this distribution. THIS SOFTWARE IS PROVIDED "AS IS"
+# AND ANY AND ALL EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT
+# NOT LIMITED TO, THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST
+# INFRINGEMENT, AND FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+
+from functools import partial
+from socket import SOCK_STREAM
+from socket import gaierror
+from threading import Lock
+from threading import local
+from time import monotonic
+
+from pyrecord import Record
+from requests.adapters import HTTPAdapter
+from requests.utils import select_proxy
+from urllib3.connection import HTTPConnection
+from urllib3.connection import HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool
+from urllib3.connectionpool import HTTPSConnectionPool
+from urllib3.exceptions import EmptyPoolError
+from urllib3.exceptions import ConnectTimeoutError
+from urllib3.exceptions import HTTPError as URLLib3HTTPError
+from urllib3.exceptions import NewConnectionError
+from urllib3.util.connection import allowed_gai_family
+from urllib3.util.connection import is_connection_dropped
+
+from twapi_connection.timeouts import DeadlineRetry
+from twapi_connection.timeouts import DeadlineTimeout
+
+try:
+    from urllib3.exceptions import NameResolutionError
+except ImportError:
+    NameResolutionError = None
+
+
+ConnectionPoolStatistics = Record.create_type(
+    'ConnectionPoolStatistics',
+    'created_connection_count',
+    'reused_connection_count',
+    'discarded_connection_count',
+    'idle_connection_count',
+    )
+
+
+class InstrumentedHTTPAdapter(HTTPAdapter):
+    """
+    :class:`requests.adapters.HTTPAdapter` which keeps statistics about the
+    usage of its connection pools.
+
+    Requests whose bodies are streamed (i.e., neither bytes nor strings) are
+    only retried by :mod:`urllib3` when the connection cannot be
+    established, as the body could have been partly consumed by then.
+
+    When ``max_retries`` is a
+    :class:`~twapi_connection.timeouts.DeadlineRetry`, the requests sent with
+    a :class:`~twapi_connection.timeouts.DeadlineTimeout` are not retried
+    after their deadline.
+
+    :param dns_cache: The cache used to resolve the host names of new
+        connections, if any
+    :type dns_cache: :class:`~twapi_connection.resolving.DNSCache`
+
+    The other arguments are those of :class:`requests.adapters.HTTPAdapter`.
+
+    """
+
+    def __init__(self, *args, dns_cache=None, **kwargs):
+        # The pool manager is initialized by the constructor of the parent
+        self._dns_cache = dns_cache
+        self._thread_local = local()
+
+        super(InstrumentedHTTPAdapter, self).__init__(*args, **kwargs)
+
+    @property
+    def max_retries(self):
+        # The parent reads this attribute while sending each request, so the
+        # retries of the request being sent by the current thread take
+        # precedence
+        thread_local = getattr(self, '_thread_local', None)
+        request_max_retries = getattr(thread_local, 'max_retries', None)
+        return request_max_retries or self._max_retries
+
+    @max_retries.setter
+    def max_retries(self, max_retries):
+        self._max_retries = max_retries
+
+    def send(self, request, stream=False, timeout=None, *args, **kwargs):
+        max_retries = self._max_retries
+        if not isinstance(request.body, (type(None), bytes, str)):
+            max_retries = max_retries.new(read=0, other=0)
+        if isinstance(max_retries, DeadlineRetry) and \
+                isinstance(timeout, DeadlineTimeout):
+            max_retries = max_retries.new(deadline=timeout.get_deadline())
+
+        if max_retries is not self._max_retries:
+            self._thread_local.max_retries = max_retries
+        try:
+            response = super(InstrumentedHTTPAdapter, self).send(
+                request,
+                stream,
+                timeout,
+                *args,
+                **kwargs
+                )
+        finally:
+            self._thread_local.max_retries = None
+        return response
+
+    def init_poolmanager(self, *args, **kwargs):
+        super(InstrumentedHTTPAdapter, self).init_poolmanager(*args, **kwargs)
+
+        dns_cache = getattr(self, '_dns_cache', None)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': partial(
+                _InstrumentedHTTPConnectionPool,
+                dns_cache=dns_cache,
+                ),
+            'https': partial(
+                _InstrumentedHTTPSConnectionPool,
+                dns_cache=dns_cache,
+                ),
+            }
+
+    def warm_up(
+        self,
+        request,
+        connection_count,
+        verify=True,
+        proxies=None,
+        cert=None,
+        ):
+        """
+        Open up to ``connection_count`` keep-alive connections in the pool
+        that ``request`` would be sent through, so that the next requests do
+        not wait for the connections to be established.
+
+        The arguments are those of :meth:`send`. Connections through a proxy
+        are not opened, as the tunnel to the origin is only set up on the
+        first request.
+
+        :return: The number of idle connections open in the pool, which is
+            never more than its maximum size
+        :rtype: int
+
+        """
+        if select_proxy(request.url, proxies):
+            return 0
+
+        if hasattr(self, 'get_connection_with_tls_context'):
+            connection_pool = self.get_connection_with_tls_context(
+                request,
+                verify,
+                proxies,
+                cert,
+                )
+        else:
+            connection_pool = self.get_connection(request.url, proxies)
+            self.cert_verify(connection_pool, request.url, verify, cert)
+        return connection_pool.warm_up(connection_count)
+
+    def close_expired_connections(self, keep_alive_policy):
+        """
+        Close the idle connections which have expired according to
+        ``keep_alive_policy``, or which were closed by the server.
+
+        :type keep_alive_policy:
+            :class:`~twapi_connection.keep_alive.KeepAlivePolicy`
+        :return: The number of connections closed
+        :rtype: int
+
+        """
+        closed_connection_count = 0
+        for connection_pool in self._get_connection_pools():
+            closed_connection_count += \
+                connection_pool.close_expired_connections(keep_alive_policy)
+        return closed_connection_count
+
+    def get_connection_pool_statistics(self):
+        """
+        Return the statistics of the connection pools currently in use.
+
+        The connection counts are cumulative, except for the number of idle
+        connections, which are the open connections waiting in the pool to be
+        reused.
+
+        :return: :data:`ConnectionPoolStatistics` by the origin of the pool
+            (e.g., ``https://www.2degreesnetwork.com:443``)
+        :rtype: dict
+
+        """
+        connection_pool_statistics_by_origin = {}
+        for connection_pool in self._get_connection_pools():
+            origin = '{}://{}:{}'.format(
+                connection_pool.scheme,
+                connection_pool.host,
+                connection_pool.port,
+                )
+            connection_pool_statistics_by_origin[origin] = \
+                connection_pool.get_statistics()
+        return connection_pool_statistics_by_origin
+
+    def _get_connection_pools(self):
+        pools = self.poolmanager.pools
+        with pools.lock:
+            connection_pools = list(pools._container.values())
+        return connection_pools
+
+
+class _ConnectionPoolStatisticsCollector(object):
+
+    def __init__(self):
+        super(_ConnectionPoolStatisticsCollector, self).__init__()
+
+        self._lock = Lock()
+
+        self.created_connection_count = 0
+        self.reused_connection_count = 0
+        self.discarded_connection_count = 0
+
+    def record_connection_creation(self):
+        with self._lock:
+            self.created_connection_count += 1
+
+    def record_connection_reuse(self):
+        with self._lock:
+            self.reused_connection_count += 1
+
+    def record_connection_discard(self):
+        with self._lock:
+            self.discarded_connection_count += 1
+
+
+class _InstrumentedConnectionPoolMixin(object):
+
+    def __init__(self, *args, dns_cache=None, **kwargs):
+        super(_InstrumentedConnectionPoolMixin, self).__init__(*args, **kwargs)
+
+        self._dns_cache = dns_cache
+        self._statistics_collector = _ConnectionPoolStatisticsCollector()
+
+    def _new_conn(self):
+        connection = super(_InstrumentedConnectionPoolMixin, self)._new_conn()
+        connection.statistics_collector = self._statistics_collector
+        connection.dns_cache = self._dns_cache
+        return connection
+
+    def _get_conn(self, *args, **kwargs):
+        connection = \
+            super(_InstrumentedConnectionPoolMixin, self)._get_conn(
+                *args,
+                **kwargs
+                )
+        if connection.sock is not None:
+            self._statistics_collector.record_connection_reuse()
+        return connection
+
+    def warm_up(self, connection_count):
+        pool = self.pool
+        if pool is None:
+            return 0
+
+        connection_count = min(connection_count, pool.maxsize)
+
+        # The connections are all checked out before being returned, so that
+        # the same one is not opened twice. They are checked out from the
+        # parent class so that they are not counted as reused.
+        parent_pool = super(_InstrumentedConnectionPoolMixin, self)
+        connections = []
+        try:
+            for _ in range(connection_count):
+                connection = None
+                try:
+                    connection = parent_pool._get_conn(timeout=0)
+                    if connection.sock is None:
+                        connection.connect()
+                except EmptyPoolError:
+                    break
+                except (URLLib3HTTPError, OSError):
+                    # Warming up is only an optimization, and the failure
+                    # will be reported by the next request
+                    if connection is not None:
+                        connection.close()
+                        connections.append(connection)
+                    break
+                connections.append(connection)
+        finally:
+            for connection in connections:
+                self._put_conn(connection)
+
+        return self._get_idle_connection_count()
+
+    def _put_conn(self, connection):
+        if connection is not None:
+            connection.idle_since = monotonic()
+        super(_InstrumentedConnectionPoolMixin, self)._put_conn(connection)
+
+    def close_expired_connections(self, keep_alive_policy):
+        pool = self.pool
+        if pool is None:
+            return 0
+
+        current_time = monotonic()
+        closed_connection_count = 0
+        # The connections are closed in place, so that the pool reopens them
+        # when they are next checked out
+        with pool.mutex:
+            for connection in pool.queue:
+                if connection is None or connection.sock is None:
+                    continue
+
+                connection_age = current_time - connection.connection_time
+                idle_time = current_time - connection.idle_since
+                is_connection_expired = \
+                    keep_alive_policy.is_connection_expired(
+                        connection_age,
+                        idle_time,
+                        ) or \
+                    is_connection_dropped(connection)
+                if is_connection_expired:
+                    connection.close()
+                    closed_connection_count += 1
+        return closed_connection_count
+
+    def get_statistics(self):
+        statistics_collector = self._statistics_collector
+        statistics = ConnectionPoolStatistics(
+            statistics_collector.created_connection_count,
+            statistics_collector.reused_connection_count,
+            statistics_collector.discarded_connection_count,
+            self._get_idle_connection_count(),
+            )
+        return statistics
+
+    def _get_idle_connection_count(self):
+        pool = self.pool
+        if pool is None:
+            return 0
+
+        with pool.mutex:
+            connections = list(pool.queue)
+        idle_connection_count = sum(
+            1 for c in connections if c is not None and c.sock is not None
+            )
+        return idle_connection_count
+
+
+class _InstrumentedConnectionMixin(object):
+
+    statistics_collector = None
+
+    dns_cache = None
+
+    connection_time = None
+
+    idle_since = None
+
+    def connect(self):
+        super(_InstrumentedConnectionMixin, self).connect()
+
+        self.connection_time = monotonic()
+        self.idle_since = self.connection_time
+
+        if self.statistics_collector:
+            self.statistics_collector.record_connection_creation()
+
+    def _new_conn(self):
+        if self.dns_cache is None:
+            return super(_InstrumentedConnectionMixin, self)._new_conn()
+
+        host = self._dns_host
+        try:
+            addresses = self.dns_cache.resolve(
+                host.strip('[]'),
+                self.port,
+                allowed_gai_family(),
+                SOCK_STREAM,
+                )
+        except gaierror as exc:
+            raise _make_name_resolution_error(self, exc) from exc
+
+        # Each address is connected to as an IP address, which urllib3 does
+        # not resolve, until one of them accepts the connection
+        connection_error = None
+        for address in addresses:
+            self._dns_host = address[4][0]
+            try:
+                return super(_InstrumentedConnectionMixin, self)._new_conn()
+            except (NewConnectionError, ConnectTimeoutError) as exc:
+                connection_error = exc
+            finally:
+                self._dns_host = host
+
+        if connection_error is None:
+            return super(_InstrumentedConnectionMixin, self)._new_conn()
+        raise connection_error
+
+    def close(self):
+        if self.sock is not None and self.statistics_collector:
+            self.statistics_collector.record_connection_discard()
+
+        super(_InstrumentedConnectionMixin, self).close()
+
+
+def _make_name_resolution_error(connection, exception):
+    if NameResolutionError is None:
+        name_resolution_error = NewConnectionError(
+            connection,
+            'Failed to resolve {}: {}'.format(connection.host, exception),
+            )
+    else:
+        name_resolution_error = \
+            NameResolutionError(connection.host, connection, exception)
+    return name_resolution_error
+
+
+class _InstrumentedHTTPConnection(_InstrumentedConnectionMixin, HTTPConnection):
+    pass
+
+
+class _InstrumentedHTTPSConnection(
+    _InstrumentedConnectionMixin,
+    HTTPSConnection,
+    ):
+    pass
+
+
+class _InstrumentedHTTPConnectionPool(
+    _InstrumentedConnectionPoolMixin,
+    HTTPConnectionPool,
+    ):
+
+    ConnectionCls = _InstrumentedHTTPConnection
+
+
+class _InstrumentedHTTPSConnectionPool(
+    _InstrumentedConnectionPoolMixin,
+    HTTPSConnectionPool,
+    ):
+
+    ConnectionCls = _InstrumentedHTTPSConnection
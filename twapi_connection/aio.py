@@ -0,0 +1,336 @@
+##############################################################################
+#
+# Copyright (c) 2016, 2degrees Limited.
+# All Rights Reserved.
+#
+# This file is part of twapi-connection
+# <https://github.com/2degrees/twapi-connection>, which is subject to the
+# provisions of the BSD at
+# <http://dev.2degreesnetwork.com/p/2degrees-license.html>. A copy of the
+# license should accompany this distribution. THIS SOFTWARE IS PROVIDED "AS IS"
+# AND ANY AND ALL EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT
+# NOT LIMITED TO, THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST
+# INFRINGEMENT, AND FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""
+asyncio-native counterpart to :class:`twapi_connection.Connection`.
+
+This module requires `aiohttp <https://aiohttp.readthedocs.io/>`_, which can
+be installed with the ``async`` extra of this distribution.
+
+"""
+
+from asyncio import get_running_loop
+
+from aiohttp import ClientSession
+from aiohttp import ClientTimeout
+from aiohttp import TCPConnector
+from requests.auth import HTTPBasicAuth
+
+from twapi_connection import _BaseConnection
+from twapi_connection import _USER_AGENT
+from twapi_connection.auth import ClientCredentialsAuth
+from twapi_connection.json_codecs import StandardJSONCodec
+from twapi_connection.json_codecs import _UNDESERIALIZED_BODY
+from twapi_connection.json_codecs import get_default_json_codec
+
+
+_DEFAULT_CONNECTION_LIMIT = 100
+
+
+class AsyncConnection(_BaseConnection):
+    """
+    Connection to the 2degrees API whose requests are coroutines.
+
+    A single instance can serve thousands of concurrent requests on one event
+    loop. The underlying HTTP session is created lazily on the first request,
+    so the connection must be used (and closed) on the same event loop.
+
+    :param auth: A :class:`requests.auth.AuthBase` instance that only sets
+        request headers (e.g.,
+        :class:`~twapi_connection.auth.BearerTokenAuth`), a
+        :class:`~twapi_connection.auth.ClientCredentialsAuth` instance or a
+        ``(username, password)`` tuple for basic authentication
+    :param timeout: The connect and read timeout in seconds, or a
+        ``(connect timeout, read timeout)`` tuple
+    :param str api_url: The base URL of the API
+    :param int connection_limit: The maximum number of simultaneous TCP
+        connections; ``0`` means no limit
+    :param rate_limiter: The limiter of the rate at which requests are sent
+    :type rate_limiter:
+        :class:`~twapi_connection.rate_limiting.TokenBucketRateLimiter`
+    :param json_codec: The codec for the JSON in the bodies of requests and
+        responses, which defaults to the fastest one available
+
+    """
+
+    def __init__(
+        self,
+        auth,
+        timeout=None,
+        api_url=None,
+        connection_limit=_DEFAULT_CONNECTION_LIMIT,
+        rate_limiter=None,
+        json_codec=None,
+        ):
+        super(AsyncConnection, self).__init__(api_url)
+
+        if isinstance(auth, tuple):
+            auth = HTTPBasicAuth(*auth)
+        self._authentication_handler = auth
+        if isinstance(auth, ClientCredentialsAuth):
+            auth.set_default_timeout(timeout)
+
+        self._timeout = _get_client_timeout(timeout)
+
+        self._connection_limit = connection_limit
+
+        self._rate_limiter = rate_limiter
+
+        self._json_codec = json_codec or get_default_json_codec()
+
+        self._client_session = None
+
+    async def send_get_request(self, url, query_string_args=None):
+        """
+        Send a GET request
+
+        :param str url: The URL or URL path to the endpoint
+        :param dict query_string_args: The query string arguments
+
+        :return: The response
+        :rtype: AsyncResponse
+
+        """
+        return await self._send_request('GET', url, query_string_args)
+
+    async def send_head_request(self, url, query_string_args=None):
+        """
+        Send a HEAD request
+
+        :param str url: The URL or URL path to the endpoint
+        :param dict query_string_args: The query string arguments
+
+        :rtype: AsyncResponse
+
+        """
+        return await self._send_request('HEAD', url, query_string_args)
+
+    async def send_post_request(self, url, body_deserialization=None):
+        """
+        Send a POST request
+
+        :param str url: The URL or URL path to the endpoint
+        :param dict body_deserialization: The request's body message \
+            deserialized
+
+        :return: The response
+        :rtype: AsyncResponse
+
+        """
+        return await self._send_request(
+            'POST',
+            url,
+            body_deserialization=body_deserialization,
+            )
+
+    async def send_put_request(self, url, body_deserialization):
+        """
+        Send a PUT request
+
+        :param str url: The URL or URL path to the endpoint
+        :param body_deserialization: The request's body message deserialized
+
+        :return: The response
+        :rtype: AsyncResponse
+
+        """
+        return await self._send_request(
+            'PUT',
+            url,
+            body_deserialization=body_deserialization,
+            )
+
+    async def send_delete_request(self, url):
+        """
+        Send a DELETE request
+
+        :param str url: The URL or URL path to the endpoint
+
+        :return: The response
+        :rtype: AsyncResponse
+
+        """
+        return await self._send_request('DELETE', url)
+
+    async def _send_request(
+        self,
+        method,
+        url,
+        query_string_args=None,
+        body_deserialization=None,
+        ):
+        url = self._resolve_url(url)
+
+        query_string_items = _get_query_string_items(query_string_args or {})
+
+        request_headers = {'User-Agent': _USER_AGENT}
+        request_headers.update(await self._get_authentication_headers())
+        if body_deserialization:
+            request_headers['content-type'] = 'application/json'
+            request_body_serialization = \
+                self._json_codec.serialize(body_deserialization)
+        else:
+            request_body_serialization = None
+
+        if self._rate_limiter:
+            await self._rate_limiter.acquire_async()
+
+        client_session = self._get_client_session()
+        async with client_session.request(
+            method,
+            url,
+            params=query_string_items,
+            data=request_body_serialization,
+            headers=request_headers,
+            ) as client_response:
+            response_body = await client_response.read()
+
+        response = AsyncResponse(
+            client_response.status,
+            client_response.reason,
+            client_response.headers,
+            response_body,
+            str(client_response.url),
+            self._json_codec,
+            )
+        if self._rate_limiter:
+            self._rate_limiter.update_from_response(response)
+
+        self._require_successful_response(response)
+        self._require_deserializable_response_body(response)
+
+        return response
+
+    async def _get_authentication_headers(self):
+        authentication_handler = self._authentication_handler
+        if authentication_handler is None:
+            return {}
+
+        request = _HeadersOnlyRequest()
+        if isinstance(authentication_handler, ClientCredentialsAuth) and \
+                not authentication_handler.get_fresh_access_token_value():
+            # Tokens are fetched with requests, which would block the loop
+            event_loop = get_running_loop()
+            await event_loop.run_in_executor(
+                None,
+                authentication_handler,
+                request,
+                )
+        else:
+            authentication_handler(request)
+        return request.headers
+
+    def _get_client_session(self):
+        if self._client_session is None:
+            connector = TCPConnector(limit=self._connection_limit)
+            self._client_session = ClientSession(
+                connector=connector,
+                timeout=self._timeout,
+                )
+        return self._client_session
+
+    async def close(self):
+        """Close the pooled connections to the API."""
+        if self._client_session is not None:
+            await self._client_session.close()
+            self._client_session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+
+class AsyncResponse(object):
+    """
+    Response to a request made through :class:`AsyncConnection`.
+
+    Its interface is the subset of :class:`requests.Response` used by
+    consumers of :class:`twapi_connection.Connection`.
+
+    """
+
+    def __init__(
+        self,
+        status_code,
+        reason,
+        headers,
+        content,
+        url,
+        json_codec=None,
+        ):
+        super(AsyncResponse, self).__init__()
+
+        self.status_code = status_code
+        self.reason = reason
+        self.headers = headers
+        self.content = content
+        self.url = url
+        self._json_codec = json_codec or StandardJSONCodec()
+        self._body_deserialization = _UNDESERIALIZED_BODY
+
+    @property
+    def body_deserialization(self):
+        """
+        The deserialization of the body, which is only computed the first
+        time it is accessed.
+
+        """
+        if self._body_deserialization is _UNDESERIALIZED_BODY:
+            self._body_deserialization = self.json()
+        return self._body_deserialization
+
+    def json(self):
+        return self._json_codec.deserialize(self.content)
+
+
+class _HeadersOnlyRequest(object):
+
+    def __init__(self):
+        super(_HeadersOnlyRequest, self).__init__()
+
+        self.headers = {}
+
+    def register_hook(self, event, hook):
+        # Response hooks are specific to requests
+        pass
+
+
+def _get_client_timeout(timeout):
+    if isinstance(timeout, tuple):
+        connect_timeout, read_timeout = timeout
+    else:
+        connect_timeout = read_timeout = timeout
+    client_timeout = ClientTimeout(
+        total=None,
+        sock_connect=connect_timeout,
+        sock_read=read_timeout,
+        )
+    return client_timeout
+
+
+def _get_query_string_items(query_string_args):
+    query_string_items = []
+    for arg_name, arg_value in query_string_args.items():
+        if isinstance(arg_value, (list, tuple)):
+            arg_values = arg_value
+        else:
+            arg_values = [arg_value]
+
+        for arg_value in arg_values:
+            if arg_value is not None:
+                query_string_items.append((arg_name, str(arg_value)))
+    return query_string_items
@@ -0,0 +1,101 @@
+##############################################################################
+#
+# Copyright (c) 2015-2016, 2degrees Limited.
+# All Rights Reserved.
+#
+# This file is part of twapi-connection
+# <https://github.com/2degrees/twapi-connection>, which is subject to the
+# provisions of the BSD at
+# <http://dev.2degreesnetwork.com/p/2degrees-license.html>. A copy of the
+# license should accompany this distribution. THIS SOFTWARE IS PROVIDED "AS IS"
+# AND ANY AND ALL EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT
+# NOT LIMITED TO, THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST
+# INFRINGEMENT, AND FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+
+from urllib.parse import urlencode
+
+from pyrecord import Record
+
+from twapi_connection.exc import TwodAPIException
+
+
+APICall = Record.create_type(
+    'APICall',
+    'url',
+    'http_method',
+    'query_string_args',
+    'request_body_deserialization',
+    query_string_args=None,
+    request_body_deserialization=None,
+    )
+
+
+SuccessfulAPICall = APICall.extend_type('SuccessfulAPICall', 'response')
+
+
+UnsuccessfulAPICall = APICall.extend_type('UnsuccessfulAPICall', 'exception')
+
+
+def get_api_call_outcome(api_call, request_sender):
+    """
+    Send the request described by ``api_call``.
+
+    :param api_call: The description of the request, with the same fields as
+        :data:`APICall`
+    :param callable request_sender: Callable which takes the HTTP method,
+        the URL, the query string arguments and the body deserialization, and
+        returns the response
+    :return: The API call along with its response, or along with the
+        exception raised by the API if the request was unsuccessful
+    :rtype: :data:`SuccessfulAPICall` or :data:`UnsuccessfulAPICall`
+
+    """
+    api_call_field_values = {
+        'url': api_call.url,
+        'http_method': api_call.http_method,
+        'query_string_args': api_call.query_string_args,
+        'request_body_deserialization': api_call.request_body_deserialization,
+        }
+    try:
+        response = request_sender(
+            api_call.http_method,
+            api_call.url,
+            api_call.query_string_args,
+            api_call.request_body_deserialization,
+            )
+    except TwodAPIException as exc:
+        api_call_outcome = \
+            UnsuccessfulAPICall(exception=exc, **api_call_field_values)
+    else:
+        api_call_outcome = \
+            SuccessfulAPICall(response=response, **api_call_field_values)
+    return api_call_outcome
+
+
+def get_request_key(http_method, url, query_string_args):
+    """
+    Return a string identifying the request described by the arguments.
+
+    Requests whose query string arguments only differ in their order, or in
+    arguments set to ``None`` (which are not sent), share the same key.
+
+    """
+    query_string_items = []
+    for arg_name, arg_value in (query_string_args or {}).items():
+        if isinstance(arg_value, (list, tuple)):
+            arg_values = arg_value
+        else:
+            arg_values = [arg_value]
+        for arg_value in arg_values:
+            if arg_value is not None:
+                query_string_items.append((str(arg_name), str(arg_value)))
+    query_string_items.sort()
+
+    request_key = '{} {}?{}'.format(
+        http_method,
+        url,
+        urlencode(query_string_items),
+        )
+    return request_key
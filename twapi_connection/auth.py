@@ -14,7 +14,55 @@
 #
 ##############################################################################
 
+try:
+    from http import HTTPStatus
+except ImportError:
+    from http import client as HTTPStatus
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from hashlib import sha256
+from json import dumps as json_serialize
+from json import loads as json_deserialize
+from os import close as close_file_descriptor
+from os import O_CREAT
+from os import O_RDWR
+from os import open as open_file_descriptor
+from os import remove as remove_file
+from os import replace as replace_file
+from os import stat as get_file_status
+from os.path import dirname
+from tempfile import NamedTemporaryFile
+from threading import Lock
+from threading import local
+from time import time
+
+from pyrecord import Record
 from requests.auth import AuthBase
+from requests.auth import HTTPBasicAuth
+from requests.auth import HTTPDigestAuth
+from requests.sessions import Session
+
+from twapi_connection.exc import AuthenticationError
+from twapi_connection.exc import UnsupportedResponseError
+from twapi_connection.forking import register_fork_aware_object
+from twapi_connection.forking import reset_session_after_fork
+
+
+_DEFAULT_REFRESH_MARGIN = 60
+
+_LOCK_FILE_MODE = 0o600
+
+
+AccessToken = Record.create_type('AccessToken', 'value', 'expiry_time')
+"""
+Access token obtained from a token endpoint, with the time at which it
+expires (in seconds since the epoch), if known.
+
+"""
 
 
 class BearerTokenAuth(AuthBase):
@@ -24,3 +72,502 @@ class BearerTokenAuth(AuthBase):
     def __call__(self, request):
         request.headers['Authorization'] = 'Bearer {}'.format(self.token)
         return request
+
+    def get_credentials(self):
+        return ('bearer', self.token)
+
+
+class TokenCache(object):
+    """
+    Base class for the stores of the access token of a
+    :class:`ClientCredentialsAuth`.
+
+    Besides the token itself, a cache provides the lock held while the token
+    is refreshed, so that concurrent users of the cache fetch a single token
+    at a time. Reading the token must not wait for this lock.
+
+    """
+
+    def get_access_token(self):
+        """
+        Return the cached :data:`AccessToken`, or ``None`` if there is none.
+
+        """
+        raise NotImplementedError()
+
+    def set_access_token(self, access_token):
+        raise NotImplementedError()
+
+    def delete_access_token(self):
+        raise NotImplementedError()
+
+    def acquire_refresh_lock(self, blocking=True):
+        """
+        Acquire the refresh lock, waiting for it if ``blocking``.
+
+        :return: Whether the lock was acquired
+
+        """
+        raise NotImplementedError()
+
+    def release_refresh_lock(self):
+        raise NotImplementedError()
+
+    def reset_after_fork(self):
+        """
+        Discard the refresh lock held in the parent process, if any, which
+        the child process must not release or wait for.
+
+        """
+        pass
+
+
+class MemoryTokenCache(TokenCache):
+    """
+    Token cache private to the current process.
+
+    It is safe to share an instance between threads.
+
+    """
+
+    def __init__(self):
+        super(MemoryTokenCache, self).__init__()
+
+        self._access_token = None
+        self._refresh_lock = Lock()
+
+    def get_access_token(self):
+        return self._access_token
+
+    def set_access_token(self, access_token):
+        self._access_token = access_token
+
+    def delete_access_token(self):
+        self._access_token = None
+
+    def acquire_refresh_lock(self, blocking=True):
+        return self._refresh_lock.acquire(blocking)
+
+    def release_refresh_lock(self):
+        self._refresh_lock.release()
+
+    def reset_after_fork(self):
+        # The lock may have been held by a thread which does not exist in the
+        # child process
+        self._refresh_lock = Lock()
+
+
+class FileTokenCache(TokenCache):
+    """
+    Token cache stored in a file, which can be shared by the processes on a
+    host (e.g., the workers of a pre-fork server) so that only one of them
+    refreshes the token on behalf of all of them.
+
+    The token is replaced atomically by renaming a new file over the old
+    one, so it is read without any locking. It is only re-read when the file
+    has changed. The refresh lock is an exclusive :func:`fcntl.flock` on a
+    separate lock file, which is released by the operating system if its
+    holder dies.
+
+    The files are only readable by their owner, as they contain a secret.
+    Each client and scope must have a file of its own.
+
+    It is safe to share an instance between threads and forked processes.
+    It is only available on platforms with :mod:`fcntl`.
+
+    :param str path: The path to the file, which is created if it does not
+        exist; the lock file has the same path with the suffix ``.lock``
+
+    """
+
+    def __init__(self, path):
+        if fcntl is None:
+            raise ImportError('fcntl is not available')
+
+        super(FileTokenCache, self).__init__()
+
+        self._path = path
+        self._lock_file_path = path + '.lock'
+
+        self._thread_local = local()
+        # The status of the file last read and its token, as a single
+        # attribute so that threads never pair up different ones
+        self._file_read = (None, None)
+
+    def get_access_token(self):
+        try:
+            file_status = get_file_status(self._path)
+        except FileNotFoundError:
+            return None
+
+        # The file is replaced rather than modified, so a new inode denotes
+        # a new token
+        file_status_key = (
+            file_status.st_ino,
+            file_status.st_mtime_ns,
+            file_status.st_size,
+            )
+        cached_file_status_key, cached_access_token = self._file_read
+        if file_status_key == cached_file_status_key:
+            return cached_access_token
+
+        try:
+            with open(self._path, 'r') as token_file:
+                access_token_serialization = token_file.read()
+        except FileNotFoundError:
+            return None
+        access_token = _deserialize_access_token(access_token_serialization)
+
+        self._file_read = (file_status_key, access_token)
+        return access_token
+
+    def set_access_token(self, access_token):
+        token_file = NamedTemporaryFile(
+            'w',
+            dir=dirname(self._path) or None,
+            prefix='.',
+            suffix='.tmp',
+            delete=False,
+            )
+        try:
+            with token_file:
+                token_file.write(_serialize_access_token(access_token))
+            replace_file(token_file.name, self._path)
+        except BaseException:
+            remove_file(token_file.name)
+            raise
+
+    def delete_access_token(self):
+        try:
+            remove_file(self._path)
+        except FileNotFoundError:
+            pass
+
+    def acquire_refresh_lock(self, blocking=True):
+        # Each acquisition uses a file descriptor of its own, so that the
+        # lock also excludes the other threads in this process
+        lock_file_descriptor = open_file_descriptor(
+            self._lock_file_path,
+            O_RDWR | O_CREAT,
+            _LOCK_FILE_MODE,
+            )
+        lock_operation = fcntl.LOCK_EX
+        if not blocking:
+            lock_operation |= fcntl.LOCK_NB
+
+        try:
+            fcntl.flock(lock_file_descriptor, lock_operation)
+        except BlockingIOError:
+            close_file_descriptor(lock_file_descriptor)
+            return False
+        except BaseException:
+            close_file_descriptor(lock_file_descriptor)
+            raise
+
+        self._thread_local.lock_file_descriptor = lock_file_descriptor
+        return True
+
+    def release_refresh_lock(self):
+        lock_file_descriptor = self._thread_local.lock_file_descriptor
+        del self._thread_local.lock_file_descriptor
+        try:
+            fcntl.flock(lock_file_descriptor, fcntl.LOCK_UN)
+        finally:
+            close_file_descriptor(lock_file_descriptor)
+
+    def reset_after_fork(self):
+        # The file descriptor inherited shares the lock of the parent
+        # process, which is kept by closing it without unlocking it
+        lock_file_descriptor = \
+            getattr(self._thread_local, 'lock_file_descriptor', None)
+        if lock_file_descriptor is not None:
+            close_file_descriptor(lock_file_descriptor)
+        self._thread_local = local()
+
+
+def _serialize_access_token(access_token):
+    access_token_serialization = json_serialize({
+        'value': access_token.value,
+        'expiry_time': access_token.expiry_time,
+        })
+    return access_token_serialization
+
+
+def _deserialize_access_token(access_token_serialization):
+    try:
+        access_token_deserialization = \
+            json_deserialize(access_token_serialization)
+        access_token = AccessToken(
+            access_token_deserialization['value'],
+            access_token_deserialization['expiry_time'],
+            )
+    except (ValueError, KeyError, TypeError):
+        # A corrupt token is refreshed like a missing one
+        access_token = None
+    return access_token
+
+
+class ClientCredentialsAuth(AuthBase):
+    """
+    Authentication handler obtaining bearer tokens from an OAuth 2 token
+    endpoint with the client credentials grant.
+
+    Tokens are cached until they are about to expire. Once a token is within
+    ``refresh_margin`` seconds of its expiry, the first request to notice
+    refreshes it while concurrent requests keep using the current token;
+    only once a token has expired do requests wait for the refresh. Either
+    way, a single token is fetched at a time.
+
+    A request whose response has the HTTP status 401 is retried once with a
+    fresh token, unless its body is streamed. This does not apply to
+    :class:`~twapi_connection.aio.AsyncConnection`, which fetches tokens in
+    the default executor of the event loop so as not to block it.
+
+    A single instance can be shared by any number of threads and
+    connections. To share tokens between processes as well, use a
+    :class:`FileTokenCache`.
+
+    :param str token_url: The URL of the token endpoint
+    :param str client_id: The client identifier
+    :param str client_secret: The client secret, sent with HTTP basic
+        authentication
+    :param str scope: The scope requested, if any
+    :param float refresh_margin: The number of seconds before the expiry of
+        a token from which it is refreshed
+    :param timeout: The timeout of the requests to the token endpoint, as
+        accepted by :mod:`requests`, which defaults to the timeout of the
+        first connection using this handler
+    :param token_cache: The store of the access token, which defaults to a
+        :class:`MemoryTokenCache`
+    :type token_cache: :class:`TokenCache`
+
+    """
+
+    def __init__(
+        self,
+        token_url,
+        client_id,
+        client_secret,
+        scope=None,
+        refresh_margin=_DEFAULT_REFRESH_MARGIN,
+        timeout=None,
+        token_cache=None,
+        ):
+        super(ClientCredentialsAuth, self).__init__()
+
+        self._token_url = token_url
+        self._client_credentials = HTTPBasicAuth(client_id, client_secret)
+        self._scope = scope
+        self._refresh_margin = refresh_margin
+        self._timeout = timeout
+
+        self._token_cache = token_cache or MemoryTokenCache()
+
+        self._session = Session()
+        register_fork_aware_object(self)
+
+    def __call__(self, request):
+        access_token_value = self.get_access_token_value()
+        _set_authorization_header(request, access_token_value)
+        request.register_hook('response', self._retry_unauthorized_request)
+        return request
+
+    def get_credentials(self):
+        client_credentials = self._client_credentials
+        credentials = (
+            'client_credentials',
+            self._token_url,
+            client_credentials.username,
+            client_credentials.password,
+            self._scope,
+            )
+        return credentials
+
+    def set_default_timeout(self, timeout):
+        """
+        Use ``timeout`` for the requests to the token endpoint, unless a
+        timeout was set already.
+
+        """
+        if self._timeout is None:
+            self._timeout = timeout
+
+    def get_fresh_access_token_value(self):
+        """
+        Return the cached access token if it does not need refreshing, or
+        ``None`` otherwise, without waiting for a refresh in progress.
+
+        """
+        access_token = self._token_cache.get_access_token()
+        if self._is_access_token_fresh(access_token):
+            return access_token.value
+        return None
+
+    def get_access_token_value(self):
+        """
+        Return a valid access token, fetching a new one if necessary.
+
+        :raises twapi_connection.exc.AuthenticationError: If the token
+            endpoint rejects the client credentials
+
+        """
+        token_cache = self._token_cache
+        access_token = token_cache.get_access_token()
+        if self._is_access_token_fresh(access_token):
+            return access_token.value
+
+        if self._is_access_token_valid(access_token):
+            # Requests can carry on with the current token while it is being
+            # refreshed by another thread or process
+            if not token_cache.acquire_refresh_lock(blocking=False):
+                return access_token.value
+        else:
+            token_cache.acquire_refresh_lock()
+
+        try:
+            access_token = token_cache.get_access_token()
+            if not self._is_access_token_fresh(access_token):
+                access_token = self._fetch_access_token()
+                token_cache.set_access_token(access_token)
+        finally:
+            token_cache.release_refresh_lock()
+        return access_token.value
+
+    def invalidate_access_token(self, access_token_value):
+        """
+        Discard the current access token if its value is
+        ``access_token_value``, so that the next request gets a new one.
+
+        Tokens refreshed in the meantime are kept.
+
+        """
+        token_cache = self._token_cache
+        token_cache.acquire_refresh_lock()
+        try:
+            access_token = token_cache.get_access_token()
+            if access_token and access_token.value == access_token_value:
+                token_cache.delete_access_token()
+        finally:
+            token_cache.release_refresh_lock()
+
+    def reset_after_fork(self):
+        """
+        Discard the keep-alive connections to the token endpoint and the
+        refresh lock of the token cache inherited from the parent process.
+
+        This is called in the child process after each fork. It only needs
+        to be called explicitly on platforms without
+        :func:`os.register_at_fork`.
+
+        """
+        reset_session_after_fork(self._session)
+        self._token_cache.reset_after_fork()
+
+    def _retry_unauthorized_request(self, response, **kwargs):
+        if response.status_code != HTTPStatus.UNAUTHORIZED:
+            return response
+
+        request = response.request
+        if not isinstance(request.body, (type(None), bytes, str)):
+            return response
+
+        authorization_header_value = request.headers.get('Authorization', '')
+        _, _, access_token_value = authorization_header_value.partition(' ')
+        self.invalidate_access_token(access_token_value)
+
+        # Release the connection before reusing it
+        response.content
+        response.close()
+
+        retried_request = request.copy()
+        _set_authorization_header(
+            retried_request,
+            self.get_access_token_value(),
+            )
+        retried_response = response.connection.send(retried_request, **kwargs)
+        retried_response.history.append(response)
+        retried_response.request = retried_request
+        return retried_response
+
+    def _fetch_access_token(self):
+        request_data = {'grant_type': 'client_credentials'}
+        if self._scope:
+            request_data['scope'] = self._scope
+
+        request_time = time()
+        response = self._session.post(
+            self._token_url,
+            data=request_data,
+            auth=self._client_credentials,
+            timeout=self._timeout,
+            )
+
+        if response.status_code in \
+                (HTTPStatus.BAD_REQUEST, HTTPStatus.UNAUTHORIZED):
+            raise AuthenticationError(response.text)
+        if response.status_code != HTTPStatus.OK:
+            raise UnsupportedResponseError(
+                'Unsupported token response status {}'.format(
+                    response.status_code,
+                    ),
+                )
+
+        try:
+            response_body_deserialization = response.json()
+            access_token_value = response_body_deserialization['access_token']
+        except (ValueError, KeyError):
+            raise UnsupportedResponseError('Invalid token response')
+
+        expires_in = response_body_deserialization.get('expires_in')
+        if expires_in is None:
+            expiry_time = None
+        else:
+            expiry_time = request_time + float(expires_in)
+        return AccessToken(access_token_value, expiry_time)
+
+    def _is_access_token_fresh(self, access_token):
+        if access_token is None:
+            return False
+        if access_token.expiry_time is None:
+            return True
+        return time() < access_token.expiry_time - self._refresh_margin
+
+    @staticmethod
+    def _is_access_token_valid(access_token):
+        if access_token is None:
+            return False
+        if access_token.expiry_time is None:
+            return True
+        return time() < access_token.expiry_time
+
+
+def get_authentication_identity(authentication_handler):
+    """
+    Return a digest of the credentials used by ``authentication_handler``,
+    or ``None`` if they are unknown.
+
+    Besides the handlers in this module, the credentials of the
+    ``(username, password)`` tuples, of the basic and digest authentication
+    handlers of :mod:`requests` and of any handler with a
+    ``get_credentials()`` method returning a tuple are known.
+
+    """
+    if authentication_handler is None:
+        credentials = ()
+    elif isinstance(authentication_handler, tuple):
+        credentials = ('basic',) + authentication_handler
+    elif isinstance(authentication_handler, (HTTPBasicAuth, HTTPDigestAuth)):
+        credentials = (
+            type(authentication_handler).__name__,
+            authentication_handler.username,
+            authentication_handler.password,
+            )
+    elif hasattr(authentication_handler, 'get_credentials'):
+        credentials = tuple(authentication_handler.get_credentials())
+    else:
+        return None
+    return sha256(repr(credentials).encode('utf-8')).hexdigest()
+
+
+def _set_authorization_header(request, access_token_value):
+    request.headers['Authorization'] = 'Bearer {}'.format(access_token_value)
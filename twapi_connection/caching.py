@@ -0,0 +1,489 @@
+##############################################################################
+#
+# Copyright (c) 2016, 2degrees Limited.
+# All Rights Reserved.
+#
+# This file is part of twapi-connection
+# <https://github.com/2degrees/twapi-connection>, which is subject to the
+# provisions of the BSD at
+# <http://dev.2degreesnetwork.com/p/2degrees-license.html>. A copy of the
+# license should accompany this distribution. THIS SOFTWARE IS PROVIDED "AS IS"
+# AND ANY AND ALL EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT
+# NOT LIMITED TO, THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST
+# INFRINGEMENT, AND FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""
+Caches for the responses to ``GET`` requests.
+
+Cached responses are served without contacting the API for ``ttl`` seconds
+after they were received. Once stale, a response that came with an ``ETag``
+or ``Last-Modified`` header is revalidated with a conditional request, and
+served again from the cache if the API replies with ``304 Not Modified``.
+
+The cache keys used by :class:`~twapi_connection.Connection` include a digest
+of its credentials, so a cache can be shared by connections authenticating
+differently without serving the responses obtained by one to the other.
+
+"""
+
+from collections import OrderedDict
+from contextlib import contextmanager
+from json import dumps as json_serialize
+from json import loads as json_deserialize
+from os import getpid
+from sqlite3 import connect as sqlite_connect
+from threading import Lock
+from threading import local
+from time import time
+
+from pyrecord import Record
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+
+CacheStatistics = Record.create_type(
+    'CacheStatistics',
+    'hit_count',
+    'miss_count',
+    'revalidation_count',
+    )
+
+
+_DEFAULT_TTL = 60
+
+_DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+
+_SQLITE_BUSY_TIMEOUT = 30
+
+_SQLITE_ACCESS_TIME_RESOLUTION = 60
+
+_SQLITE_SCHEMA_STATEMENTS = (
+    """
+    CREATE TABLE IF NOT EXISTS response_cache_entries (
+        cache_key TEXT PRIMARY KEY,
+        status_code INTEGER NOT NULL,
+        reason TEXT,
+        headers TEXT NOT NULL,
+        content BLOB NOT NULL,
+        url TEXT,
+        storage_time REAL NOT NULL,
+        access_time REAL NOT NULL
+        )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS response_cache_entries_by_access_time
+    ON response_cache_entries (access_time)
+    """,
+    # The total size of the bodies is kept up-to-date by the triggers below,
+    # so that it need not be computed on each write
+    """
+    CREATE TABLE IF NOT EXISTS response_cache_size (
+        size INTEGER NOT NULL
+        )
+    """,
+    """
+    INSERT INTO response_cache_size (size)
+    SELECT (
+        SELECT COALESCE(SUM(LENGTH(content)), 0) FROM response_cache_entries
+        )
+    WHERE NOT EXISTS (SELECT * FROM response_cache_size)
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS response_cache_entry_insertion
+    AFTER INSERT ON response_cache_entries
+    BEGIN
+        UPDATE response_cache_size SET size = size + LENGTH(NEW.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS response_cache_entry_update
+    AFTER UPDATE OF content ON response_cache_entries
+    BEGIN
+        UPDATE response_cache_size
+        SET size = size - LENGTH(OLD.content) + LENGTH(NEW.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS response_cache_entry_deletion
+    AFTER DELETE ON response_cache_entries
+    BEGIN
+        UPDATE response_cache_size SET size = size - LENGTH(OLD.content);
+    END
+    """,
+    )
+
+
+class ResponseCache(object):
+    """
+    Base class for response caches.
+
+    Sub-classes implement the storage of the cache entries.
+
+    :param ttl: The number of seconds during which a response is fresh
+
+    """
+
+    def __init__(self, ttl=_DEFAULT_TTL):
+        super(ResponseCache, self).__init__()
+
+        self._ttl = ttl
+
+        self._statistics_lock = Lock()
+        self._hit_count = 0
+        self._miss_count = 0
+        self._revalidation_count = 0
+
+    def get_statistics(self):
+        """
+        Return the number of responses served from the cache without
+        contacting the API (hits), the number of responses downloaded
+        (misses) and the number of stale responses served from the cache
+        after being revalidated.
+
+        :rtype: :data:`CacheStatistics`
+
+        """
+        with self._statistics_lock:
+            statistics = CacheStatistics(
+                self._hit_count,
+                self._miss_count,
+                self._revalidation_count,
+                )
+        return statistics
+
+    def get_entry(self, cache_key):
+        """
+        Return the entry for ``cache_key``, or ``None`` if there is no such
+        entry or it is stale and cannot be revalidated.
+
+        :rtype: :class:`CacheEntry`
+
+        """
+        cache_entry = self._get_entry(cache_key)
+        if cache_entry and not cache_entry.is_fresh(self._ttl) and \
+                not cache_entry.is_revalidatable():
+            self._delete_entry(cache_key)
+            cache_entry = None
+        return cache_entry
+
+    def set_entry(self, cache_key, response):
+        """
+        Store ``response`` under ``cache_key`` unless the API forbids it.
+
+        :return: The new entry, or ``None`` if the response was not stored
+
+        """
+        cache_control = response.headers.get('Cache-Control', '').lower()
+        if 'no-store' in cache_control:
+            return None
+
+        cache_entry = CacheEntry.init_from_response(response)
+        self._set_entry(cache_key, cache_entry)
+        return cache_entry
+
+    def refresh_entry(self, cache_key, cache_entry):
+        """Mark the stale ``cache_entry`` as fresh after its revalidation."""
+        cache_entry = cache_entry.copy()
+        cache_entry.storage_time = time()
+        self._set_entry(cache_key, cache_entry)
+
+    def is_entry_fresh(self, cache_entry):
+        return cache_entry.is_fresh(self._ttl)
+
+    def record_hit(self):
+        with self._statistics_lock:
+            self._hit_count += 1
+
+    def record_miss(self):
+        with self._statistics_lock:
+            self._miss_count += 1
+
+    def record_revalidation(self):
+        with self._statistics_lock:
+            self._revalidation_count += 1
+
+    def _get_entry(self, cache_key):
+        raise NotImplementedError()
+
+    def _set_entry(self, cache_key, cache_entry):
+        raise NotImplementedError()
+
+    def _delete_entry(self, cache_key):
+        raise NotImplementedError()
+
+
+class MemoryResponseCache(ResponseCache):
+    """
+    Response cache which evicts the least recently used responses once the
+    size of their bodies exceeds ``max_size`` bytes.
+
+    It is safe to share an instance between threads.
+
+    :param ttl: The number of seconds during which a response is fresh
+    :param max_size: The maximum size of the response bodies in the cache,
+        in bytes
+
+    """
+
+    def __init__(self, ttl=_DEFAULT_TTL, max_size=_DEFAULT_MAX_SIZE):
+        super(MemoryResponseCache, self).__init__(ttl)
+
+        self._max_size = max_size
+
+        self._lock = Lock()
+        self._cache_entries = OrderedDict()
+        self._size = 0
+
+    def _get_entry(self, cache_key):
+        with self._lock:
+            cache_entry = self._cache_entries.get(cache_key)
+            if cache_entry:
+                self._cache_entries.move_to_end(cache_key)
+        return cache_entry
+
+    def _set_entry(self, cache_key, cache_entry):
+        cache_entry_size = len(cache_entry.content)
+        if self._max_size < cache_entry_size:
+            self._delete_entry(cache_key)
+            return
+
+        with self._lock:
+            self._pop_entry(cache_key)
+            self._cache_entries[cache_key] = cache_entry
+            self._size += cache_entry_size
+
+            while self._max_size < self._size:
+                least_recently_used_cache_key = next(iter(self._cache_entries))
+                self._pop_entry(least_recently_used_cache_key)
+
+    def _delete_entry(self, cache_key):
+        with self._lock:
+            self._pop_entry(cache_key)
+
+    def _pop_entry(self, cache_key):
+        cache_entry = self._cache_entries.pop(cache_key, None)
+        if cache_entry:
+            self._size -= len(cache_entry.content)
+
+
+class SQLiteResponseCache(ResponseCache):
+    """
+    Response cache stored in a SQLite database, which can be shared by the
+    processes on a host and survives their restarts.
+
+    Writes are atomic, and the least recently used responses are evicted
+    once the size of the bodies in the cache exceeds ``max_size`` bytes.
+    The time of the last use of an entry is only updated once every minute,
+    so that most cache hits do not write to the database.
+
+    It is safe to share an instance between threads and forked processes,
+    as each of them uses its own connection to the database.
+
+    :param str path: The path to the database file, which is created if it
+        does not exist
+    :param ttl: The number of seconds during which a response is fresh
+    :param max_size: The maximum size of the response bodies in the cache,
+        in bytes
+
+    """
+
+    def __init__(self, path, ttl=_DEFAULT_TTL, max_size=_DEFAULT_MAX_SIZE):
+        super(SQLiteResponseCache, self).__init__(ttl)
+
+        self._path = path
+        self._max_size = max_size
+
+        self._thread_local = local()
+
+        database_connection = self._get_database_connection()
+        with _sqlite_transaction(database_connection):
+            for schema_statement in _SQLITE_SCHEMA_STATEMENTS:
+                database_connection.execute(schema_statement)
+
+    def _get_entry(self, cache_key):
+        database_connection = self._get_database_connection()
+        row = database_connection.execute(
+            'SELECT status_code, reason, headers, content, url, '
+            'storage_time, access_time FROM response_cache_entries '
+            'WHERE cache_key = ?',
+            (cache_key,),
+            ).fetchone()
+        if row is None:
+            return None
+
+        status_code, reason, headers, content, url, storage_time, \
+            access_time = row
+
+        current_time = time()
+        if access_time + _SQLITE_ACCESS_TIME_RESOLUTION < current_time:
+            database_connection.execute(
+                'UPDATE response_cache_entries SET access_time = ? '
+                'WHERE cache_key = ?',
+                (current_time, cache_key),
+                )
+
+        cache_entry = CacheEntry(
+            status_code,
+            reason,
+            json_deserialize(headers),
+            content,
+            url,
+            storage_time,
+            )
+        return cache_entry
+
+    def _set_entry(self, cache_key, cache_entry):
+        if self._max_size < len(cache_entry.content):
+            self._delete_entry(cache_key)
+            return
+
+        database_connection = self._get_database_connection()
+        with _sqlite_transaction(database_connection):
+            database_connection.execute(
+                'INSERT OR REPLACE INTO response_cache_entries (cache_key, '
+                'status_code, reason, headers, content, url, storage_time, '
+                'access_time) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (
+                    cache_key,
+                    cache_entry.status_code,
+                    cache_entry.reason,
+                    json_serialize(dict(cache_entry.headers)),
+                    cache_entry.content,
+                    cache_entry.url,
+                    cache_entry.storage_time,
+                    time(),
+                    ),
+                )
+            self._evict_least_recently_used_entries(database_connection)
+
+    def _delete_entry(self, cache_key):
+        database_connection = self._get_database_connection()
+        database_connection.execute(
+            'DELETE FROM response_cache_entries WHERE cache_key = ?',
+            (cache_key,),
+            )
+
+    def _evict_least_recently_used_entries(self, database_connection):
+        cache_size = database_connection.execute(
+            'SELECT size FROM response_cache_size',
+            ).fetchone()[0]
+        excess_size = cache_size - self._max_size
+        if excess_size <= 0:
+            return
+
+        evicted_cache_keys = []
+        rows = database_connection.execute(
+            'SELECT cache_key, LENGTH(content) FROM response_cache_entries '
+            'ORDER BY access_time',
+            )
+        for cache_key, content_size in rows:
+            evicted_cache_keys.append((cache_key,))
+            excess_size -= content_size
+            if excess_size <= 0:
+                break
+
+        database_connection.executemany(
+            'DELETE FROM response_cache_entries WHERE cache_key = ?',
+            evicted_cache_keys,
+            )
+
+    def _get_database_connection(self):
+        process_id = getpid()
+        if getattr(self._thread_local, 'process_id', None) != process_id:
+            database_connection = sqlite_connect(
+                self._path,
+                timeout=_SQLITE_BUSY_TIMEOUT,
+                isolation_level=None,
+                )
+            database_connection.execute('PRAGMA journal_mode = WAL')
+            database_connection.execute('PRAGMA synchronous = NORMAL')
+            # Entries replaced by "INSERT OR REPLACE" must fire the deletion
+            # trigger too
+            database_connection.execute('PRAGMA recursive_triggers = ON')
+            self._thread_local.database_connection = database_connection
+            self._thread_local.process_id = process_id
+        return self._thread_local.database_connection
+
+
+@contextmanager
+def _sqlite_transaction(database_connection):
+    database_connection.execute('BEGIN IMMEDIATE')
+    try:
+        yield
+    except BaseException:
+        database_connection.execute('ROLLBACK')
+        raise
+    else:
+        database_connection.execute('COMMIT')
+
+
+class CacheEntry(object):
+    """Response stored in a :class:`ResponseCache`."""
+
+    def __init__(
+        self,
+        status_code,
+        reason,
+        headers,
+        content,
+        url,
+        storage_time,
+        ):
+        super(CacheEntry, self).__init__()
+
+        self.status_code = status_code
+        self.reason = reason
+        self.headers = CaseInsensitiveDict(headers)
+        self.content = content
+        self.url = url
+        self.storage_time = storage_time
+
+    @classmethod
+    def init_from_response(cls, response):
+        cache_entry = cls(
+            response.status_code,
+            response.reason,
+            response.headers,
+            response.content,
+            response.url,
+            time(),
+            )
+        return cache_entry
+
+    def copy(self):
+        cache_entry_copy = self.__class__(
+            self.status_code,
+            self.reason,
+            self.headers,
+            self.content,
+            self.url,
+            self.storage_time,
+            )
+        return cache_entry_copy
+
+    def is_fresh(self, ttl):
+        return time() < self.storage_time + ttl
+
+    def is_revalidatable(self):
+        return 'ETag' in self.headers or 'Last-Modified' in self.headers
+
+    def get_revalidation_headers(self):
+        revalidation_headers = {}
+        if 'ETag' in self.headers:
+            revalidation_headers['If-None-Match'] = self.headers['ETag']
+        if 'Last-Modified' in self.headers:
+            revalidation_headers['If-Modified-Since'] = \
+                self.headers['Last-Modified']
+        return revalidation_headers
+
+    def make_response(self):
+        response = Response()
+        response.status_code = self.status_code
+        response.reason = self.reason
+        response.headers = CaseInsensitiveDict(self.headers)
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.url = self.url
+        response._content = self.content
+        return response
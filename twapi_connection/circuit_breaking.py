@@ -0,0 +1,216 @@
+##############################################################################
+#
+# Copyright (c) 2016, 2degrees Limited.
+# All Rights Reserved.
+#
+# This file is part of twapi-connection
+# <https://github.com/2degrees/twapi-connection>, which is subject to the
+# provisions of the BSD at
+# <http://dev.2degreesnetwork.com/p/2degrees-license.html>. A copy of the
+# license should accompany this distribution. THIS SOFTWARE IS PROVIDED "AS IS"
+# AND ANY AND ALL EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT
+# NOT LIMITED TO, THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST
+# INFRINGEMENT, AND FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+
+from threading import Lock
+from time import monotonic
+from urllib.parse import urlsplit
+
+from twapi_connection.exc import CircuitOpenError
+
+
+CLOSED_CIRCUIT_STATE = 'closed'
+
+OPEN_CIRCUIT_STATE = 'open'
+
+HALF_OPEN_CIRCUIT_STATE = 'half-open'
+
+_DEFAULT_FAILURE_THRESHOLD = 5
+
+_DEFAULT_RECOVERY_TIMEOUT = 30
+
+
+class CircuitBreaker(object):
+    """
+    Circuit breaker failing requests fast while the API is unavailable.
+
+    Each API host has its own circuit, and so does each endpoint prefix given.
+    A circuit is closed initially, and it opens after a number of consecutive
+    failures (i.e., errors at the server's end or when connecting to it).
+    While it is open, requests fail immediately with
+    :class:`~twapi_connection.exc.CircuitOpenError`. Once the recovery timeout
+    has elapsed, the circuit becomes half-open and lets a single probe
+    request through, which closes the circuit if successful or opens it
+    again otherwise.
+
+    A single instance can be shared by any number of threads.
+
+    :param int failure_threshold: The number of consecutive failures that
+        open the circuit
+    :param float recovery_timeout: The number of seconds after which an open
+        circuit lets a probe request through
+    :param endpoint_prefixes: The URL paths (e.g., ``/api/groups/``) whose
+        endpoints share their own circuit, instead of the circuit of their
+        host
+    :param state_change_listeners: Callables to be called with the circuit
+        key, the previous state and the new state whenever a circuit changes
+        state
+
+    """
+
+    def __init__(
+        self,
+        failure_threshold=_DEFAULT_FAILURE_THRESHOLD,
+        recovery_timeout=_DEFAULT_RECOVERY_TIMEOUT,
+        endpoint_prefixes=(),
+        state_change_listeners=(),
+        ):
+        super(CircuitBreaker, self).__init__()
+
+        self._failure_threshold = failure_threshold
+        self._recovery_timeout = recovery_timeout
+        # The longest prefix matching a URL takes precedence
+        self._endpoint_prefixes = \
+            sorted(endpoint_prefixes, key=len, reverse=True)
+        self._state_change_listeners = list(state_change_listeners)
+
+        self._lock = Lock()
+        self._circuits = {}
+
+    def add_state_change_listener(self, listener):
+        """
+        Call ``listener`` with the circuit key, the previous state and the new
+        state whenever a circuit changes state.
+
+        """
+        self._state_change_listeners.append(listener)
+
+    def get_circuit_key(self, url):
+        """
+        Return the key of the circuit for ``url``: Its origin (e.g.,
+        ``https://www.2degreesnetwork.com``), followed by the endpoint prefix
+        matching it, if any.
+
+        """
+        url_parts = urlsplit(url)
+        circuit_key = '{}://{}'.format(url_parts.scheme, url_parts.netloc)
+        for endpoint_prefix in self._endpoint_prefixes:
+            if url_parts.path.startswith(endpoint_prefix):
+                circuit_key += endpoint_prefix
+                break
+        return circuit_key
+
+    def get_state(self, url):
+        """Return the state of the circuit for ``url``."""
+        circuit_key = self.get_circuit_key(url)
+        with self._lock:
+            circuit = self._circuits.get(circuit_key)
+            state = circuit.state if circuit else CLOSED_CIRCUIT_STATE
+        return state
+
+    def require_request_permission(self, url):
+        """
+        Reserve the permission to send a request to ``url``.
+
+        :raises twapi_connection.exc.CircuitOpenError: If the circuit for
+            ``url`` is open, or if it is half-open and the probe request is
+            already in progress
+
+        """
+        circuit_key = self.get_circuit_key(url)
+        state_changes = []
+        try:
+            with self._lock:
+                circuit = self._get_circuit(circuit_key)
+
+                if circuit.state == OPEN_CIRCUIT_STATE:
+                    opening_time = circuit.opening_time
+                    if self._recovery_timeout <= monotonic() - opening_time:
+                        state_change = \
+                            circuit.change_state(HALF_OPEN_CIRCUIT_STATE)
+                        state_changes.append(state_change)
+                    else:
+                        raise CircuitOpenError(circuit_key)
+
+                if circuit.state == HALF_OPEN_CIRCUIT_STATE:
+                    if circuit.is_probe_in_progress:
+                        raise CircuitOpenError(circuit_key)
+                    circuit.is_probe_in_progress = True
+        finally:
+            self._notify_state_changes(circuit_key, state_changes)
+
+    def release_request_permission(self, url):
+        """
+        Give back the permission reserved for a request to ``url`` that was
+        not sent after all.
+
+        """
+        circuit_key = self.get_circuit_key(url)
+        with self._lock:
+            circuit = self._get_circuit(circuit_key)
+            circuit.is_probe_in_progress = False
+
+    def record_success(self, url):
+        """Record the success of a request to ``url``."""
+        circuit_key = self.get_circuit_key(url)
+        state_changes = []
+        with self._lock:
+            circuit = self._get_circuit(circuit_key)
+            circuit.consecutive_failure_count = 0
+            if circuit.state == HALF_OPEN_CIRCUIT_STATE:
+                state_change = circuit.change_state(CLOSED_CIRCUIT_STATE)
+                state_changes.append(state_change)
+        self._notify_state_changes(circuit_key, state_changes)
+
+    def record_failure(self, url):
+        """Record the failure of a request to ``url``."""
+        circuit_key = self.get_circuit_key(url)
+        state_changes = []
+        with self._lock:
+            circuit = self._get_circuit(circuit_key)
+            circuit.consecutive_failure_count += 1
+            is_circuit_to_be_opened = \
+                circuit.state == HALF_OPEN_CIRCUIT_STATE or (
+                    circuit.state == CLOSED_CIRCUIT_STATE and
+                    self._failure_threshold <=
+                    circuit.consecutive_failure_count
+                    )
+            if is_circuit_to_be_opened:
+                state_change = circuit.change_state(OPEN_CIRCUIT_STATE)
+                state_changes.append(state_change)
+        self._notify_state_changes(circuit_key, state_changes)
+
+    def _get_circuit(self, circuit_key):
+        circuit = self._circuits.get(circuit_key)
+        if not circuit:
+            circuit = _Circuit()
+            self._circuits[circuit_key] = circuit
+        return circuit
+
+    def _notify_state_changes(self, circuit_key, state_changes):
+        for previous_state, new_state in state_changes:
+            for listener in self._state_change_listeners:
+                listener(circuit_key, previous_state, new_state)
+
+
+class _Circuit(object):
+
+    def __init__(self):
+        super(_Circuit, self).__init__()
+
+        self.state = CLOSED_CIRCUIT_STATE
+        self.consecutive_failure_count = 0
+        self.opening_time = None
+        self.is_probe_in_progress = False
+
+    def change_state(self, new_state):
+        previous_state = self.state
+        self.state = new_state
+
+        if new_state == OPEN_CIRCUIT_STATE:
+            self.opening_time = monotonic()
+        self.is_probe_in_progress = False
+
+        return previous_state, new_state
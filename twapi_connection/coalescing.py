@@ -0,0 +1,99 @@
+##############################################################################
+#
+# Copyright (c) 2016, 2degrees Limited.
+# All Rights Reserved.
+#
+# This file is part of twapi-connection
+# <https://github.com/2degrees/twapi-connection>, which is subject to the
+# provisions of the BSD at
+# <http://dev.2degreesnetwork.com/p/2degrees-license.html>. A copy of the
+# license should accompany this distribution. THIS SOFTWARE IS PROVIDED "AS IS"
+# AND ANY AND ALL EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT
+# NOT LIMITED TO, THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST
+# INFRINGEMENT, AND FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+
+from threading import Event
+from threading import Lock
+
+
+class CallCoalescer(object):
+    """
+    Coalescer of concurrent calls identified by the same key.
+
+    While a call is in progress, any other call with the same key waits for
+    it to finish and gets its return value or exception, instead of calling
+    the function again.
+
+    """
+
+    def __init__(self):
+        super(CallCoalescer, self).__init__()
+
+        self._lock = Lock()
+        self._calls_in_progress = {}
+        self._coalesced_call_count = 0
+
+    def call(self, key, function, *args, wait_timeout=None, **kwargs):
+        """
+        Call ``function`` with the arguments given, unless another call with
+        the same ``key`` is in progress.
+
+        :param float wait_timeout: The maximum number of seconds to wait for
+            the call in progress, if any
+        :raises TimeoutError: If the call in progress did not finish within
+            ``wait_timeout`` seconds
+
+        """
+        with self._lock:
+            call_in_progress = self._calls_in_progress.get(key)
+            if call_in_progress:
+                self._coalesced_call_count += 1
+            else:
+                call = _CallOutcome()
+                self._calls_in_progress[key] = call
+
+        if call_in_progress:
+            return call_in_progress.wait(wait_timeout)
+
+        try:
+            call.return_value = function(*args, **kwargs)
+        except BaseException as exc:
+            call.exception = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls_in_progress[key]
+            call.set_finished()
+
+        return call.return_value
+
+    def get_coalesced_call_count(self):
+        """
+        Return the number of calls that reused the outcome of a call in
+        progress.
+
+        """
+        return self._coalesced_call_count
+
+
+class _CallOutcome(object):
+
+    def __init__(self):
+        super(_CallOutcome, self).__init__()
+
+        self.return_value = None
+        self.exception = None
+        self._is_finished = Event()
+
+    def set_finished(self):
+        self._is_finished.set()
+
+    def wait(self, timeout=None):
+        if not self._is_finished.wait(timeout):
+            raise TimeoutError()
+
+        if self.exception:
+            raise self.exception
+        return self.return_value
@@ -0,0 +1,186 @@
+##############################################################################
+#
+# Copyright (c) 2016, 2degrees Limited.
+# All Rights Reserved.
+#
+# This file is part of twapi-connection
+# <https://github.com/2degrees/twapi-connection>, which is subject to the
+# provisions of the BSD at
+# <http://dev.2degreesnetwork.com/p/2degrees-license.html>. A copy of the
+# license should accompany this distribution. THIS SOFTWARE IS PROVIDED "AS IS"
+# AND ANY AND ALL EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT
+# NOT LIMITED TO, THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST
+# INFRINGEMENT, AND FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""
+Compression of the bodies of requests and responses.
+
+Brotli is only supported if `brotli <https://github.com/google/brotli>`_ is
+installed.
+
+"""
+
+from gzip import compress as gzip_compress
+from threading import Lock
+from zlib import compress as zlib_compress
+
+from pyrecord import Record
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+GZIP_CONTENT_ENCODING = 'gzip'
+
+DEFLATE_CONTENT_ENCODING = 'deflate'
+
+BROTLI_CONTENT_ENCODING = 'br'
+
+_DEFAULT_MIN_BODY_SIZE = 1024
+
+
+TransferStatistics = Record.create_type(
+    'TransferStatistics',
+    'request_body_byte_count',
+    'sent_request_body_byte_count',
+    'response_body_byte_count',
+    'received_response_body_byte_count',
+    )
+"""
+Number of bytes in the bodies of requests and responses, before compression
+and on the wire.
+
+"""
+
+
+def get_accept_encoding():
+    """
+    Return the value of the ``Accept-Encoding`` header for the content
+    encodings supported.
+
+    """
+    content_encodings = [GZIP_CONTENT_ENCODING, DEFLATE_CONTENT_ENCODING]
+    if brotli is not None:
+        content_encodings.append(BROTLI_CONTENT_ENCODING)
+    return ', '.join(content_encodings)
+
+
+def get_compression_ratio(uncompressed_byte_count, compressed_byte_count):
+    """
+    Return the ratio of ``uncompressed_byte_count`` to
+    ``compressed_byte_count`` (e.g., ``4.0`` when the data compressed is a
+    quarter of its original size), or ``None`` if nothing was transferred.
+
+    """
+    if not compressed_byte_count:
+        return None
+    return uncompressed_byte_count / compressed_byte_count
+
+
+class RequestBodyCompressionPolicy(object):
+    """
+    Policy for compressing the bodies of requests.
+
+    The API must support the content encoding used.
+
+    :param str content_encoding: ``gzip``, ``deflate`` or ``br`` (which
+        requires brotli)
+    :param int min_body_size: The size in bytes from which bodies are
+        compressed, as smaller ones may not be worth the CPU time
+    :param int compression_level: The compression level, as accepted by
+        the underlying library; its default level is used if not set
+
+    """
+
+    def __init__(
+        self,
+        content_encoding=GZIP_CONTENT_ENCODING,
+        min_body_size=_DEFAULT_MIN_BODY_SIZE,
+        compression_level=None,
+        ):
+        super(RequestBodyCompressionPolicy, self).__init__()
+
+        if content_encoding == BROTLI_CONTENT_ENCODING and brotli is None:
+            raise ImportError('brotli is not installed')
+        if content_encoding not in _COMPRESSORS_BY_CONTENT_ENCODING:
+            raise ValueError(
+                'Unsupported content encoding {!r}'.format(content_encoding),
+                )
+
+        self.content_encoding = content_encoding
+        self._min_body_size = min_body_size
+        self._compression_level = compression_level
+
+    def compress(self, body):
+        """
+        Return ``body`` compressed, or ``None`` if it is too small to be
+        compressed.
+
+        """
+        if len(body) < self._min_body_size:
+            return None
+
+        compressor = _COMPRESSORS_BY_CONTENT_ENCODING[self.content_encoding]
+        return compressor(body, self._compression_level)
+
+
+class TransferStatisticsCollector(object):
+    """Thread-safe collector of :data:`TransferStatistics`."""
+
+    def __init__(self):
+        super(TransferStatisticsCollector, self).__init__()
+
+        self._lock = Lock()
+        self._request_body_byte_count = 0
+        self._sent_request_body_byte_count = 0
+        self._response_body_byte_count = 0
+        self._received_response_body_byte_count = 0
+
+    def record_request_body(self, byte_count, sent_byte_count):
+        with self._lock:
+            self._request_body_byte_count += byte_count
+            self._sent_request_body_byte_count += sent_byte_count
+
+    def record_response_body(self, byte_count, received_byte_count):
+        with self._lock:
+            self._response_body_byte_count += byte_count
+            self._received_response_body_byte_count += received_byte_count
+
+    def get_statistics(self):
+        with self._lock:
+            statistics = TransferStatistics(
+                self._request_body_byte_count,
+                self._sent_request_body_byte_count,
+                self._response_body_byte_count,
+                self._received_response_body_byte_count,
+                )
+        return statistics
+
+
+def _compress_with_gzip(body, compression_level):
+    if compression_level is None:
+        return gzip_compress(body)
+    return gzip_compress(body, compression_level)
+
+
+def _compress_with_deflate(body, compression_level):
+    # "deflate" in HTTP is the zlib format rather than raw DEFLATE
+    if compression_level is None:
+        return zlib_compress(body)
+    return zlib_compress(body, compression_level)
+
+
+def _compress_with_brotli(body, compression_level):
+    if compression_level is None:
+        return brotli.compress(body)
+    return brotli.compress(body, quality=compression_level)
+
+
+_COMPRESSORS_BY_CONTENT_ENCODING = {
+    GZIP_CONTENT_ENCODING: _compress_with_gzip,
+    DEFLATE_CONTENT_ENCODING: _compress_with_deflate,
+    BROTLI_CONTENT_ENCODING: _compress_with_brotli,
+    }
@@ -14,15 +14,86 @@
 #
 ##############################################################################
 
+from requests.exceptions import ConnectTimeout as RequestsConnectTimeout
+from requests.exceptions import ReadTimeout as RequestsReadTimeout
+from requests.exceptions import Timeout as RequestsTimeout
+
 
 class TwodAPIException(Exception):
-    pass
+    """
+    Base class for the exceptions raised when a request to the API fails.
+
+    :ivar int attempt_count: The number of times the request was sent
+    :ivar float total_backoff_time: The number of seconds spent waiting
+        between attempts
+
+    """
+
+    attempt_count = 1
+
+    total_backoff_time = 0
 
 
 class UnsupportedResponseError(TwodAPIException):
     pass
 
 
+class ResponseBodyTooLargeError(UnsupportedResponseError):
+    """
+    The body of the response was larger than the maximum size accepted, so
+    it was not read in full.
+
+    :param int max_size: The maximum size in bytes
+
+    """
+    def __init__(self, max_size):
+        super(ResponseBodyTooLargeError, self).__init__(max_size)
+
+        self.max_size = max_size
+
+
+class CircuitOpenError(TwodAPIException):
+    """
+    The request was not sent because the API has been failing.
+
+    :param str circuit_key: The key of the open circuit (e.g.,
+        ``https://www.2degreesnetwork.com``)
+
+    """
+    def __init__(self, circuit_key):
+        super(CircuitOpenError, self).__init__(circuit_key)
+
+        self.circuit_key = circuit_key
+
+
+class RequestTimeoutError(TwodAPIException, RequestsTimeout):
+    """
+    The request ran out of time. The exceptions from :mod:`requests` are
+    also subclassed so that existing handlers keep catching them.
+
+    """
+    pass
+
+
+class ConnectTimeoutError(RequestTimeoutError, RequestsConnectTimeout):
+    """The connect timeout of the connection elapsed."""
+    pass
+
+
+class ReadTimeoutError(RequestTimeoutError, RequestsReadTimeout):
+    """The read timeout of the connection elapsed."""
+    pass
+
+
+class DeadlineExceededError(RequestTimeoutError):
+    """
+    The deadline given for the call elapsed, which may have happened while
+    connecting, reading the response or between retries.
+
+    """
+    pass
+
+
 class ClientError(TwodAPIException):
     pass
 
@@ -39,6 +110,21 @@ class NotFoundError(ClientError):
     pass
 
 
+class TooManyRequestsError(ClientError):
+    """
+    Remote is throttling the client. This represents an HTTP response code of
+    429.
+
+    :param float retry_after: The number of seconds the remote asked to wait
+        before the next request, if any
+
+    """
+    def __init__(self, retry_after=None):
+        super(TooManyRequestsError, self).__init__()
+
+        self.retry_after = retry_after
+
+
 class ServerError(TwodAPIException):
     """
     Remote failed to process the request due to a problem at their end. This
@@ -0,0 +1,116 @@
+##############################################################################
+#
+# Copyright (c) 2016, 2degrees Limited.
+# All Rights Reserved.
+#
+# This file is part of twapi-connection
+# <https://github.com/2degrees/twapi-connection>, which is subject to the
+# provisions of the BSD at
+# <http://dev.2degreesnetwork.com/p/2degrees-license.html>. A copy of the
+# license should accompany this distribution. THIS SOFTWARE IS PROVIDED "AS IS"
+# AND ANY AND ALL EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT
+# NOT LIMITED TO, THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST
+# INFRINGEMENT, AND FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""
+Recovery of the objects inherited by the child processes of a fork.
+
+A child process gets a copy of the keep-alive connections of its parent, but
+both processes would then read and write the same sockets, which corrupts
+their HTTP (and TLS) streams. The objects registered here reset themselves in
+the child, immediately after the fork.
+
+On platforms without :func:`os.register_at_fork`, the objects must be reset
+explicitly in each child process instead (e.g., from the ``post_fork`` hook
+of Gunicorn).
+
+"""
+
+try:
+    from os import register_at_fork
+except ImportError:
+    register_at_fork = None
+
+from weakref import WeakSet
+
+from requests.adapters import HTTPAdapter
+
+
+_FORK_AWARE_OBJECTS = WeakSet()
+
+
+def register_fork_aware_object(fork_aware_object):
+    """
+    Call the ``reset_after_fork()`` method of ``fork_aware_object`` in the
+    child process of each fork, for as long as the object is alive.
+
+    This has no effect on platforms without :func:`os.register_at_fork`.
+
+    """
+    _FORK_AWARE_OBJECTS.add(fork_aware_object)
+
+
+def unregister_fork_aware_object(fork_aware_object):
+    """
+    Stop resetting ``fork_aware_object`` after each fork (e.g., because it
+    is no longer used).
+
+    """
+    _FORK_AWARE_OBJECTS.discard(fork_aware_object)
+
+
+def reset_session_after_fork(session):
+    """
+    Discard the connection pools of the HTTP adapters of ``session``, which
+    were inherited from the parent process.
+
+    The sockets inherited are closed without shutting down their connections,
+    which the parent process keeps using. No lock is acquired, as one could
+    have been held by a thread of the parent process at the time of the fork.
+
+    :param session: The session to reset
+    :type session: :class:`requests.Session`
+
+    """
+    for adapter in session.adapters.values():
+        if isinstance(adapter, HTTPAdapter):
+            _reset_http_adapter(adapter)
+
+
+def _reset_http_adapter(adapter):
+    pool_managers = \
+        [adapter.poolmanager] + list(adapter.proxy_manager.values())
+    for pool_manager in pool_managers:
+        connection_pools = list(pool_manager.pools._container.values())
+        for connection_pool in connection_pools:
+            _close_inherited_sockets(connection_pool)
+
+    adapter.proxy_manager = {}
+    adapter.init_poolmanager(
+        adapter._pool_connections,
+        adapter._pool_maxsize,
+        block=adapter._pool_block,
+        )
+
+
+def _close_inherited_sockets(connection_pool):
+    queue = getattr(connection_pool, 'pool', None)
+    if queue is None:
+        return
+
+    for connection in list(queue.queue):
+        socket = getattr(connection, 'sock', None)
+        if socket is not None:
+            socket.close()
+            # Prevent the connection from being closed (and counted) again
+            connection.sock = None
+
+
+def _reset_fork_aware_objects():
+    for fork_aware_object in list(_FORK_AWARE_OBJECTS):
+        fork_aware_object.reset_after_fork()
+
+
+if register_at_fork:
+    register_at_fork(after_in_child=_reset_fork_aware_objects)
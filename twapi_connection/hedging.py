@@ -0,0 +1,262 @@
+##############################################################################
+#
+# Copyright (c) 2016, 2degrees Limited.
+# All Rights Reserved.
+#
+# This file is part of twapi-connection
+# <https://github.com/2degrees/twapi-connection>, which is subject to the
+# provisions of the BSD at
+# <http://dev.2degreesnetwork.com/p/2degrees-license.html>. A copy of the
+# license should accompany this distribution. THIS SOFTWARE IS PROVIDED "AS IS"
+# AND ANY AND ALL EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT
+# NOT LIMITED TO, THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST
+# INFRINGEMENT, AND FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""
+Hedging of requests: sending a second, identical request when the first one
+is slower than usual, and using whichever response arrives first.
+
+"""
+
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import wait as wait_for_futures
+from math import ceil
+from threading import Lock
+from time import monotonic
+
+from pyrecord import Record
+
+
+_DEFAULT_LATENCY_PERCENTILE = 95
+
+_DEFAULT_MIN_HEDGE_DELAY = 0.01
+
+_DEFAULT_MAX_HEDGE_RATIO = 0.05
+
+_DEFAULT_MAX_HEDGE_BURST = 10
+
+_DEFAULT_LATENCY_WINDOW_SIZE = 256
+
+_DEFAULT_MIN_LATENCY_SAMPLE_COUNT = 20
+
+
+HedgingStatistics = Record.create_type(
+    'HedgingStatistics',
+    'request_count',
+    'hedged_request_count',
+    'won_hedged_request_count',
+    )
+"""
+Number of requests eligible for hedging, of those which were hedged and of
+those whose hedge responded first.
+
+"""
+
+
+class HedgingPolicy(object):
+    """
+    Policy for hedging requests.
+
+    A request is hedged when it has not completed within the given percentile
+    of the latencies of the latest requests, and only once enough of them
+    have been recorded. To avoid amplifying the load on an API which is
+    already slow, the number of hedges is capped to a ratio of the requests:
+    each request earns a fraction of a hedge, and a hedge is only sent when
+    a whole one has been earned.
+
+    A single instance can be shared by any number of threads.
+
+    :param float latency_percentile: The percentile of the latencies after
+        which requests are hedged
+    :param float min_hedge_delay: The minimum number of seconds after which
+        requests are hedged
+    :param float max_hedge_ratio: The maximum ratio of hedges to requests
+    :param int max_hedge_burst: The maximum number of hedges that may be
+        sent in a row, after a period without hedges
+    :param int latency_window_size: The number of latest latencies kept
+    :param int min_latency_sample_count: The number of latencies to be
+        recorded before requests are hedged
+
+    """
+
+    def __init__(
+        self,
+        latency_percentile=_DEFAULT_LATENCY_PERCENTILE,
+        min_hedge_delay=_DEFAULT_MIN_HEDGE_DELAY,
+        max_hedge_ratio=_DEFAULT_MAX_HEDGE_RATIO,
+        max_hedge_burst=_DEFAULT_MAX_HEDGE_BURST,
+        latency_window_size=_DEFAULT_LATENCY_WINDOW_SIZE,
+        min_latency_sample_count=_DEFAULT_MIN_LATENCY_SAMPLE_COUNT,
+        ):
+        super(HedgingPolicy, self).__init__()
+
+        self._latency_percentile = latency_percentile
+        self._min_hedge_delay = min_hedge_delay
+        self._max_hedge_ratio = max_hedge_ratio
+        self._max_hedge_burst = max_hedge_burst
+        self._min_latency_sample_count = min_latency_sample_count
+
+        self._lock = Lock()
+        self._latencies = deque(maxlen=latency_window_size)
+        self._hedge_budget = 0
+        self._request_count = 0
+        self._hedged_request_count = 0
+        self._won_hedged_request_count = 0
+
+    def get_hedge_delay(self):
+        """
+        Return the number of seconds after which a request should be hedged,
+        or ``None`` if not enough latencies have been recorded.
+
+        """
+        with self._lock:
+            latencies = sorted(self._latencies)
+
+        if not latencies or \
+                len(latencies) < self._min_latency_sample_count:
+            return None
+
+        percentile_rank = \
+            int(ceil(self._latency_percentile / 100 * len(latencies)))
+        percentile_latency = latencies[max(percentile_rank - 1, 0)]
+        return max(percentile_latency, self._min_hedge_delay)
+
+    def record_latency(self, latency):
+        with self._lock:
+            self._latencies.append(latency)
+
+    def record_request(self):
+        with self._lock:
+            self._request_count += 1
+            self._hedge_budget = min(
+                self._hedge_budget + self._max_hedge_ratio,
+                self._max_hedge_burst,
+                )
+
+    def acquire_hedge_permission(self):
+        """
+        Return whether a hedge may be sent, in which case it is counted.
+
+        """
+        with self._lock:
+            is_hedge_permitted = 1 <= self._hedge_budget
+            if is_hedge_permitted:
+                self._hedge_budget -= 1
+                self._hedged_request_count += 1
+        return is_hedge_permitted
+
+    def record_hedge_win(self):
+        with self._lock:
+            self._won_hedged_request_count += 1
+
+    def get_statistics(self):
+        """
+        :rtype: :data:`HedgingStatistics`
+
+        """
+        with self._lock:
+            statistics = HedgingStatistics(
+                self._request_count,
+                self._hedged_request_count,
+                self._won_hedged_request_count,
+                )
+        return statistics
+
+
+def call_with_hedging(function, hedging_policy, executor):
+    """
+    Call ``function`` in ``executor``, and call it again if the first call
+    is slower than the hedge delay of ``hedging_policy``.
+
+    The first call to return wins, and its return value is returned. If it
+    raised an exception instead, the other call is waited for. The return
+    value of the losing call is closed once available (e.g., to release the
+    connection of a :class:`requests.Response`), as a call in progress
+    cannot be interrupted.
+
+    The hedge delay and the latencies recorded are counted from the time
+    the first call starts running, so that the time spent queued in
+    ``executor`` does not count. A first call still queued after the hedge
+    delay is not hedged, as the hedge would be queued too. Only the
+    latencies of first calls are recorded, so that hedges do not lower the
+    hedge delay.
+
+    """
+    hedging_policy.record_request()
+    hedge_delay = hedging_policy.get_hedge_delay()
+
+    first_call = _TimedCall(function, hedging_policy)
+    first_future = executor.submit(first_call)
+
+    pending_futures = {first_future}
+    if hedge_delay is not None:
+        completed_futures, _ = \
+            wait_for_futures(pending_futures, timeout=hedge_delay)
+        start_time = first_call.start_time
+        if not completed_futures and start_time is not None:
+            remaining_hedge_delay = start_time + hedge_delay - monotonic()
+            if 0 < remaining_hedge_delay:
+                completed_futures, _ = wait_for_futures(
+                    pending_futures,
+                    timeout=remaining_hedge_delay,
+                    )
+        if not completed_futures and start_time is not None and \
+                hedging_policy.acquire_hedge_permission():
+            pending_futures.add(executor.submit(function))
+
+    while True:
+        completed_futures, pending_futures = wait_for_futures(
+            pending_futures,
+            return_when=FIRST_COMPLETED,
+            )
+        winning_future = _get_successful_future(completed_futures)
+        if winning_future or not pending_futures:
+            break
+
+    for losing_future in pending_futures | completed_futures:
+        if losing_future is not winning_future:
+            _discard_future(losing_future)
+
+    if not winning_future:
+        # Both calls failed, so the first exception is the one relevant
+        return first_future.result()
+
+    if winning_future is not first_future:
+        hedging_policy.record_hedge_win()
+    return winning_future.result()
+
+
+class _TimedCall(object):
+
+    def __init__(self, function, hedging_policy):
+        super(_TimedCall, self).__init__()
+
+        self._function = function
+        self._hedging_policy = hedging_policy
+
+        self.start_time = None
+
+    def __call__(self):
+        self.start_time = start_time = monotonic()
+        return_value = self._function()
+        self._hedging_policy.record_latency(monotonic() - start_time)
+        return return_value
+
+
+def _get_successful_future(futures):
+    for future in futures:
+        if not future.exception():
+            return future
+    return None
+
+
+def _discard_future(future):
+    if not future.cancel():
+        future.add_done_callback(_close_future_result)
+
+
+def _close_future_result(future):
+    if not future.exception():
+        future.result().close()
@@ -0,0 +1,173 @@
+##############################################################################
+#
+# Copyright (c) 2016, 2degrees Limited.
+# All Rights Reserved.
+#
+# This file is part of twapi-connection
+# <https://github.com/2degrees/twapi-connection>, which is subject to the
+# provisions of the BSD at
+# <http://dev.2degreesnetwork.com/p/2degrees-license.html>. A copy of the
+# license should accompany this distribution. THIS SOFTWARE IS PROVIDED "AS IS"
+# AND ANY AND ALL EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT
+# NOT LIMITED TO, THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST
+# INFRINGEMENT, AND FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""
+Codecs for the JSON in the bodies of requests and responses.
+
+`orjson <https://github.com/ijl/orjson>`_ is used by default when it is
+installed, and the standard library is used otherwise.
+
+"""
+
+from codecs import lookup as lookup_codec
+from json import dumps as json_serialize
+from json import loads as json_deserialize
+
+from requests.models import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+_UTF8_CODEC_NAME = lookup_codec('utf-8').name
+
+
+class StandardJSONCodec(object):
+    """JSON codec based on :mod:`json` from the standard library."""
+
+    def serialize(self, deserialization):
+        """Return the serialization of ``deserialization`` in UTF-8."""
+        return json_serialize(deserialization).encode('utf-8')
+
+    def deserialize(self, serialization):
+        """
+        Return the deserialization of ``serialization``, which is either a
+        string or bytes in UTF-8.
+
+        """
+        # Bytes are decoded by json itself, without an intermediate copy
+        return json_deserialize(serialization)
+
+
+class OrjsonCodec(object):
+    """
+    JSON codec based on `orjson <https://github.com/ijl/orjson>`_.
+
+    Like the standard library, it serializes dictionaries whose keys are not
+    strings (e.g., integers).
+
+    """
+
+    def __init__(self):
+        super(OrjsonCodec, self).__init__()
+
+        if orjson is None:
+            raise ImportError('orjson is not installed')
+
+    def serialize(self, deserialization):
+        """Return the serialization of ``deserialization`` in UTF-8."""
+        return orjson.dumps(deserialization, option=orjson.OPT_NON_STR_KEYS)
+
+    def deserialize(self, serialization):
+        """
+        Return the deserialization of ``serialization``, which is either a
+        string or bytes in UTF-8.
+
+        """
+        return orjson.loads(serialization)
+
+
+def get_default_json_codec():
+    """
+    Return the fastest JSON codec available: :class:`OrjsonCodec` if orjson
+    is installed, or :class:`StandardJSONCodec` otherwise.
+
+    """
+    if orjson is None:
+        json_codec = StandardJSONCodec()
+    else:
+        json_codec = OrjsonCodec()
+    return json_codec
+
+
+class JSONResponse(Response):
+    """
+    :class:`requests.Response` whose body is deserialized with a given JSON
+    codec.
+
+    Unless the ``Content-Type`` declares a charset, the body is deserialized
+    straight from its bytes in UTF-8 (as mandated by the JSON specification),
+    skipping the detection of its encoding and its decoding into a string.
+
+    """
+
+    def __init__(self):
+        super(JSONResponse, self).__init__()
+
+        self.json_codec = None
+        self._body_deserialization = _UNDESERIALIZED_BODY
+
+    @classmethod
+    def init_from_response(cls, response, json_codec):
+        json_response = cls()
+        json_response.__dict__.update(response.__dict__)
+        json_response.json_codec = json_codec
+        return json_response
+
+    @property
+    def body_deserialization(self):
+        """
+        The deserialization of the body, which is only computed the first
+        time it is accessed.
+
+        """
+        if self._body_deserialization is _UNDESERIALIZED_BODY:
+            self._body_deserialization = self.json()
+        return self._body_deserialization
+
+    def json(self, **kwargs):
+        """
+        Return the deserialization of the body.
+
+        The body is deserialized by the JSON codec unless ``kwargs`` for
+        :func:`json.loads` are given.
+
+        """
+        if kwargs:
+            return super(JSONResponse, self).json(**kwargs)
+
+        charset = _get_declared_charset(self.headers.get('Content-Type', ''))
+        if _is_non_utf8_encoding(charset):
+            serialization = self.content.decode(charset)
+        else:
+            serialization = self.content
+        return self.json_codec.deserialize(serialization)
+
+
+_UNDESERIALIZED_BODY = object()
+
+
+def _get_declared_charset(content_type_header_value):
+    content_type_parameters = content_type_header_value.split(';')[1:]
+    for content_type_parameter in content_type_parameters:
+        parameter_name, _, parameter_value = \
+            content_type_parameter.partition('=')
+        if parameter_name.strip().lower() == 'charset':
+            return parameter_value.strip().strip('"\'')
+    return None
+
+
+def _is_non_utf8_encoding(encoding):
+    if not encoding:
+        return False
+
+    try:
+        codec_name = lookup_codec(encoding).name
+    except LookupError:
+        # Unknown charsets are ignored, as JSON is in UTF-8 by default
+        return False
+    return codec_name != _UTF8_CODEC_NAME
@@ -0,0 +1,145 @@
+##############################################################################
+#
+# Copyright (c) 2016, 2degrees Limited.
+# All Rights Reserved.
+#
+# This file is part of twapi-connection
+# <https://github.com/2degrees/twapi-connection>, which is subject to the
+# provisions of the BSD at
+# <http://dev.2degreesnetwork.com/p/2degrees-license.html>. A copy of the
+# license should accompany this distribution. THIS SOFTWARE IS PROVIDED "AS IS"
+# AND ANY AND ALL EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT
+# NOT LIMITED TO, THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST
+# INFRINGEMENT, AND FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""
+Maintenance of idle keep-alive connections in the background.
+
+Servers and load balancers close the connections that stay idle for too
+long, usually without the client noticing until its next request fails on
+them. Connections that are never closed, on the other hand, keep the load
+balancer from spreading the load over new servers. Both are avoided by
+closing the connections before either happens.
+
+"""
+
+from threading import Event
+from threading import Thread
+
+
+_DEFAULT_MAX_IDLE_TIME = 30
+
+_DEFAULT_CHECK_INTERVAL = 5
+
+
+class KeepAlivePolicy(object):
+    """
+    Policy for closing idle keep-alive connections, and optionally keeping
+    some connections to the API open.
+
+    The connections are checked every ``check_interval`` seconds, so a
+    connection can stay idle for up to ``max_idle_time + check_interval``
+    seconds, which should be shorter than the idle timeout of the server
+    (and of any load balancer in front of it). The connections closed by the
+    server in the meantime are closed too.
+
+    Connections in use are never interrupted, so the maximum age only
+    applies once the connection is returned to the pool.
+
+    :param float max_idle_time: The number of seconds after which an idle
+        connection is closed
+    :param float max_connection_age: The number of seconds after which a
+        connection is closed once idle, regardless of its use, if any
+    :param int min_idle_connection_count: The number of idle connections to
+        the API to reopen after each check, up to the size of the pool
+    :param float check_interval: The number of seconds between checks
+
+    """
+
+    def __init__(
+        self,
+        max_idle_time=_DEFAULT_MAX_IDLE_TIME,
+        max_connection_age=None,
+        min_idle_connection_count=0,
+        check_interval=_DEFAULT_CHECK_INTERVAL,
+        ):
+        super(KeepAlivePolicy, self).__init__()
+
+        self._max_idle_time = max_idle_time
+        self._max_connection_age = max_connection_age
+        self._min_idle_connection_count = min_idle_connection_count
+        self._check_interval = check_interval
+
+    def is_connection_expired(self, connection_age, idle_time):
+        """
+        Return whether an idle connection established ``connection_age``
+        seconds ago and idle for ``idle_time`` seconds must be closed.
+
+        """
+        is_connection_expired = self._max_idle_time <= idle_time or (
+            self._max_connection_age is not None and
+            self._max_connection_age <= connection_age
+            )
+        return is_connection_expired
+
+    def get_min_idle_connection_count(self):
+        return self._min_idle_connection_count
+
+    def get_check_interval(self):
+        return self._check_interval
+
+
+class KeepAliveManager(object):
+    """
+    Background thread which applies ``keep_alive_policy`` to the connection
+    pools of ``http_adapter``.
+
+    :param keep_alive_policy: The policy to apply
+    :type keep_alive_policy: :class:`KeepAlivePolicy`
+    :param http_adapter: The adapter whose connections are maintained
+    :type http_adapter:
+        :class:`~twapi_connection.adapters.InstrumentedHTTPAdapter`
+    :param warm_up: The callable opening the number of connections to the
+        API passed to it, if any are to be kept open
+
+    """
+
+    def __init__(self, keep_alive_policy, http_adapter, warm_up):
+        super(KeepAliveManager, self).__init__()
+
+        self._keep_alive_policy = keep_alive_policy
+        self._http_adapter = http_adapter
+        self._warm_up = warm_up
+
+        self._is_stopped = Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = Thread(target=self._maintain_connections, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop the thread after its current check, without waiting for it.
+
+        """
+        self._is_stopped.set()
+
+    def maintain_connections(self):
+        """
+        Close the expired connections and reopen the connections to be kept
+        open, once.
+
+        """
+        self._http_adapter.close_expired_connections(self._keep_alive_policy)
+
+        min_idle_connection_count = \
+            self._keep_alive_policy.get_min_idle_connection_count()
+        if min_idle_connection_count:
+            self._warm_up(min_idle_connection_count)
+
+    def _maintain_connections(self):
+        check_interval = self._keep_alive_policy.get_check_interval()
+        while not self._is_stopped.wait(check_interval):
+            self.maintain_connections()
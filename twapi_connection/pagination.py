@@ -0,0 +1,124 @@
+##############################################################################
+#
+# Copyright (c) 2016, 2degrees Limited.
+# All Rights Reserved.
+#
+# This file is part of twapi-connection
+# <https://github.com/2degrees/twapi-connection>, which is subject to the
+# provisions of the BSD at
+# <http://dev.2degreesnetwork.com/p/2degrees-license.html>. A copy of the
+# license should accompany this distribution. THIS SOFTWARE IS PROVIDED "AS IS"
+# AND ANY AND ALL EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT
+# NOT LIMITED TO, THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST
+# INFRINGEMENT, AND FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+
+from queue import Full
+from queue import Queue
+from threading import Event
+from threading import Thread
+
+
+_PAGE_ITEMS_KEY = 'results'
+
+_NEXT_PAGE_URL_KEY = 'next'
+
+_PAGE_QUEUE_POLL_INTERVAL = 0.1
+
+
+def iter_paginated_items(
+    connection,
+    url,
+    query_string_args=None,
+    prefetched_page_count=0,
+    ):
+    """
+    Iterate over the items of a paginated collection.
+
+    Each page is a JSON object whose ``results`` are the items in the page and
+    whose ``next`` member is the URL to the following page (or ``null`` in
+    the last page).
+
+    Pages are requested lazily, as the items in the preceding page are
+    consumed. When ``prefetched_page_count`` is greater than zero, pages are
+    instead requested from a background thread which stays up to that many
+    pages ahead of the caller.
+
+    :param connection: The connection to the API
+    :param str url: The URL or URL path to the first page
+    :param dict query_string_args: The query string arguments for the first
+        page
+    :param int prefetched_page_count: The maximum number of pages requested
+        ahead of the page being consumed
+
+    :return: An iterator of the items in the collection
+
+    """
+    pages = _iter_pages(connection, url, query_string_args)
+    if prefetched_page_count:
+        pages = _prefetch_pages(pages, prefetched_page_count)
+
+    for page in pages:
+        for item in page[_PAGE_ITEMS_KEY]:
+            yield item
+
+
+def _iter_pages(connection, url, query_string_args):
+    while url:
+        response = connection.send_get_request(url, query_string_args)
+        page = response.json()
+        yield page
+
+        url = page.get(_NEXT_PAGE_URL_KEY)
+        # The URL to the next page already contains the query string
+        query_string_args = None
+
+
+def _prefetch_pages(pages, prefetched_page_count):
+    page_queue = Queue(prefetched_page_count)
+    is_consumer_gone = Event()
+
+    def put_in_queue(item):
+        while not is_consumer_gone.is_set():
+            try:
+                page_queue.put(item, timeout=_PAGE_QUEUE_POLL_INTERVAL)
+            except Full:
+                pass
+            else:
+                break
+
+    def fetch_pages():
+        try:
+            for page in pages:
+                put_in_queue(_PageFetchOutcome(page=page))
+                if is_consumer_gone.is_set():
+                    break
+        except Exception as exc:
+            put_in_queue(_PageFetchOutcome(exception=exc))
+        else:
+            put_in_queue(_PageFetchOutcome(is_last=True))
+
+    page_fetcher = Thread(target=fetch_pages, daemon=True)
+    page_fetcher.start()
+
+    try:
+        while True:
+            page_fetch_outcome = page_queue.get()
+            if page_fetch_outcome.exception:
+                raise page_fetch_outcome.exception
+            if page_fetch_outcome.is_last:
+                break
+            yield page_fetch_outcome.page
+    finally:
+        is_consumer_gone.set()
+
+
+class _PageFetchOutcome(object):
+
+    def __init__(self, page=None, exception=None, is_last=False):
+        super(_PageFetchOutcome, self).__init__()
+
+        self.page = page
+        self.exception = exception
+        self.is_last = is_last
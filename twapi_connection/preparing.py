@@ -0,0 +1,164 @@
+##############################################################################
+#
+# Copyright (c) 2016, 2degrees Limited.
+# All Rights Reserved.
+#
+# This file is part of twapi-connection
+# <https://github.com/2degrees/twapi-connection>, which is subject to the
+# provisions of the BSD at
+# <http://dev.2degreesnetwork.com/p/2degrees-license.html>. A copy of the
+# license should accompany this distribution. THIS SOFTWARE IS PROVIDED "AS IS"
+# AND ANY AND ALL EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT
+# NOT LIMITED TO, THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST
+# INFRINGEMENT, AND FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""
+Preparation of requests from cached templates.
+
+:meth:`requests.Session.request` builds each request from scratch: it merges
+the settings of the session into it and, when the session trusts the
+environment, looks up the proxies and the ``.netrc`` file for its URL. The
+outcome only depends on the method and the URL, so it can be worked out once
+and reused.
+
+"""
+
+from collections import OrderedDict
+from threading import Lock
+
+from requests.cookies import RequestsCookieJar
+from requests.models import PreparedRequest
+from requests.utils import get_netrc_auth
+
+_DEFAULT_MAX_TEMPLATE_COUNT = 256
+
+
+class PreparedRequestFactory(object):
+    """
+    Factory of :class:`requests.PreparedRequest` objects equivalent to the
+    ones prepared by :meth:`requests.Session.request`, from templates cached
+    by method and URL.
+
+    The environment of the session is only read when a template is created,
+    so later changes to the proxies or the ``.netrc`` file are ignored.
+    Cookies are not supported, as the session is expected to ignore them.
+
+    It is safe to share an instance between threads.
+
+    :param session: The session whose settings are used
+    :type session: :class:`requests.Session`
+    :param auth: The authentication handler, as accepted by :mod:`requests`,
+        which is applied to every request
+    :param int max_template_count: The maximum number of templates kept, the
+        least recently used ones being discarded first
+
+    """
+
+    def __init__(
+        self,
+        session,
+        auth,
+        max_template_count=_DEFAULT_MAX_TEMPLATE_COUNT,
+        ):
+        super(PreparedRequestFactory, self).__init__()
+
+        self._session = session
+        self._authentication_handler = auth
+        self._max_template_count = max_template_count
+
+        self._lock = Lock()
+        self._templates = OrderedDict()
+
+    def make_prepared_request(
+        self,
+        method,
+        url,
+        query_string_args=None,
+        headers=None,
+        body=None,
+        ):
+        """
+        Return the request prepared and the keyword arguments with which it
+        should be passed to :meth:`requests.Session.send`.
+
+        """
+        template, authentication_handler, send_kwargs = \
+            self._get_template(method, url)
+
+        prepared_request = template.copy()
+        # The authentication handler may register hooks, which must not leak
+        # into the template
+        prepared_request.hooks = {
+            event: list(hooks) for event, hooks in template.hooks.items()
+            }
+        if query_string_args:
+            prepared_request.url = \
+                _add_query_string(template.url, query_string_args)
+        if headers:
+            prepared_request.headers.update(headers)
+        prepared_request.prepare_body(body, None)
+        prepared_request.prepare_auth(authentication_handler)
+
+        return prepared_request, dict(send_kwargs)
+
+    def get_template_count(self):
+        with self._lock:
+            template_count = len(self._templates)
+        return template_count
+
+    def _get_template(self, method, url):
+        template_key = (method, url)
+        with self._lock:
+            template = self._templates.get(template_key)
+            if template:
+                self._templates.move_to_end(template_key)
+        if template:
+            return template
+
+        # Concurrent requests may create the same template, which is harmless
+        template = self._make_template(method, url)
+        with self._lock:
+            self._templates[template_key] = template
+            while self._max_template_count < len(self._templates):
+                self._templates.popitem(last=False)
+        return template
+
+    def _make_template(self, method, url):
+        session = self._session
+
+        prepared_request = PreparedRequest()
+        prepared_request.prepare_method(method)
+        prepared_request.prepare_url(url, None)
+        prepared_request.prepare_headers(session.headers)
+        # Redirects are followed with the cookies of the prepared request,
+        # which are copied along with the template
+        prepared_request.prepare_cookies(RequestsCookieJar())
+        prepared_request.prepare_hooks(session.hooks)
+
+        authentication_handler = self._authentication_handler or session.auth
+        if not authentication_handler and session.trust_env:
+            authentication_handler = get_netrc_auth(url)
+
+        send_kwargs = session.merge_environment_settings(
+            prepared_request.url,
+            {},
+            None,
+            None,
+            None,
+            )
+        # The stream setting is given with each request
+        del send_kwargs['stream']
+
+        return prepared_request, authentication_handler, send_kwargs
+
+
+def _add_query_string(url, query_string_args):
+    query_string = PreparedRequest._encode_params(query_string_args)
+    if not query_string:
+        return url
+    if '?' in url:
+        url = '{}&{}'.format(url, query_string)
+    else:
+        url = '{}?{}'.format(url, query_string)
+    return url
@@ -0,0 +1,172 @@
+##############################################################################
+#
+# Copyright (c) 2016, 2degrees Limited.
+# All Rights Reserved.
+#
+# This file is part of twapi-connection
+# <https://github.com/2degrees/twapi-connection>, which is subject to the
+# provisions of the BSD at
+# <http://dev.2degreesnetwork.com/p/2degrees-license.html>. A copy of the
+# license should accompany this distribution. THIS SOFTWARE IS PROVIDED "AS IS"
+# AND ANY AND ALL EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT
+# NOT LIMITED TO, THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST
+# INFRINGEMENT, AND FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+
+from asyncio import sleep as async_sleep
+from threading import Lock
+from time import monotonic
+from time import sleep
+from time import time
+
+
+_REMAINING_REQUEST_COUNT_HEADER_NAMES = (
+    'RateLimit-Remaining',
+    'X-RateLimit-Remaining',
+    )
+
+_RESET_HEADER_NAMES = ('RateLimit-Reset', 'X-RateLimit-Reset')
+
+# Reset header values above this are taken to be Unix timestamps rather than
+# a number of seconds
+_MIN_RESET_TIMESTAMP = 10 ** 9
+
+
+class TokenBucketRateLimiter(object):
+    """
+    Token bucket limiting the rate at which requests are sent.
+
+    A single instance can be shared by any number of threads and coroutines.
+    Each acquisition reserves the next token available, so callers are
+    served in the order in which they acquire.
+
+    The rate can be lowered at runtime from the rate limit headers in the
+    responses of the API (i.e., ``RateLimit-Remaining`` and
+    ``RateLimit-Reset``, optionally with the ``X-`` prefix): The remaining
+    requests are then spread evenly until the reset, after which the
+    configured rate applies again.
+
+    :param float rate: The maximum number of requests per second
+    :param int burst: The maximum number of requests that can be sent at once
+        after a period of inactivity
+
+    """
+
+    def __init__(self, rate, burst=1):
+        super(TokenBucketRateLimiter, self).__init__()
+
+        self._configured_rate = rate
+        self._burst = burst
+
+        self._lock = Lock()
+        self._rate = rate
+        self._adapted_rate_expiry_time = None
+        self._token_count = burst
+        self._last_refill_time = monotonic()
+
+    def acquire(self, timeout=None):
+        """
+        Block until a request can be sent.
+
+        :param float timeout: The maximum number of seconds to wait, if any
+        :return: Whether a request can be sent, which is only false if it
+            could not be sent within ``timeout`` seconds. No time is then
+            spent waiting, and the rate is unaffected.
+
+        """
+        wait_time = self._reserve_token(timeout)
+        if wait_time is None:
+            return False
+        if wait_time:
+            sleep(wait_time)
+        return True
+
+    async def acquire_async(self):
+        """Wait until a request can be sent, without blocking the loop."""
+        wait_time = self._reserve_token()
+        if wait_time:
+            await async_sleep(wait_time)
+
+    def get_rate(self):
+        """Return the current maximum number of requests per second."""
+        with self._lock:
+            self._refill(monotonic())
+            return self._rate
+
+    def update_from_response(self, response):
+        """
+        Adapt the rate to the rate limit headers in ``response``, if any.
+
+        The rate never exceeds the one configured, so that clients sharing the
+        same quota do not compete for it.
+
+        """
+        remaining_request_count = _get_numeric_header_value(
+            response.headers,
+            _REMAINING_REQUEST_COUNT_HEADER_NAMES,
+            )
+        reset_header_value = \
+            _get_numeric_header_value(response.headers, _RESET_HEADER_NAMES)
+        if remaining_request_count is None or reset_header_value is None:
+            return
+
+        if _MIN_RESET_TIMESTAMP < reset_header_value:
+            reset_delay = reset_header_value - time()
+        else:
+            reset_delay = reset_header_value
+
+        with self._lock:
+            now = monotonic()
+            self._refill(now)
+            self._token_count = min(self._token_count, remaining_request_count)
+            if 0 < reset_delay:
+                # When no requests remain, the next token becomes available at
+                # the reset
+                adapted_rate = max(remaining_request_count, 1) / reset_delay
+                self._rate = min(self._configured_rate, adapted_rate)
+                self._adapted_rate_expiry_time = now + reset_delay
+
+    def _reserve_token(self, timeout=None):
+        with self._lock:
+            self._refill(monotonic())
+            token_count = self._token_count - 1
+            if 0 <= token_count:
+                wait_time = 0
+            else:
+                wait_time = -token_count / self._rate
+            if timeout is not None and timeout < wait_time:
+                return None
+            self._token_count = token_count
+        return wait_time
+
+    def _refill(self, now):
+        adapted_rate_expiry_time = self._adapted_rate_expiry_time
+        if adapted_rate_expiry_time is not None and \
+                adapted_rate_expiry_time <= now:
+            self._add_tokens(adapted_rate_expiry_time)
+            self._rate = self._configured_rate
+            self._adapted_rate_expiry_time = None
+        self._add_tokens(now)
+
+    def _add_tokens(self, now):
+        if now <= self._last_refill_time:
+            return
+
+        elapsed_time = now - self._last_refill_time
+        self._token_count = min(
+            self._burst,
+            self._token_count + elapsed_time * self._rate,
+            )
+        self._last_refill_time = now
+
+
+def _get_numeric_header_value(headers, header_names):
+    for header_name in header_names:
+        header_value = headers.get(header_name)
+        if header_value is not None:
+            try:
+                return float(header_value)
+            except ValueError:
+                return None
+    return None
@@ -0,0 +1,200 @@
+##############################################################################
+#
+# Copyright (c) 2016, 2degrees Limited.
+# All Rights Reserved.
+#
+# This file is part of twapi-connection
+# <https://github.com/2degrees/twapi-connection>, which is subject to the
+# provisions of the BSD at
+# <http://dev.2degreesnetwork.com/p/2degrees-license.html>. A copy of the
+# license should accompany this distribution. THIS SOFTWARE IS PROVIDED "AS IS"
+# AND ANY AND ALL EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT
+# NOT LIMITED TO, THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST
+# INFRINGEMENT, AND FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""
+Caching of the resolution of host names.
+
+Each new connection resolves the host name of the API through the system
+resolver, which can take a few milliseconds without a caching resolver on
+the host.
+
+"""
+
+from ipaddress import ip_address
+from socket import SOCK_STREAM
+from socket import gaierror
+from socket import getaddrinfo
+from threading import Lock
+from time import monotonic
+
+from pyrecord import Record
+
+
+DNSCacheStatistics = Record.create_type(
+    'DNSCacheStatistics',
+    'hit_count',
+    'negative_hit_count',
+    'miss_count',
+    )
+"""
+Number of resolutions served from the cache (of which, failures served from
+the cache) and of those done by the resolver.
+
+"""
+
+
+_DEFAULT_TTL = 60
+
+_DEFAULT_NEGATIVE_TTL = 5
+
+
+class DNSCache(object):
+    """
+    Cache of the addresses which host names resolve to.
+
+    Addresses are cached for ``ttl`` seconds, regardless of the TTL of the
+    DNS records, which the system resolver does not report. Failures to
+    resolve a host name are cached for ``negative_ttl`` seconds, so that a
+    host name which does not resolve is not looked up by every request.
+
+    When a host name resolves to several addresses, each resolution returns
+    them in a different order, so that connections are spread across them
+    while the next addresses remain available if one is unreachable. IP
+    addresses are passed through without being cached.
+
+    It is safe to share an instance between threads and connections.
+
+    :param ttl: The number of seconds during which addresses are reused
+    :param negative_ttl: The number of seconds during which failures are
+        reused
+    :param resolver: The callable resolving host names, with the signature
+        of :func:`socket.getaddrinfo`
+
+    """
+
+    def __init__(
+        self,
+        ttl=_DEFAULT_TTL,
+        negative_ttl=_DEFAULT_NEGATIVE_TTL,
+        resolver=getaddrinfo,
+        ):
+        super(DNSCache, self).__init__()
+
+        self._ttl = ttl
+        self._negative_ttl = negative_ttl
+        self._resolver = resolver
+
+        self._lock = Lock()
+        self._cache_entries = {}
+        self._hit_count = 0
+        self._negative_hit_count = 0
+        self._miss_count = 0
+
+    def resolve(self, host, port, family=0, type=SOCK_STREAM):
+        """
+        Return the addresses of ``host``, as returned by
+        :func:`socket.getaddrinfo`.
+
+        :raises socket.gaierror: If ``host`` cannot be resolved
+
+        """
+        if _is_ip_address(host):
+            return self._resolver(host, port, family, type)
+
+        cache_key = (host, port, family, type)
+        with self._lock:
+            cache_entry = self._cache_entries.get(cache_key)
+            if cache_entry and cache_entry.is_expired():
+                cache_entry = None
+
+            if cache_entry and cache_entry.error_args is not None:
+                self._hit_count += 1
+                self._negative_hit_count += 1
+            elif cache_entry:
+                self._hit_count += 1
+                return cache_entry.get_rotated_addresses()
+            else:
+                self._miss_count += 1
+
+        if cache_entry:
+            raise gaierror(*cache_entry.error_args)
+
+        try:
+            addresses = self._resolver(host, port, family, type)
+        except gaierror as exc:
+            cache_entry = _DNSCacheEntry([], exc.args, self._negative_ttl)
+            with self._lock:
+                self._cache_entries[cache_key] = cache_entry
+            raise
+
+        cache_entry = _DNSCacheEntry(addresses, None, self._ttl)
+        with self._lock:
+            self._cache_entries[cache_key] = cache_entry
+            addresses = cache_entry.get_rotated_addresses()
+        return addresses
+
+    def clear(self):
+        with self._lock:
+            self._cache_entries.clear()
+
+    def get_statistics(self):
+        """
+        :rtype: :data:`DNSCacheStatistics`
+
+        """
+        with self._lock:
+            statistics = DNSCacheStatistics(
+                self._hit_count,
+                self._negative_hit_count,
+                self._miss_count,
+                )
+        return statistics
+
+    def get_hit_rate(self):
+        """
+        Return the ratio of resolutions served from the cache, or ``None`` if
+        no host name has been resolved.
+
+        """
+        statistics = self.get_statistics()
+        resolution_count = statistics.hit_count + statistics.miss_count
+        if not resolution_count:
+            return None
+        return statistics.hit_count / resolution_count
+
+
+class _DNSCacheEntry(object):
+
+    def __init__(self, addresses, error_args, ttl):
+        super(_DNSCacheEntry, self).__init__()
+
+        self.addresses = list(addresses)
+        self.error_args = error_args
+        self._expiry_time = monotonic() + ttl
+        self._rotation_count = 0
+
+    def is_expired(self):
+        return self._expiry_time <= monotonic()
+
+    def get_rotated_addresses(self):
+        # Not thread-safe: The cache serializes the calls
+        if not self.addresses:
+            return []
+
+        rotation_offset = self._rotation_count % len(self.addresses)
+        self._rotation_count += 1
+        rotated_addresses = \
+            self.addresses[rotation_offset:] + self.addresses[:rotation_offset]
+        return rotated_addresses
+
+
+def _is_ip_address(host):
+    try:
+        ip_address(host)
+    except ValueError:
+        is_ip_address = False
+    else:
+        is_ip_address = True
+    return is_ip_address
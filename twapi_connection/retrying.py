@@ -0,0 +1,150 @@
+##############################################################################
+#
+# Copyright (c) 2016, 2degrees Limited.
+# All Rights Reserved.
+#
+# This file is part of twapi-connection
+# <https://github.com/2degrees/twapi-connection>, which is subject to the
+# provisions of the BSD at
+# <http://dev.2degreesnetwork.com/p/2degrees-license.html>. A copy of the
+# license should accompany this distribution. THIS SOFTWARE IS PROVIDED "AS IS"
+# AND ANY AND ALL EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT
+# NOT LIMITED TO, THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST
+# INFRINGEMENT, AND FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+
+from email.utils import parsedate_to_datetime
+from random import uniform
+from time import time
+
+
+_DEFAULT_MAX_ATTEMPT_COUNT = 3
+
+_DEFAULT_RETRIABLE_STATUS_CODES = frozenset([429, 502, 503, 504])
+
+_IDEMPOTENT_HTTP_METHODS = frozenset(['GET', 'HEAD', 'PUT', 'DELETE'])
+
+_DEFAULT_BACKOFF_FACTOR = 0.5
+
+_DEFAULT_MAX_BACKOFF = 30
+
+
+class RetryPolicy(object):
+    """
+    Policy for retrying requests whose responses have a transient error status.
+
+    The delay before each retry is chosen at random between zero and an
+    exponentially growing cap (i.e., "full jitter"), unless the response
+    specifies a ``Retry-After`` header, in which case that delay is honoured.
+
+    :param int max_attempt_count: The maximum number of times a request is
+        sent
+    :param retriable_status_codes: The response status codes that warrant
+        a retry
+    :param retriable_http_methods: The HTTP methods whose requests may be
+        retried. Only idempotent methods are retried by default; non-idempotent
+        methods like ``POST`` must be added explicitly.
+    :param float backoff_factor: The cap of the delay before the first retry,
+        in seconds, which doubles for each subsequent retry
+    :param float max_backoff: The maximum delay before a retry, in seconds.
+        Requests are not retried if the response asks to wait longer.
+    :param dict max_attempt_count_by_status_code: The maximum number of
+        attempts for specific status codes, overriding ``max_attempt_count``
+    :param dict max_attempt_count_by_http_method: The maximum number of
+        attempts for specific HTTP methods, overriding ``max_attempt_count``
+
+    When both a status code and an HTTP method have a specific maximum number
+    of attempts, the lowest one is used.
+
+    """
+
+    def __init__(
+        self,
+        max_attempt_count=_DEFAULT_MAX_ATTEMPT_COUNT,
+        retriable_status_codes=_DEFAULT_RETRIABLE_STATUS_CODES,
+        retriable_http_methods=_IDEMPOTENT_HTTP_METHODS,
+        backoff_factor=_DEFAULT_BACKOFF_FACTOR,
+        max_backoff=_DEFAULT_MAX_BACKOFF,
+        max_attempt_count_by_status_code=None,
+        max_attempt_count_by_http_method=None,
+        ):
+        super(RetryPolicy, self).__init__()
+
+        self._max_attempt_count = max_attempt_count
+        self._retriable_status_codes = frozenset(retriable_status_codes)
+        self._retriable_http_methods = frozenset(retriable_http_methods)
+        self._backoff_factor = backoff_factor
+        self._max_backoff = max_backoff
+        self._max_attempt_count_by_status_code = \
+            max_attempt_count_by_status_code or {}
+        self._max_attempt_count_by_http_method = \
+            max_attempt_count_by_http_method or {}
+
+    def get_retry_delay(self, http_method, response, attempt_count):
+        """
+        Return the number of seconds to wait before retrying the request that
+        got ``response``, or ``None`` if it must not be retried.
+
+        :param str http_method: The HTTP method of the request
+        :param response: The response to the latest attempt
+        :param int attempt_count: The number of times the request was sent
+
+        """
+        status_code = response.status_code
+        max_attempt_count = \
+            self._get_max_attempt_count(http_method, status_code)
+        is_retriable = \
+            status_code in self._retriable_status_codes and \
+            http_method in self._retriable_http_methods and \
+            attempt_count < max_attempt_count
+        if not is_retriable:
+            return None
+
+        retry_after = get_retry_after(response)
+        if retry_after is None:
+            backoff_cap = min(
+                self._max_backoff,
+                self._backoff_factor * 2 ** (attempt_count - 1),
+                )
+            retry_delay = uniform(0, backoff_cap)
+        elif retry_after <= self._max_backoff:
+            retry_delay = retry_after
+        else:
+            retry_delay = None
+        return retry_delay
+
+    def _get_max_attempt_count(self, http_method, status_code):
+        max_attempt_counts = []
+        if status_code in self._max_attempt_count_by_status_code:
+            max_attempt_counts.append(
+                self._max_attempt_count_by_status_code[status_code],
+                )
+        if http_method in self._max_attempt_count_by_http_method:
+            max_attempt_counts.append(
+                self._max_attempt_count_by_http_method[http_method],
+                )
+        return min(max_attempt_counts or [self._max_attempt_count])
+
+
+def get_retry_after(response):
+    """
+    Return the number of seconds in the ``Retry-After`` header of
+    ``response``, or ``None`` if it is absent or invalid.
+
+    """
+    retry_after_header_value = response.headers.get('Retry-After')
+    if not retry_after_header_value:
+        return None
+
+    try:
+        retry_after = float(retry_after_header_value)
+    except ValueError:
+        try:
+            retry_after_datetime = \
+                parsedate_to_datetime(retry_after_header_value)
+        except (TypeError, ValueError):
+            return None
+        retry_after = retry_after_datetime.timestamp() - time()
+
+    return max(0, retry_after)
@@ -0,0 +1,362 @@
+##############################################################################
+#
+# Copyright (c) 2016, 2degrees Limited.
+# All Rights Reserved.
+#
+# This file is part of twapi-connection
+# <https://github.com/2degrees/twapi-connection>, which is subject to the
+# provisions of the BSD at
+# <http://dev.2degreesnetwork.com/p/2degrees-license.html>. A copy of the
+# license should accompany this distribution. THIS SOFTWARE IS PROVIDED "AS IS"
+# AND ANY AND ALL EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT
+# NOT LIMITED TO, THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST
+# INFRINGEMENT, AND FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+
+from codecs import getincrementaldecoder
+from collections.abc import Iterator
+from json import JSONDecoder
+
+from twapi_connection.exc import ResponseBodyTooLargeError
+from twapi_connection.exc import UnsupportedResponseError
+
+
+_DEFAULT_CHUNK_SIZE = 64 * 1024
+
+_JSON_WHITESPACE = ' \t\n\r'
+
+_JSON_VALUE_DELIMITERS = _JSON_WHITESPACE + ',:]}'
+
+_JSON_DECODER = JSONDecoder()
+
+
+def iter_response_json_items(response, chunk_size=_DEFAULT_CHUNK_SIZE):
+    """
+    Iterate over the items in the JSON array or object in the body of
+    ``response``, as its content is read from the socket.
+
+    The response is closed once the items are exhausted, when decoding them
+    fails, or when the iterator is closed (even before it is advanced).
+
+    """
+    return _ResponseJSONItemIterator(response, chunk_size)
+
+
+class _ResponseJSONItemIterator(Iterator):
+
+    def __init__(self, response, chunk_size):
+        super(_ResponseJSONItemIterator, self).__init__()
+
+        self._response = response
+        self._items = iter_json_items(
+            response.iter_content(chunk_size),
+            response.encoding or 'utf-8',
+            )
+
+    def __next__(self):
+        try:
+            return next(self._items)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        self._items.close()
+        self._response.close()
+
+
+def write_response_body(
+    response,
+    destination,
+    chunk_size=_DEFAULT_CHUNK_SIZE,
+    max_size=None,
+    ):
+    """
+    Write the body of ``response`` to ``destination`` as it is read from the
+    socket, and close the response.
+
+    If the ``Content-Length`` of an uncompressed body is already larger than
+    ``max_size``, nothing is written.
+
+    :return: The number of bytes written
+    :raises twapi_connection.exc.ResponseBodyTooLargeError: If the body is
+        larger than ``max_size``
+
+    """
+    try:
+        content_length = response.headers.get('Content-Length')
+        is_content_length_exceeded = \
+            max_size is not None and \
+            content_length is not None and \
+            'Content-Encoding' not in response.headers and \
+            max_size < int(content_length)
+        if is_content_length_exceeded:
+            raise ResponseBodyTooLargeError(max_size)
+
+        chunks = response.iter_content(chunk_size)
+        byte_count = write_chunks(chunks, destination, max_size)
+    finally:
+        response.close()
+    return byte_count
+
+
+def write_chunks(chunks, destination, max_size=None):
+    """
+    Write ``chunks`` of bytes to ``destination``.
+
+    :param chunks: An iterable of bytes
+    :param destination: A file-like object, a callable taking each chunk, or
+        a writable buffer (e.g., a :class:`bytearray`) which is filled from
+        its start
+    :param int max_size: The maximum number of bytes to be written, which
+        defaults to the size of ``destination`` if it is a buffer
+    :return: The number of bytes written
+    :raises twapi_connection.exc.ResponseBodyTooLargeError: If there are
+        more than ``max_size`` bytes, in which case the chunk which would
+        exceed it is not written
+
+    """
+    if hasattr(destination, 'write'):
+        write_chunk = destination.write
+    elif callable(destination):
+        write_chunk = destination
+    else:
+        buffer = memoryview(destination).cast('B')
+        if max_size is None or len(buffer) < max_size:
+            max_size = len(buffer)
+        write_chunk = None
+
+    byte_count = 0
+    for chunk in chunks:
+        chunk_byte_count = len(chunk)
+        if max_size is not None and max_size < byte_count + chunk_byte_count:
+            raise ResponseBodyTooLargeError(max_size)
+
+        if write_chunk:
+            write_chunk(chunk)
+        else:
+            buffer[byte_count:byte_count + chunk_byte_count] = chunk
+        byte_count += chunk_byte_count
+    return byte_count
+
+
+def iter_json_items(chunks, encoding='utf-8'):
+    """
+    Iterate over the items in a JSON array or object serialized in ``chunks``.
+
+    Only one item is decoded at a time, so the memory used is bounded by the
+    size of the largest item rather than that of the whole serialization.
+
+    :param chunks: An iterable of the serialization in bytes
+    :param str encoding: The encoding of the serialization
+    :return: An iterator of the elements in the array, or of the
+        ``(key, value)`` pairs in the object
+    :raises twapi_connection.exc.UnsupportedResponseError: If the
+        serialization is not a valid JSON array or object
+
+    """
+    reader = _JSONReader(chunks, encoding)
+
+    opening_character = reader.read_token()
+    if opening_character == '[':
+        closing_character = ']'
+        is_object = False
+    elif opening_character == '{':
+        closing_character = '}'
+        is_object = True
+    else:
+        raise UnsupportedResponseError(
+            'Expected a JSON array or object in the response',
+            )
+
+    is_first_item = True
+    while True:
+        token = reader.peek_token()
+        if token == closing_character:
+            reader.read_token()
+            break
+        if not is_first_item:
+            reader.require_token(',')
+
+        if is_object:
+            key = reader.read_value()
+            reader.require_token(':')
+            value = reader.read_value()
+            yield key, value
+        else:
+            yield reader.read_value()
+
+        is_first_item = False
+
+    reader.require_end()
+
+
+def iter_json_array_serialization(
+    items,
+    json_codec,
+    chunk_size=_DEFAULT_CHUNK_SIZE,
+    ):
+    """
+    Iterate over the chunks of the serialization of ``items`` as a JSON array.
+
+    Items are serialized one at a time and buffered into chunks of about
+    ``chunk_size`` bytes, so the whole serialization is never in memory.
+
+    """
+    chunk = bytearray(b'[')
+    is_first_item = True
+    for item in items:
+        if not is_first_item:
+            chunk += b','
+        chunk += json_codec.serialize(item)
+        is_first_item = False
+
+        if chunk_size <= len(chunk):
+            yield bytes(chunk)
+            chunk = bytearray()
+
+    chunk += b']'
+    yield bytes(chunk)
+
+
+class BufferReader(object):
+    """
+    File-like reader of a bytes-like object (e.g., a :class:`memoryview`),
+    which :mod:`requests` sends chunk by chunk instead of copying it whole.
+
+    """
+
+    def __init__(self, buffer):
+        super(BufferReader, self).__init__()
+
+        self._buffer = memoryview(buffer).cast('B')
+        self._position = 0
+
+    def __len__(self):
+        # The length of the remaining bytes, as expected by requests
+        return len(self._buffer) - self._position
+
+    def read(self, size=-1):
+        start_position = self._position
+        if size is None or size < 0:
+            end_position = len(self._buffer)
+        else:
+            end_position = min(start_position + size, len(self._buffer))
+        self._position = end_position
+        return self._buffer[start_position:end_position].tobytes()
+
+
+def iter_deserialization_items(body_deserialization):
+    """
+    Iterate over the items in ``body_deserialization`` like
+    :func:`iter_json_items` does over its serialization.
+
+    """
+    if isinstance(body_deserialization, dict):
+        items = body_deserialization.items()
+    else:
+        items = body_deserialization
+    return iter(items)
+
+
+class _JSONReader(object):
+
+    def __init__(self, chunks, encoding):
+        super(_JSONReader, self).__init__()
+
+        self._chunks = iter(chunks)
+        self._decoder = getincrementaldecoder(encoding)()
+        self._buffer = ''
+        self._position = 0
+        self._is_exhausted = False
+
+    def peek_token(self):
+        self._skip_whitespace()
+        if self._position == len(self._buffer):
+            raise UnsupportedResponseError('Truncated JSON in the response')
+        return self._buffer[self._position]
+
+    def read_token(self):
+        token = self.peek_token()
+        self._position += 1
+        return token
+
+    def require_token(self, expected_token):
+        token = self.read_token()
+        if token != expected_token:
+            raise UnsupportedResponseError(
+                'Expected {!r} in the JSON response, got {!r}'.format(
+                    expected_token,
+                    token,
+                    ),
+                )
+
+    def read_value(self):
+        self._skip_whitespace()
+        while True:
+            try:
+                value, end_position = \
+                    _JSON_DECODER.raw_decode(self._buffer, self._position)
+            except ValueError:
+                end_position = None
+
+            # A value which is not followed by a delimiter (e.g., the "1" in
+            # "1.5") may continue in the next chunk
+            is_value_complete = end_position is not None and (
+                self._is_exhausted or (
+                    end_position < len(self._buffer) and
+                    self._buffer[end_position] in _JSON_VALUE_DELIMITERS
+                    )
+                )
+            if is_value_complete:
+                break
+            if self._is_exhausted:
+                raise UnsupportedResponseError('Invalid JSON in the response')
+            # The value is parsed again from its start, so the text to parse
+            # is doubled each time to keep the total work linear in its size
+            self._read_chunks(2 * (len(self._buffer) - self._position))
+
+        self._position = end_position
+        return value
+
+    def require_end(self):
+        self._skip_whitespace()
+        if self._position != len(self._buffer):
+            raise UnsupportedResponseError(
+                'Unexpected data after the JSON in the response',
+                )
+
+    def _skip_whitespace(self):
+        while True:
+            buffer_length = len(self._buffer)
+            while self._position < buffer_length and \
+                    self._buffer[self._position] in _JSON_WHITESPACE:
+                self._position += 1
+            if self._position < buffer_length or self._is_exhausted:
+                break
+            self._read_chunks(1)
+
+    def _read_chunks(self, min_size):
+        """
+        Read chunks until there are at least ``min_size`` characters left to
+        parse, or until the serialization is exhausted.
+
+        """
+        # Discard what has been consumed so far
+        decoded_chunks = [self._buffer[self._position:]]
+        decoded_size = len(decoded_chunks[0])
+        self._position = 0
+
+        while decoded_size < min_size:
+            try:
+                chunk = next(self._chunks)
+            except StopIteration:
+                decoded_chunks.append(self._decoder.decode(b'', final=True))
+                self._is_exhausted = True
+                break
+            decoded_chunk = self._decoder.decode(chunk)
+            decoded_chunks.append(decoded_chunk)
+            decoded_size += len(decoded_chunk)
+
+        self._buffer = ''.join(decoded_chunks)
@@ -14,24 +14,15 @@
 #
 ##############################################################################
 
-from pyrecord import Record
+from collections.abc import Iterator
 
-
-APICall = Record.create_type(
-    'APICall',
-    'url',
-    'http_method',
-    'query_string_args',
-    'request_body_deserialization',
-    query_string_args=None,
-    request_body_deserialization=None,
-    )
-
-
-SuccessfulAPICall = APICall.extend_type('SuccessfulAPICall', 'response')
-
-
-UnsuccessfulAPICall = APICall.extend_type('UnsuccessfulAPICall', 'exception')
+from twapi_connection.api_calls import APICall
+from twapi_connection.api_calls import SuccessfulAPICall
+from twapi_connection.api_calls import UnsuccessfulAPICall
+from twapi_connection.api_calls import get_api_call_outcome
+from twapi_connection.pagination import iter_paginated_items
+from twapi_connection.streaming import iter_deserialization_items
+from twapi_connection.streaming import write_chunks
 
 
 class MockConnection(object):
@@ -60,29 +51,117 @@ class MockConnection(object):
             '{} more requests were expected'.format(pending_api_call_count)
         assert expected_api_call_count == self._request_count, error_message
 
-    def send_get_request(self, url, query_string_args=None):
-        return self._call_remote_method(url, 'GET', query_string_args)
+    def send_get_request(
+        self,
+        url,
+        query_string_args=None,
+        stream=False,
+        deadline=None,
+        ):
+        response = self._call_remote_method(url, 'GET', query_string_args)
+        if stream:
+            response = iter_deserialization_items(response.json())
+        return response
+
+    def send_download_request(
+        self,
+        url,
+        destination,
+        query_string_args=None,
+        chunk_size=None,
+        max_size=None,
+        deadline=None,
+        ):
+        """
+        Simulate :meth:`twapi_connection.Connection.send_download_request`
+
+        The body of the response must be simulated with bytes as its
+        deserialization.
 
-    def send_head_request(self, url, query_string_args=None):
+        """
+        response = self._call_remote_method(url, 'GET', query_string_args)
+        return write_chunks([response.json()], destination, max_size)
+
+    def send_head_request(self, url, query_string_args=None, deadline=None):
         return self._call_remote_method(url, 'HEAD', query_string_args)
 
-    def send_post_request(self, url, body_deserialization=None):
+    def send_post_request(
+        self,
+        url,
+        body_deserialization=None,
+        deadline=None,
+        ):
         return self._call_remote_method(
             url,
             'POST',
             request_body_deserialization=body_deserialization,
             )
 
-    def send_put_request(self, url, body_deserialization):
+    def send_put_request(self, url, body_deserialization, deadline=None):
         return self._call_remote_method(
             url,
             'PUT',
             request_body_deserialization=body_deserialization,
             )
 
-    def send_delete_request(self, url):
+    def send_delete_request(self, url, deadline=None):
         return self._call_remote_method(url, 'DELETE')
 
+    def iter_paginated_items(
+        self,
+        url,
+        query_string_args=None,
+        prefetched_page_count=None,
+        ):
+        """
+        Simulate :meth:`twapi_connection.Connection.iter_paginated_items`
+
+        Each page must be simulated with a ``GET`` API call, whose response
+        contains the URL to the next page. Pages are never prefetched, so
+        the pages requested are exactly the ones consumed.
+
+        """
+        return iter_paginated_items(self, url, query_string_args)
+
+    def send_requests(
+        self,
+        api_calls,
+        max_concurrency=None,
+        is_order_preserved=True,
+        ):
+        """
+        Simulate :meth:`twapi_connection.Connection.send_requests`
+
+        Requests are processed sequentially, so the outcomes are always in the
+        same order as ``api_calls``.
+
+        """
+        for api_call in api_calls:
+            yield get_api_call_outcome(api_call, self._send_request)
+
+    def warm_up(self, connection_count):
+        """
+        Simulate :meth:`twapi_connection.Connection.warm_up`
+
+        No API call is expected, and no connection is ever open.
+
+        """
+        return 0
+
+    def _send_request(
+        self,
+        http_method,
+        url,
+        query_string_args=None,
+        request_body_deserialization=None,
+        ):
+        return self._call_remote_method(
+            url,
+            http_method,
+            query_string_args,
+            request_body_deserialization,
+            )
+
     def _call_remote_method(
         self,
         url,
@@ -92,6 +171,10 @@ class MockConnection(object):
         ):
         self._require_enough_api_calls(url)
 
+        # Streamed bodies are compared with the items they contain
+        if isinstance(request_body_deserialization, Iterator):
+            request_body_deserialization = list(request_body_deserialization)
+
         expected_api_call = self._expected_api_calls[self._request_count]
 
         _assert_request_matches_api_call(
@@ -128,6 +211,10 @@ class MockResponse:
         self._body_deserialization = body_deserialization
         self.headers = headers or {}
 
+    @property
+    def body_deserialization(self):
+        return self._body_deserialization
+
     def json(self):
         return self._body_deserialization
 
@@ -0,0 +1,189 @@
+##############################################################################
+#
+# Copyright (c) 2016, 2degrees Limited.
+# All Rights Reserved.
+#
+# This file is part of twapi-connection
+# <https://github.com/2degrees/twapi-connection>, which is subject to the
+# provisions of the BSD at
+# <http://dev.2degreesnetwork.com/p/2degrees-license.html>. A copy of the
+# license should accompany this distribution. THIS SOFTWARE IS PROVIDED "AS IS"
+# AND ANY AND ALL EXPRESS OR IMPLIED WARRANTIES ARE DISCLAIMED, INCLUDING, BUT
+# NOT LIMITED TO, THE IMPLIED WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST
+# INFRINGEMENT, AND FITNESS FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""
+Time budgets of requests: the connect and read timeouts of each attempt, and
+the deadline of the whole call.
+
+"""
+
+from time import monotonic
+
+from requests.exceptions import ConnectionError as RequestsConnectionError
+from requests.exceptions import ConnectTimeout as RequestsConnectTimeout
+from requests.exceptions import ReadTimeout as RequestsReadTimeout
+from urllib3.exceptions import MaxRetryError
+from urllib3.exceptions import ReadTimeoutError as URLLib3ReadTimeoutError
+from urllib3.util.retry import Retry
+from urllib3.util.timeout import Timeout
+
+from twapi_connection.exc import ConnectTimeoutError
+from twapi_connection.exc import DeadlineExceededError
+from twapi_connection.exc import ReadTimeoutError
+
+# A timeout of zero would make the socket non-blocking instead of failing
+_MIN_TIMEOUT = 0.001
+
+
+class Deadline(object):
+    """
+    The point in time by which a call must be complete.
+
+    :param duration: The number of seconds from now
+
+    """
+
+    def __init__(self, duration):
+        super(Deadline, self).__init__()
+
+        self._expiry_time = monotonic() + duration
+        self.is_last_timeout_clipped = False
+
+    def get_remaining_time(self):
+        return max(self._expiry_time - monotonic(), 0)
+
+    def has_expired(self):
+        return self._expiry_time <= monotonic()
+
+    def clip_timeout(self, timeout):
+        """
+        Return ``timeout`` (in seconds, or ``None`` for no timeout) reduced
+        to the time remaining, if it is shorter.
+
+        Whether the timeout was reduced is recorded, so that a timeout
+        occurring afterwards can be attributed to the deadline.
+
+        """
+        remaining_time = self.get_remaining_time()
+        self.is_last_timeout_clipped = \
+            timeout is None or remaining_time < timeout
+        if self.is_last_timeout_clipped:
+            timeout = max(remaining_time, _MIN_TIMEOUT)
+        return timeout
+
+
+class DeadlineTimeout(Timeout):
+    """
+    :class:`urllib3.util.Timeout` whose connect and read timeouts are
+    reduced to the time remaining before ``deadline``.
+
+    The time remaining is worked out whenever a connection is established or
+    a response is read, so the deadline also bounds the attempts retried by
+    :mod:`urllib3`.
+
+    :param connect: The connect timeout in seconds, if any
+    :param read: The read timeout in seconds, if any
+    :param deadline: The deadline of the call
+    :type deadline: :class:`Deadline`
+
+    """
+
+    def __init__(self, connect, read, deadline):
+        super(DeadlineTimeout, self).__init__(connect=connect, read=read)
+
+        self._deadline = deadline
+
+    @classmethod
+    def init_from_timeout(cls, timeout, deadline):
+        """
+        Return the :class:`DeadlineTimeout` for ``timeout``, as accepted by
+        :mod:`requests` (i.e., a number, a ``(connect, read)`` tuple or
+        ``None``).
+
+        """
+        if isinstance(timeout, tuple):
+            connect_timeout, read_timeout = timeout
+        else:
+            connect_timeout = read_timeout = timeout
+        return cls(connect_timeout, read_timeout, deadline)
+
+    def clone(self):
+        return self.__class__(self._connect, self._read, self._deadline)
+
+    def get_deadline(self):
+        return self._deadline
+
+    @property
+    def connect_timeout(self):
+        connect_timeout = super(DeadlineTimeout, self).connect_timeout
+        return self._deadline.clip_timeout(connect_timeout)
+
+    @property
+    def read_timeout(self):
+        read_timeout = super(DeadlineTimeout, self).read_timeout
+        return self._deadline.clip_timeout(read_timeout)
+
+
+class DeadlineRetry(Retry):
+    """
+    :class:`urllib3.util.Retry` which is exhausted once ``deadline`` has
+    passed, so that no attempt is made after the deadline.
+
+    The other arguments are those of :class:`urllib3.util.Retry`.
+
+    :param deadline: The deadline of the call, if any
+    :type deadline: :class:`Deadline`
+
+    """
+
+    def __init__(self, *args, deadline=None, **kwargs):
+        super(DeadlineRetry, self).__init__(*args, **kwargs)
+
+        self._deadline = deadline
+
+    def new(self, **kwargs):
+        kwargs.setdefault('deadline', self._deadline)
+        return super(DeadlineRetry, self).new(**kwargs)
+
+    def is_exhausted(self):
+        deadline = self._deadline
+        if deadline and deadline.has_expired():
+            return True
+        return super(DeadlineRetry, self).is_exhausted()
+
+
+def make_timeout_error(exception, deadline=None):
+    """
+    Return the exception to be raised instead of ``exception`` from
+    :mod:`requests`, if it was caused by a timeout, or ``None`` otherwise.
+
+    The timeout is attributed to ``deadline`` if the one that elapsed was
+    reduced to the time remaining before it.
+
+    """
+    if isinstance(exception, RequestsConnectTimeout):
+        timeout_error_class = ConnectTimeoutError
+    elif isinstance(exception, RequestsReadTimeout) or \
+            _is_read_timeout_connection_error(exception):
+        timeout_error_class = ReadTimeoutError
+    else:
+        return None
+
+    if deadline and deadline.is_last_timeout_clipped:
+        timeout_error_class = DeadlineExceededError
+    return timeout_error_class(*exception.args, request=exception.request)
+
+
+def _is_read_timeout_connection_error(exception):
+    # Read timeouts are reported as connection errors when they occur while
+    # reading the body, or once urllib3 runs out of retries
+    if not isinstance(exception, RequestsConnectionError) or \
+            not exception.args:
+        return False
+
+    cause = exception.args[0]
+    if isinstance(cause, MaxRetryError):
+        cause = cause.reason
+    return isinstance(cause, URLLib3ReadTimeoutError)